@@ -8,6 +8,8 @@ ORGANIZATIONS=
 
 DEBUG=
 
+ETL_STATE_DIR=
+
 
 ORG_TABLES=
 ORG_SELENIUM_ENABLED=
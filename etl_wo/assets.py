@@ -1,4 +1,6 @@
 import dagster as dg
+from etl_wo.common.arrow_io import ArrowIOManager
+from etl_wo.common.db_pool import DatabaseResource
 from etl_wo.jobs.kvazar import kvazar_job_eln, kvazar_assets, kvazar_job_emd, kvazar_job_recipes, kvazar_job_death, \
     kvazar_job_reference
 from etl_wo.jobs.job1 import job_talons, talons_assets
@@ -17,5 +19,6 @@ defs = dg.Definitions(
     assets=all_assets,
     jobs=[job_talons, kvazar_job_eln, kvazar_job_emd, kvazar_job_recipes, kvazar_job_death, kvazar_job_reference],
     schedules=[],
-    sensors=all_sensors
+    sensors=all_sensors,
+    resources={"db": DatabaseResource(), "io_manager": ArrowIOManager()}
 )
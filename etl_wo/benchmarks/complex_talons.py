@@ -0,0 +1,95 @@
+# benchmarks/complex_talons.py
+"""
+Определение комплексных талонов: векторное ядро (common/complex_talons) против прежнего цикла по groupby.
+
+Запуск:
+    python -m etl_wo.benchmarks.complex_talons --rows 1000000
+    python -m etl_wo.benchmarks.complex_talons --rows 1000000 --legacy-rows 1000000
+
+Генерируется журнал с парами (talon, source), часть которых повторяется (комплексные талоны), и пропусками
+в ключевых столбцах. Прежний цикл на миллионе строк работает минутами, поэтому по умолчанию он замеряется
+на первых --legacy-rows строках; на них же проверяется, что результаты ядра и цикла совпадают.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.common.complex_talons import COMPLEX_KEY, classify_complex
+
+
+def generate_journal(rows: int, complex_share: float = 0.1, seed: int = 0) -> pd.DataFrame:
+    """Журнал талонов: complex_share строк повторяют пару (talon, source) другой строки, 0.1% ключей пустые."""
+    rng = np.random.default_rng(seed)
+    talons = rng.permutation(rows).astype(str).astype(object)
+    repeated = rng.random(rows) < complex_share
+    talons[repeated] = talons[rng.integers(0, rows, int(repeated.sum()))]
+    df = pd.DataFrame({
+        "talon": talons,
+        "source": np.full(rows, "ОМС", dtype=object),
+        "status": rng.choice(["1", "2", "3"], rows).astype(object),
+        "amount": np.round(rng.random(rows) * 10000, 2).astype(str).astype(object),
+    })
+    df.loc[rng.random(rows) < 0.001, "talon"] = np.nan
+    return df
+
+
+def legacy_classify(df: pd.DataFrame) -> tuple:
+    """Прежняя реализация: цикл по группам groupby и разделение булевыми масками с .copy()."""
+    df["is_complex"] = False
+    grouped = df.groupby(COMPLEX_KEY)
+    for (talon, source), group in grouped:
+        if len(group) > 1:
+            df.loc[group.index, "is_complex"] = True
+    normal_df = df[df["is_complex"] == False].copy()
+    complex_df = df[df["is_complex"] == True].copy()
+    return df, normal_df, complex_df
+
+
+def measure(function, df: pd.DataFrame, repeat: int) -> tuple:
+    """Лучшее время из repeat запусков (каждый - на своей копии df) и результат последнего запуска."""
+    timings = []
+    for _ in range(repeat):
+        frame = df.copy()
+        started = time.perf_counter()
+        result = function(frame)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def run(rows: int, legacy_rows: int, repeat: int = 3) -> dict:
+    """Замеряет ядро на rows строках и цикл на первых legacy_rows строках, сверяя результаты."""
+    df = generate_journal(rows)
+    kernel_seconds, (_, normal_df, complex_df) = measure(classify_complex, df, repeat)
+    result = {"rows": rows, "complex_rows": len(complex_df), "kernel_seconds": round(kernel_seconds, 3)}
+
+    if legacy_rows:
+        sample = df.iloc[:legacy_rows].copy()
+        legacy_seconds, (legacy_df, _, _) = measure(legacy_classify, sample, 1)
+        kernel_sample_seconds, (kernel_df, _, _) = measure(classify_complex, sample, repeat)
+        if not np.array_equal(legacy_df["is_complex"].to_numpy(), kernel_df["is_complex"].to_numpy()):
+            raise AssertionError("Результаты ядра и прежнего цикла не совпадают")
+        result.update({"legacy_rows": len(sample), "legacy_seconds": round(legacy_seconds, 3),
+                       "kernel_sample_seconds": round(kernel_sample_seconds, 3)})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Определение комплексных талонов: ядро против цикла groupby")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--legacy-rows", type=int, default=100000,
+                        help="Строк для замера прежнего цикла (0 - не замерять)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    result = run(args.rows, min(args.legacy_rows, args.rows), args.repeat)
+    print(f"⏱️ Ядро: {result['rows']} строк, комплексных {result['complex_rows']}, {result['kernel_seconds']} с")
+    if "legacy_seconds" in result:
+        speedup = result["legacy_seconds"] / max(result["kernel_sample_seconds"], 1e-9)
+        print(f"⏱️ На {result['legacy_rows']} строках: цикл {result['legacy_seconds']} с, "
+              f"ядро {result['kernel_sample_seconds']} с (в {speedup:.0f} раз быстрее), результаты совпадают")
+
+
+if __name__ == "__main__":
+    main()
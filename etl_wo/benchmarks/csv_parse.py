@@ -0,0 +1,126 @@
+# benchmarks/csv_parse.py
+"""
+Сравнение парсеров CSV для таблицы из mapping.json: время разбора и память.
+
+Запуск:
+    python -m etl_wo.benchmarks.csv_parse <mapping.json> <таблица> <файл.csv> [--repeat N]
+    python -m etl_wo.benchmarks.csv_parse <mapping.json> <таблица> --rows 1000000
+
+С --rows файл не нужен: генерируется CSV с N строками и столбцами таблицы из маппинга
+(в кодировке и с разделителем таблицы). Каждый парсер запускается в отдельном процессе,
+чтобы пиковый объём памяти процесса (RSS) не зависел от предыдущих замеров.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.common.universal_extract import CSV_ENGINES, read_options, read_csv
+
+
+def reset_peak_rss():
+    """Сбрасывает пик памяти процесса (Linux): ru_maxrss наследуется от родительского процесса."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    """Пиковый объём памяти процесса, МБ: VmHWM (Linux) или ru_maxrss (macOS - в байтах)."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def generate_csv(path: str, table_config: dict, rows: int, seed: int = 0):
+    """Синтетический CSV со столбцами маппинга: номера, даты, суммы и повторяющиеся справочные значения."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for number, column in enumerate(table_config.get("mapping_fields", {})):
+        kind = number % 4
+        if kind == 0:
+            columns[column] = rng.integers(0, rows, rows).astype(str)
+        elif kind == 1:
+            days = rng.integers(0, 3650, rows).astype("timedelta64[D]") + np.datetime64("2015-01-01")
+            columns[column] = pd.to_datetime(days).strftime("%d.%m.%Y")
+        elif kind == 2:
+            columns[column] = np.char.replace(np.round(rng.random(rows) * 10000, 2).astype(str), ".", ",")
+        else:
+            columns[column] = rng.choice([f"Значение {value}" for value in range(50)] + [""], rows)
+    options = read_options(table_config)
+    pd.DataFrame(columns).to_csv(path, sep=options["delimiter"], encoding=options["encoding"], index=False)
+
+
+def measure(file_path: str, options: dict, repeat: int, queue):
+    """Замер одного парсера (выполняется в отдельном процессе)."""
+    reset_peak_rss()
+    baseline = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = read_csv(file_path, options)
+        timings.append(time.perf_counter() - started)
+        frame_mb = float(df.memory_usage(deep=True).sum()) / (1024 * 1024)
+        rows = len(df)
+        del df
+    queue.put({"engine": options["engine"], "rows": rows, "best_seconds": round(min(timings), 3),
+               "frame_mb": round(frame_mb, 1), "peak_rss_mb": round(peak_rss_mb() - baseline, 1)})
+
+
+def run(mapping_file: str, table_name: str, file_path: str, repeat: int = 3) -> list:
+    """Замеряет все парсеры CSV_ENGINES на файле и возвращает список результатов."""
+    with open(mapping_file, "r", encoding="utf-8") as f:
+        table_config = json.load(f).get("tables", {}).get(table_name, {})
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for engine in CSV_ENGINES:
+        queue = context.Queue()
+        process = context.Process(target=measure,
+                                  args=(file_path, read_options({**table_config, "engine": engine}), repeat, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение парсеров CSV: время и память")
+    parser.add_argument("mapping_file")
+    parser.add_argument("table_name")
+    parser.add_argument("file_path", nargs="?")
+    parser.add_argument("--rows", type=int, default=0, help="Сгенерировать файл с заданным числом строк")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    file_path = args.file_path
+    if args.rows:
+        with open(args.mapping_file, "r", encoding="utf-8") as f:
+            table_config = json.load(f).get("tables", {}).get(args.table_name, {})
+        file_path = os.path.join(tempfile.mkdtemp(), f"{args.table_name}.csv")
+        generate_csv(file_path, table_config, args.rows)
+    if not file_path:
+        parser.error("нужен файл CSV или --rows")
+
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    print(f"📄 {file_path}: {size_mb:.1f} МБ")
+    for result in run(args.mapping_file, args.table_name, file_path, args.repeat):
+        print(f"⏱️ {result['engine']:>8}: {result['rows']} строк, {result['best_seconds']} с, "
+              f"DataFrame {result['frame_mb']} МБ ({result['frame_mb'] / size_mb:.1f}x файла), "
+              f"пик памяти процесса +{result['peak_rss_mb']} МБ")
+
+
+if __name__ == "__main__":
+    main()
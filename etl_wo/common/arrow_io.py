@@ -0,0 +1,201 @@
+# common/arrow_io.py
+import os
+import pickle
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from dagster import ConfigurableIOManager, DagsterInvariantViolationError, InputContext, OutputContext
+
+from etl_wo.config.config import STATE_DIR
+
+# Ключ ссылки на файл Arrow, которой в сохранённом результате ассета заменяется DataFrame
+ARROW_REF = "__arrow_ipc__"
+PAYLOAD_FILE = "payload.pickle"
+
+
+def _step_dir(base_dir: str, context) -> str:
+    """
+    Каталог результата шага: по запуску, шагу и выходу (get_identifier; при повторном запуске с места ошибки -
+    запуск, в котором шаг выполнялся), для ассета - внутри каталога ключа ассета. Запуски разных джобов с общими
+    ключами ассетов (джобы Kvazar) не перезаписывают результаты друг друга.
+    """
+    if context.has_asset_key:
+        return os.path.join(base_dir, *context.asset_key.path, *context.get_identifier())
+    return os.path.join(base_dir, *context.get_identifier())
+
+
+def _latest_dir(base_dir: str, context) -> str:
+    """Каталог последнего результата ассета - для материализации ассета без вышестоящего в том же запуске."""
+    return os.path.join(base_dir, *context.asset_key.path)
+
+
+def _write_payload(payload, path: str):
+    with open(f"{path}.tmp", "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_frame(df: pd.DataFrame, path: str) -> dict:
+    """
+    Записывает DataFrame в файл Arrow IPC (Feather v2) без сжатия, чтобы его можно было отобразить в память.
+
+    :return: Ссылка на файл для сохранённого результата: путь и столбцы, которые при чтении возвращаются объектами.
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+
+    table = pa.Table.from_pandas(df)
+    try:
+        feather.write_feather(table, f"{path}.tmp", compression="uncompressed")
+    except Exception:
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+        raise
+    os.replace(f"{path}.tmp", path)
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    return {ARROW_REF: path, "object_columns": object_columns}
+
+
+def read_frame(ref: dict) -> pd.DataFrame:
+    """
+    Читает DataFrame из файла Arrow IPC, отображённого в память. Столбцы string[pyarrow] ссылаются
+    на буферы файла без копирования; столбцы-объекты восстанавливаются с NaN вместо None, как после read_csv.
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+
+    table = feather.read_table(ref[ARROW_REF], memory_map=True)
+    # string[pyarrow] хранится как large_string, обычные строки pandas - как string (их to_pandas вернёт объектами)
+    df = table.to_pandas(types_mapper={pa.large_string(): pd.StringDtype("pyarrow")}.get)
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type) and field.type.value_type == pa.large_string():
+            # Категории со значениями string[pyarrow] (types_mapper к словарю не применяется)
+            values = df[field.name].cat
+            df[field.name] = pd.Categorical.from_codes(
+                values.codes, categories=values.categories.astype(pd.StringDtype("pyarrow")))
+    for col in ref.get("object_columns", []):
+        if df[col].dtype != object:
+            # Столбец-объект с однотипными нестроковыми значениями (например, числами) Arrow хранит с их типом
+            df[col] = df[col].astype(object)
+        if df[col].isna().any():
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def _frame_paths(payload) -> set:
+    """Файлы Arrow, на которые ссылается сохранённый результат."""
+    if isinstance(payload, dict):
+        if ARROW_REF in payload:
+            return {payload[ARROW_REF]}
+        return set().union(*(_frame_paths(value) for value in payload.values()))
+    return set()
+
+
+class ArrowIOManager(ConfigurableIOManager):
+    """
+    IO-менеджер результатов ассетов: DataFrame внутри результата (в том числе во вложенных словарях
+    "normal"/"complex") сохраняются в файлы Arrow IPC и при чтении отображаются в память, а не
+    сериализуются pickle целиком. Остальная часть результата (словарь с table_name, source_file,
+    описанием потока и т.п.) сохраняется pickle со ссылками на файлы, поэтому форма результата не меняется.
+
+    Результат хранится по запуску и шагу (см. _step_dir); для ассета он дополнительно сохраняется как последний
+    результат ассета, который читается, если вышестоящий ассет в этом запуске не выполнялся.
+
+    DataFrame, который Arrow не может сохранить (например, столбец со значениями разных типов),
+    сохраняется pickle вместе с результатом. Результаты старше retention_hours и файлы Arrow, на которые
+    не ссылается ни один оставшийся результат, удаляются при записи следующего результата.
+    """
+    base_dir: str = os.path.join(STATE_DIR, "io")
+    retention_hours: float = 24.0
+
+    def _replace_frames(self, obj, directory: str, prefix: str, frames: list):
+        if isinstance(obj, pd.DataFrame):
+            import pyarrow as pa
+
+            path = os.path.join(directory, f"{prefix}-{len(frames)}.arrow")
+            try:
+                ref = write_frame(obj, path)
+            except (pa.ArrowException, ValueError, TypeError):
+                return obj
+            frames.append(path)
+            return ref
+        if isinstance(obj, dict):
+            return {key: self._replace_frames(value, directory, prefix, frames) for key, value in obj.items()}
+        return obj
+
+    def _restore_frames(self, obj):
+        if isinstance(obj, dict):
+            if ARROW_REF in obj:
+                return read_frame(obj)
+            return {key: self._restore_frames(value) for key, value in obj.items()}
+        return obj
+
+    def _remove_expired(self, keep: list):
+        """
+        Удаляет результаты старше retention_hours во всём base_dir. Файл Arrow удаляется, только если он старше
+        retention_hours и на него не ссылается ни один оставшийся результат (в том числе последний результат
+        ассета), поэтому повторный запуск с места ошибки не найдёт ссылку на удалённый файл.
+        Только что записанные файлы keep не удаляются.
+        """
+        expire_before = time.time() - self.retention_hours * 3600
+        payloads, frames = [], []
+        for directory, _, names in os.walk(self.base_dir):
+            for name in names:
+                if name == PAYLOAD_FILE:
+                    payloads.append(os.path.join(directory, name))
+                elif name.endswith(".arrow"):
+                    frames.append(os.path.join(directory, name))
+
+        referenced = set(keep)
+        for path in payloads:
+            try:
+                if os.path.getmtime(path) < expire_before:
+                    os.remove(path)
+                    continue
+                with open(path, "rb") as f:
+                    referenced.update(_frame_paths(pickle.load(f)))
+            except Exception:
+                # Результат удалён или перезаписан другим процессом во время обхода
+                continue
+        for path in frames:
+            try:
+                if path not in referenced and os.path.getmtime(path) < expire_before:
+                    os.remove(path)
+            except OSError:
+                pass
+        # Каталоги запусков, в которых не осталось файлов
+        for directory, _, names in os.walk(self.base_dir, topdown=False):
+            if directory != self.base_dir and not names and not os.listdir(directory):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def handle_output(self, context: OutputContext, obj):
+        directory = _step_dir(self.base_dir, context)
+        os.makedirs(directory, exist_ok=True)
+        # Уникальный префикс: повтор шага (retry) не перезаписывает файлы, на которые ссылается прежний результат
+        prefix = f"{context.run_id}-{uuid.uuid4().hex[:8]}"
+        frames = []
+        payload = self._replace_frames(obj, directory, prefix, frames)
+        _write_payload(payload, os.path.join(directory, PAYLOAD_FILE))
+        if context.has_asset_key:
+            _write_payload(payload, os.path.join(_latest_dir(self.base_dir, context), PAYLOAD_FILE))
+        self._remove_expired(frames)
+        if frames:
+            context.log.info(f"💾 DataFrame результата сохранены в Arrow IPC: {len(frames)} файл(ов) в {directory}")
+
+    def load_input(self, context: InputContext):
+        upstream = context.upstream_output
+        try:
+            path = os.path.join(_step_dir(self.base_dir, upstream), PAYLOAD_FILE)
+        except DagsterInvariantViolationError:
+            # Вышестоящий ассет не выполнялся в этом запуске (и не в родительском): запуска результата нет
+            path = None
+        if (path is None or not os.path.exists(path)) and upstream.has_asset_key:
+            path = os.path.join(_latest_dir(self.base_dir, upstream), PAYLOAD_FILE)
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        return self._restore_frames(payload)
@@ -0,0 +1,240 @@
+# common/binary_copy.py
+import io
+import struct
+from decimal import Decimal
+from itertools import chain, repeat
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.common.date_parse import parse_dates, dates_to_objects
+
+# Заголовок и завершение потока COPY ... WITH (FORMAT binary)
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+NULL_FIELD = struct.pack(">i", -1)
+_INT32 = struct.Struct(">i")
+
+# Эпоха Postgres для date/timestamp в двоичном формате
+PG_EPOCH = np.datetime64("2000-01-01")
+# Сколько строк кодируется за один вызов COPY
+BINARY_CHUNK_ROWS = 50000
+
+# Значения, которые считаются пропуском для нетекстовых столбцов ("-" - заглушка трансформаций)
+MISSING_VALUES = ("", "-")
+TRUE_VALUES = ("true", "t", "1", "yes", "y", "да")
+FALSE_VALUES = ("false", "f", "0", "no", "n", "нет")
+
+# Типы с фиксированной длиной значения: имя типа Postgres -> numpy dtype в big-endian
+FIXED_WIDTH_TYPES = {
+    "int2": ">i2", "int4": ">i4", "int8": ">i8",
+    "float4": ">f4", "float8": ">f8",
+    "bool": "?",
+    "date": ">i4",
+    "timestamp": ">i8", "timestamptz": ">i8",
+}
+TEXT_TYPES = ("text", "varchar", "bpchar", "name")
+SUPPORTED_TYPES = tuple(FIXED_WIDTH_TYPES) + TEXT_TYPES + ("numeric",)
+
+
+def session_timezone(cursor) -> str:
+    """Часовой пояс сессии: в нём интерпретируются значения без пояса для столбцов timestamptz."""
+    cursor.execute("SHOW TIME ZONE;")
+    return cursor.fetchone()[0]
+
+
+def unsupported_columns(column_types: dict) -> dict:
+    """Столбцы, типы которых не поддерживаются двоичным COPY (например, json, uuid, interval)."""
+    return {col: info["type"] for col, info in column_types.items() if info["type"] not in SUPPORTED_TYPES}
+
+
+def _missing_mask(series: pd.Series) -> pd.Series:
+    """Пропуски в исходном столбце: NaN/None, пустые строки и заглушка "-"."""
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        return series.isna() | series.astype(str).str.strip().isin(MISSING_VALUES)
+    return series.isna()
+
+
+def _to_numbers(series: pd.Series) -> pd.Series:
+    """Числа из строк выгрузки: пробелы-разделители разрядов убираются, запятая заменяется точкой."""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype("float64")
+    text = series.astype(str).str.replace(r"[\s ]", "", regex=True).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce")
+
+
+def convert_column(series: pd.Series, type_name: str, timezone: str = "UTC") -> pd.Series:
+    """
+    Приводит столбец DataFrame к нативному типу, соответствующему типу столбца Postgres.
+    Нераспознанные значения становятся пропусками (NaN/NaT/<NA>).
+    """
+    if type_name in TEXT_TYPES:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Даты (этап "dates") в текстовом столбце записываются так же, как при COPY в формате CSV
+            series = dates_to_objects(series.to_frame())[series.name]
+        return series.where(series.isna(), series.astype(str))
+    if type_name in ("date", "timestamp", "timestamptz"):
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series
+        else:
+            # Каждая различная строка разбирается один раз
+            values, _ = parse_dates(series, date_format=None)
+        if type_name == "timestamptz":
+            if values.dt.tz is None:
+                values = values.dt.tz_localize(timezone, ambiguous="NaT", nonexistent="NaT")
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        elif values.dt.tz is not None:
+            values = values.dt.tz_localize(None)
+        return values
+    if type_name == "bool":
+        if pd.api.types.is_bool_dtype(series):
+            return series.astype("boolean")
+        text = series.astype(str).str.strip().str.lower()
+        values = pd.Series(pd.NA, index=series.index, dtype="boolean")
+        values[text.isin(TRUE_VALUES)] = True
+        values[text.isin(FALSE_VALUES)] = False
+        return values
+    numbers = _to_numbers(series)
+    if type_name not in ("float4", "float8"):
+        # pd.to_numeric принимает "inf"/"-inf": бесконечность допустима только в float, в остальных - нераспознанное
+        numbers = numbers.where(~np.isinf(numbers))
+    if type_name in ("int2", "int4", "int8"):
+        # Дробные значения в целочисленном столбце считаются нераспознанными
+        numbers = numbers.where(numbers.isna() | (numbers == np.floor(numbers)))
+        return numbers.astype("Int64")
+    return numbers
+
+
+def to_native_types(data: pd.DataFrame, column_types: dict, timezone: str = "UTC") -> tuple:
+    """
+    Векторно приводит столбцы DataFrame к нативным типам по типам столбцов целевой таблицы.
+
+    Пропуски (NaN, пустые строки, а для нетекстовых столбцов и заглушка "-") передаются как NULL,
+    если столбец допускает NULL. В обязательных текстовых столбцах пропуск заменяется на "-",
+    как и в остальных режимах загрузки.
+
+    :return: Кортеж (DataFrame с нативными типами, {столбец: число нераспознанных значений}).
+    :raises ValueError: Если в обязательном нетекстовом столбце есть пропуски или нераспознанные значения.
+    """
+    converted = {}
+    invalid = {}
+    null_violations = []
+    for col, info in column_types.items():
+        series = data[col]
+        is_text = info["type"] in TEXT_TYPES
+        missing = series.isna() if is_text else _missing_mask(series)
+        values = convert_column(series.mask(missing), info["type"], timezone)
+        bad = int((values.isna() & ~missing).sum())
+        if bad:
+            invalid[col] = bad
+        if info["not_null"] and values.isna().any():
+            if is_text:
+                values = values.fillna("-")
+            else:
+                null_violations.append(col)
+        converted[col] = values
+    if null_violations:
+        raise ValueError(f"Columns {null_violations} are NOT NULL but contain missing or invalid values.")
+    extra = [col for col in data.columns if col not in column_types]
+    result = pd.DataFrame(converted, index=data.index)
+    for col in extra:
+        result[col] = data[col]
+    return result[list(data.columns)], invalid
+
+
+def _fixed_width_fields(values: pd.Series, type_name: str) -> list:
+    """Поля фиксированной длины (длина + значение) для всех строк столбца, собранные через numpy."""
+    missing = values.isna().to_numpy()
+    if type_name == "date":
+        raw = (values.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]") - PG_EPOCH).astype("int64")
+    elif type_name in ("timestamp", "timestamptz"):
+        raw = (values.to_numpy(dtype="datetime64[ns]").astype("datetime64[us]")
+               - PG_EPOCH.astype("datetime64[us]")).astype("int64")
+    elif type_name == "bool":
+        raw = values.fillna(False).to_numpy(dtype=bool)
+    else:
+        raw = values.fillna(0).to_numpy()
+    value_dtype = np.dtype(FIXED_WIDTH_TYPES[type_name])
+    packed = np.empty(len(values), dtype=[("length", ">i4"), ("value", value_dtype)])
+    packed["length"] = value_dtype.itemsize
+    packed["value"] = np.where(missing, 0, raw) if type_name != "bool" else raw & ~missing
+    buffer = packed.tobytes()
+    size = packed.dtype.itemsize
+    return [NULL_FIELD if is_missing else buffer[start:start + size]
+            for is_missing, start in zip(missing, range(0, len(buffer), size))]
+
+
+def numeric_bytes(value) -> bytes:
+    """
+    Значение numeric в двоичном формате Postgres (цифры по основанию 10000).
+
+    :raises ValueError: Для бесконечности (convert_column заменяет её пропуском заранее).
+    """
+    value = value if isinstance(value, Decimal) else Decimal(repr(value))
+    if value.is_infinite():
+        raise ValueError(f"Infinite value {value} cannot be encoded as numeric.")
+    if value.is_nan():
+        return struct.pack(">hhhh", 0, 0, 0xC000, 0)
+    sign, digits, exponent = value.as_tuple()
+    digits = "".join(map(str, digits))
+    dscale = max(-exponent, 0)
+    if exponent >= 0:
+        integer, fraction = digits + "0" * exponent, ""
+    else:
+        digits = digits.rjust(dscale, "0")
+        integer, fraction = digits[:len(digits) - dscale], digits[len(digits) - dscale:]
+    integer = integer.lstrip("0")
+    integer = integer.rjust(-(-len(integer) // 4) * 4, "0")
+    fraction = fraction.ljust(-(-len(fraction) // 4) * 4, "0")
+    groups = [int(integer[i:i + 4]) for i in range(0, len(integer), 4)] + \
+             [int(fraction[i:i + 4]) for i in range(0, len(fraction), 4)]
+    weight = len(integer) // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+    return struct.pack(f">hhhh{len(groups)}h", len(groups), weight, 0x4000 if sign else 0, dscale, *groups)
+
+
+def _variable_fields(values: pd.Series, type_name: str) -> list:
+    """Поля переменной длины (текст, numeric) для всех строк столбца."""
+    if type_name == "numeric":
+        encoded = [None if pd.isna(value) else numeric_bytes(value) for value in values.to_numpy(dtype=object)]
+    else:
+        encoded = values.str.encode("utf-8").to_numpy(dtype=object)
+    return [_INT32.pack(len(payload)) + payload if isinstance(payload, bytes) else NULL_FIELD for payload in encoded]
+
+
+def encode_rows(data: pd.DataFrame, cols: list, column_types: dict) -> bytes:
+    """Кодирует строки DataFrame в поток кортежей COPY BINARY (без заголовка и завершения)."""
+    fields = []
+    for col in cols:
+        type_name = column_types[col]["type"]
+        if type_name in FIXED_WIDTH_TYPES:
+            fields.append(_fixed_width_fields(data[col], type_name))
+        else:
+            fields.append(_variable_fields(data[col], type_name))
+    tuple_header = struct.pack(">h", len(cols))
+    return b"".join(chain.from_iterable(zip(repeat(tuple_header, len(data)), *fields)))
+
+
+def copy_binary(cursor, staging: str, data: pd.DataFrame, cols: list, column_types: dict,
+                chunk_rows: int = BINARY_CHUNK_ROWS) -> int:
+    """
+    Передаёт DataFrame с нативными типами (см. to_native_types) в таблицу через COPY FROM STDIN
+    в двоичном формате: сервер получает готовые значения и не разбирает их из текста.
+
+    :return: Число переданных строк.
+    """
+    copy_sql = f"COPY {staging} ({', '.join(cols)}) FROM STDIN WITH (FORMAT binary)"
+    for start in range(0, len(data), chunk_rows):
+        buffer = io.BytesIO()
+        buffer.write(PGCOPY_HEADER)
+        buffer.write(encode_rows(data.iloc[start:start + chunk_rows], cols, column_types))
+        buffer.write(PGCOPY_TRAILER)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+    return len(data)
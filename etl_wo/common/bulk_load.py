@@ -0,0 +1,294 @@
+# common/bulk_load.py
+import io
+import time
+
+import pandas as pd
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from etl_wo.common.binary_copy import copy_binary
+from etl_wo.common.row_hash import ROW_HASH_COLUMN, ensure_row_hash_table, drop_unchanged_rows, save_row_hashes
+
+# Сколько строк DataFrame сериализуется в CSV за один вызов COPY
+COPY_CHUNK_ROWS = 50000
+# Размер пачки по умолчанию для многострочного INSERT ... VALUES
+DEFAULT_BATCH_SIZE = 5000
+
+
+def staging_table_name(cursor, table_name: str) -> str:
+    """
+    Имя временной staging-таблицы для целевой таблицы, готовое для подстановки в SQL.
+    Строится по имени таблицы без схемы (временные таблицы создаются в своей схеме pg_temp)
+    и экранируется как идентификатор: для "schema.table" это "stg_table".
+    """
+    relation = table_name.rsplit(".", 1)[-1].strip('"')
+    return sql.Identifier(f"stg_{relation}").as_string(cursor)
+
+
+def create_staging_table(cursor, table_name: str, cols: list, extra_columns: dict = None) -> str:
+    """
+    Создаёт временную таблицу с теми же типами столбцов, что и в целевой таблице.
+    Ограничения (NOT NULL, UNIQUE) не копируются, таблица удаляется при завершении транзакции.
+
+    :param cursor: Курсор psycopg2.
+    :param table_name: Имя целевой таблицы.
+    :param cols: Столбцы, которые будут загружены через COPY.
+    :param extra_columns: (Опционально) Служебные столбцы {имя: тип}, которых нет в целевой таблице.
+    :return: Имя созданной staging-таблицы.
+    """
+    staging = staging_table_name(cursor, table_name)
+    cursor.execute(
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+        f"SELECT {', '.join(cols)} FROM {table_name} WITH NO DATA;"
+    )
+    for name, column_type in (extra_columns or {}).items():
+        cursor.execute(f"ALTER TABLE {staging} ADD COLUMN {name} {column_type};")
+    return staging
+
+
+def copy_dataframe(cursor, staging: str, data: pd.DataFrame, cols: list, chunk_rows: int = COPY_CHUNK_ROWS) -> int:
+    """
+    Передаёт DataFrame в таблицу через COPY FROM STDIN (формат CSV).
+    Данные сериализуются порциями по chunk_rows строк, чтобы не держать в памяти весь CSV целиком.
+    Пустые значения (NaN/None) передаются как NULL.
+
+    :return: Число переданных строк.
+    """
+    copy_sql = f"COPY {staging} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(data), chunk_rows):
+        buffer = io.StringIO()
+        data.iloc[start:start + chunk_rows].to_csv(buffer, columns=cols, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+    return len(data)
+
+
+def fill_staging(cursor, staging: str, data: pd.DataFrame, cols: list, use_copy: bool = True,
+                 batch_size: int = DEFAULT_BATCH_SIZE, column_types: dict = None) -> int:
+    """
+    Заполняет staging-таблицу через COPY или, если COPY недоступен, пачками INSERT ... VALUES.
+    Если заданы column_types (см. schema_cache.column_types), данные уже приведены к нативным типам
+    и передаются двоичным COPY.
+    """
+    if use_copy and column_types:
+        return copy_binary(cursor, staging, data, cols, column_types)
+    if use_copy:
+        return copy_dataframe(cursor, staging, data, cols)
+    for rows in iter_row_batches(data, cols, batch_size):
+        execute_values(cursor, f"INSERT INTO {staging} ({', '.join(cols)}) VALUES %s", rows, page_size=len(rows))
+    return len(data)
+
+
+def conflict_clause(cols: list, conflict_columns: list) -> str:
+    """ON CONFLICT ... DO UPDATE для всех неключевых столбцов (или DO NOTHING, если обновлять нечего)."""
+    update_columns = [col for col in cols if col not in conflict_columns]
+    if update_columns:
+        conflict_action = f"DO UPDATE SET {', '.join([f'{col} = EXCLUDED.{col}' for col in update_columns])}"
+    else:
+        conflict_action = "DO NOTHING"
+    return f"ON CONFLICT ({', '.join(conflict_columns)}) {conflict_action}"
+
+
+def merge_sql(table_name: str, source: str, cols: list, conflict_columns: list, count_rows: bool = False) -> str:
+    """
+    Формирует один set-based INSERT ... SELECT ... ON CONFLICT из staging-таблицы в целевую.
+    created_at и updated_at заполняются CURRENT_TIMESTAMP, как и при построчной вставке.
+    При count_rows=True запрос возвращает одну строку (вставлено, обновлено): вставка и обновление
+    различаются по RETURNING (xmax = 0).
+    """
+    insert_columns = cols + ["created_at", "updated_at"]
+    upsert = f"""
+    INSERT INTO {table_name} ({', '.join(insert_columns)})
+    SELECT {', '.join(cols)}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP FROM {source}
+    {conflict_clause(cols, conflict_columns)}"""
+    if not count_rows:
+        return f"{upsert};"
+    return f"""
+    WITH upserted AS ({upsert}
+    RETURNING (xmax = 0) AS inserted)
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted;
+    """
+
+
+def copy_upsert(cursor, table_name: str, data: pd.DataFrame, conflict_columns: list,
+                column_types: dict = None) -> dict:
+    """
+    Bulk upsert: COPY во временную staging-таблицу и один INSERT ... ON CONFLICT в целевую таблицу.
+    Фиксация транзакции остаётся за вызывающим кодом.
+
+    :param cursor: Курсор psycopg2.
+    :param table_name: Имя целевой таблицы.
+    :param data: DataFrame без столбцов created_at/updated_at.
+    :param conflict_columns: Ключевые столбцы (column_check из mapping.json).
+    :param column_types: (Опционально) Типы столбцов для двоичного COPY (иначе - COPY в формате CSV).
+    :return: Словарь с числом вставленных (inserted) и обновлённых (updated) строк.
+    """
+    cols = list(data.columns)
+    staging = create_staging_table(cursor, table_name, cols)
+    fill_staging(cursor, staging, data, cols, column_types=column_types)
+    return merge_staging(cursor, table_name, staging, cols, conflict_columns)
+
+
+def merge_staging(cursor, table_name: str, staging: str, cols: list, conflict_columns: list) -> dict:
+    """Сливает заполненную staging-таблицу в целевую одним INSERT ... ON CONFLICT и возвращает счётчики строк."""
+    cursor.execute(merge_sql(table_name, staging, cols, conflict_columns, count_rows=True))
+    inserted, updated = cursor.fetchone()
+    return {"inserted": inserted, "updated": updated}
+
+
+def dedup_staging(cursor, staging: str, key_columns: list, order_by: str) -> int:
+    """
+    Оставляет в staging-таблице по одной строке на каждое значение ключевых столбцов.
+    Из строк с одинаковым ключом остаётся первая по порядку order_by (SQL-выражение ORDER BY).
+
+    :return: Число удалённых строк.
+    """
+    cursor.execute(f"""
+    DELETE FROM {staging} s
+    USING (
+        SELECT ctid AS row_id,
+               row_number() OVER (PARTITION BY {', '.join(key_columns)} ORDER BY {order_by}) AS position
+        FROM {staging}
+    ) ranked
+    WHERE s.ctid = ranked.row_id AND ranked.position > 1;
+    """)
+    return cursor.rowcount
+
+
+def iter_row_batches(data: pd.DataFrame, cols: list, batch_size: int):
+    """
+    Отдаёт строки DataFrame пачками списков кортежей.
+    Значения берутся напрямую из массивов столбцов (без iterrows), numpy-скаляры приводятся
+    к обычным типам Python, чтобы их мог адаптировать psycopg2.
+    """
+    arrays = [data[col].to_numpy(dtype=object) for col in cols]
+    for start in range(0, len(data), batch_size):
+        yield list(zip(*(array[start:start + batch_size] for array in arrays)))
+
+
+def batch_upsert(cursor, table_name: str, data: pd.DataFrame, conflict_columns: list,
+                 batch_size: int = DEFAULT_BATCH_SIZE, timestamps: bool = True, report=None) -> dict:
+    """
+    Upsert многострочными INSERT ... VALUES (...), (...) ON CONFLICT без использования COPY
+    (для баз за пулером, где COPY запрещён). Фиксация транзакции остаётся за вызывающим кодом.
+
+    :param cursor: Курсор psycopg2.
+    :param table_name: Имя целевой таблицы.
+    :param data: DataFrame без столбцов created_at/updated_at.
+    :param conflict_columns: Ключевые столбцы (column_check из mapping.json).
+    :param batch_size: Число строк в одном запросе.
+    :param timestamps: Заполнять ли created_at/updated_at значением CURRENT_TIMESTAMP.
+    :param report: (Опционально) функция report(batch_number, rows, seconds) для статистики по пачкам.
+    :return: Словарь с числом вставленных (inserted) и обновлённых (updated) строк.
+    """
+    cols = list(data.columns)
+    insert_columns = cols + ["created_at", "updated_at"] if timestamps else cols
+    placeholders = ["%s"] * len(cols) + (["CURRENT_TIMESTAMP", "CURRENT_TIMESTAMP"] if timestamps else [])
+    template = f"({', '.join(placeholders)})"
+    sql = f"""
+    INSERT INTO {table_name} ({', '.join(insert_columns)})
+    VALUES %s
+    {conflict_clause(cols, conflict_columns)}
+    RETURNING (xmax = 0);
+    """
+    inserted = updated = 0
+    for batch_number, rows in enumerate(iter_row_batches(data, cols, batch_size), start=1):
+        started = time.perf_counter()
+        flags = execute_values(cursor, sql, rows, template=template, page_size=len(rows), fetch=True)
+        if report:
+            report(batch_number, len(rows), time.perf_counter() - started)
+        batch_inserted = sum(1 for (was_inserted,) in flags if was_inserted)
+        inserted += batch_inserted
+        updated += len(flags) - batch_inserted
+    return {"inserted": inserted, "updated": updated}
+
+
+def log_batch_rate(context, table_name: str):
+    """Возвращает функцию report для batch_upsert, пишущую скорость каждой пачки в лог Dagster."""
+    def report(batch_number, rows, seconds):
+        rate = rows / seconds if seconds else float(rows)
+        context.log.info(f"📦 {table_name}: пачка {batch_number} - {rows} строк за {seconds:.2f} с ({rate:.0f} строк/с)")
+    return report
+
+
+def replace_by_keys(cursor, table_name: str, data: pd.DataFrame, key_columns: list, use_copy: bool = True,
+                    batch_size: int = DEFAULT_BATCH_SIZE, timestamps: bool = True, column_types: dict = None) -> tuple:
+    """
+    Set-based замена групп строк: все строки один раз попадают во временную staging-таблицу,
+    затем одним DELETE ... USING удаляются все затронутые комбинации ключей и одним
+    INSERT ... SELECT вставляются новые строки. Всё выполняется в текущей транзакции,
+    фиксация остаётся за вызывающим кодом.
+
+    :param cursor: Курсор psycopg2.
+    :param table_name: Имя целевой таблицы.
+    :param data: DataFrame без столбцов created_at/updated_at.
+    :param key_columns: Столбцы, определяющие группу (например, talon и source).
+    :param use_copy: Заполнять staging-таблицу через COPY (иначе - пачками INSERT ... VALUES).
+    :param batch_size: Размер пачки при use_copy=False.
+    :param timestamps: Заполнять ли created_at/updated_at значением CURRENT_TIMESTAMP.
+    :param column_types: (Опционально) Типы столбцов для двоичного COPY.
+    :return: Кортеж (число удалённых строк, число вставленных строк).
+    """
+    cols = list(data.columns)
+    staging = create_staging_table(cursor, table_name, cols)
+    fill_staging(cursor, staging, data, cols, use_copy=use_copy, batch_size=batch_size, column_types=column_types)
+    return replace_from_staging(cursor, table_name, staging, cols, key_columns, timestamps=timestamps)
+
+
+def replace_from_staging(cursor, table_name: str, staging: str, cols: list, key_columns: list,
+                         timestamps: bool = True) -> tuple:
+    """
+    Заменяет в целевой таблице все группы строк, ключи которых есть в staging-таблице:
+    один DELETE ... USING и один INSERT ... SELECT.
+
+    :return: Кортеж (число удалённых строк, число вставленных строк).
+    """
+    key_match = " AND ".join([f"t.{col} = k.{col}" for col in key_columns])
+    cursor.execute(f"""
+    DELETE FROM {table_name} t
+    USING (SELECT DISTINCT {', '.join(key_columns)} FROM {staging}) k
+    WHERE {key_match};
+    """)
+    deleted = cursor.rowcount
+
+    insert_columns = cols + ["created_at", "updated_at"] if timestamps else cols
+    select_columns = cols + ["CURRENT_TIMESTAMP", "CURRENT_TIMESTAMP"] if timestamps else cols
+    cursor.execute(f"""
+    INSERT INTO {table_name} ({', '.join(insert_columns)})
+    SELECT {', '.join(select_columns)} FROM {staging};
+    """)
+    inserted = cursor.rowcount
+    return deleted, inserted
+
+
+def changed_rows_upsert(cursor, table_name: str, data: pd.DataFrame, conflict_columns: list, use_copy: bool = True,
+                        batch_size: int = DEFAULT_BATCH_SIZE, column_types: dict = None) -> dict:
+    """
+    Upsert только новых и изменившихся строк. DataFrame должен содержать столбец ROW_HASH_COLUMN
+    (см. row_hash.add_row_hash). Строки, хэш которых совпадает с сохранённым в служебной таблице,
+    удаляются из staging-таблицы до слияния, поэтому целевая таблица их не перезаписывает.
+    Фиксация транзакции остаётся за вызывающим кодом.
+
+    :return: Словарь с числом вставленных (inserted), обновлённых (updated) и неизменившихся (unchanged) строк.
+    """
+    cols = [col for col in data.columns if col != ROW_HASH_COLUMN]
+    ensure_row_hash_table(cursor)
+    staging = create_staging_table(cursor, table_name, cols, extra_columns={ROW_HASH_COLUMN: "bigint"})
+    if column_types:
+        column_types = {**column_types, ROW_HASH_COLUMN: {"type": "int8", "not_null": True}}
+    fill_staging(cursor, staging, data, cols + [ROW_HASH_COLUMN], use_copy=use_copy, batch_size=batch_size,
+                 column_types=column_types)
+    return merge_changed_rows(cursor, table_name, staging, cols, conflict_columns)
+
+
+def merge_changed_rows(cursor, table_name: str, staging: str, cols: list, conflict_columns: list) -> dict:
+    """
+    Сливает в целевую таблицу только новые и изменившиеся строки staging-таблицы (со столбцом ROW_HASH_COLUMN)
+    и сохраняет их хэши. Служебная таблица хэшей должна существовать (ensure_row_hash_table).
+
+    :return: Словарь с числом вставленных (inserted), обновлённых (updated) и неизменившихся (unchanged) строк.
+    """
+    unchanged = drop_unchanged_rows(cursor, table_name, staging, conflict_columns)
+    counts = merge_staging(cursor, table_name, staging, cols, conflict_columns)
+    save_row_hashes(cursor, table_name, staging, conflict_columns)
+    return {**counts, "unchanged": unchanged}
@@ -0,0 +1,105 @@
+# common/categorical.py
+import pandas as pd
+
+# Автоматический выбор столбцов: текстовый столбец кодируется категориями, если различных значений
+# не больше CATEGORY_MAX_SHARE от числа строк; в DataFrame меньше CATEGORY_MIN_ROWS строк экономия ничтожна
+CATEGORY_MAX_SHARE = 0.05
+CATEGORY_MIN_ROWS = 10000
+# Строк в пробной выборке, по которой заранее отбрасываются столбцы с большим числом различных значений
+CATEGORY_SAMPLE_ROWS = 10000
+
+
+def is_text(series: pd.Series) -> bool:
+    """Текстовый ли столбец: объекты Python или строки pandas (в том числе string[pyarrow])."""
+    return series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+
+
+def validate_hint(hint) -> list:
+    """
+    Ошибки подсказки "categorical" таблицы mapping.json: true - выбирать столбцы автоматически,
+    false - не кодировать, список - кодировать перечисленные столбцы (имена после переименования).
+    """
+    if hint is None or isinstance(hint, bool):
+        return []
+    if not isinstance(hint, list) or not all(isinstance(col, str) for col in hint):
+        return ["categorical должен быть true, false или списком столбцов"]
+    return []
+
+
+def _text_bytes(series: pd.Series, encoded: pd.Series) -> int:
+    """
+    Память текстового столбца. Парсер CSV и чтение Arrow разделяют объекты одинаковых строк, поэтому для
+    столбца-объектов считаются указатели и по одному объекту на значение (как в категориях encoded).
+    """
+    if series.dtype != object:
+        return series.memory_usage(index=False, deep=True)
+    categories = encoded.cat.categories
+    return series.memory_usage(index=False) + categories.memory_usage(deep=True) - categories.memory_usage()
+
+
+def low_cardinality_columns(df: pd.DataFrame, max_share: float = CATEGORY_MAX_SHARE) -> list:
+    """Текстовые столбцы, которые стоит закодировать категориями (см. CATEGORY_MAX_SHARE и CATEGORY_MIN_ROWS)."""
+    if len(df) < CATEGORY_MIN_ROWS:
+        return []
+    limit = max_share * len(df)
+    return [col for col in df.columns
+            if is_text(df[col]) and df[col].iloc[:CATEGORY_SAMPLE_ROWS].nunique() <= limit]
+
+
+def encode_categories(df: pd.DataFrame, hint=None, max_share: float = CATEGORY_MAX_SHARE) -> tuple:
+    """
+    Хранит текстовые столбцы с малым числом различных значений как категории: значение хранится один раз,
+    а строка - кодом в 1-2 байта. Обратно в строки столбцы переводятся только перед записью в БД
+    (см. expand_categories).
+
+    :param hint: Подсказка "categorical" из mapping.json (см. validate_hint); None или True - автоматический выбор.
+    :return: Кортеж (DataFrame, отчёт {"columns": закодированные столбцы, "before_mb", "after_mb", "saved_mb"}).
+    """
+    report = {"columns": [], "before_mb": 0.0, "after_mb": 0.0, "saved_mb": 0.0}
+    if hint is False:
+        return df, report
+    if isinstance(hint, list):
+        candidates = [col for col in hint if col in df.columns and is_text(df[col])]
+        limit = None
+    else:
+        candidates = low_cardinality_columns(df, max_share)
+        limit = max_share * len(df)
+
+    encoded = {}
+    before, after = 0, 0
+    for col in candidates:
+        # Один проход factorize даёт и число различных значений, и коды категорий
+        codes, uniques = pd.factorize(df[col])
+        if limit is not None and len(uniques) > limit:
+            continue
+        series = pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=df.index, name=col)
+        before += _text_bytes(df[col], series)
+        after += series.memory_usage(index=False, deep=True)
+        encoded[col] = series
+    if not encoded:
+        return df, report
+
+    df = df.copy(deep=False)
+    for col, series in encoded.items():
+        df[col] = series
+    mb = 1024 * 1024
+    report.update({"columns": list(encoded), "before_mb": before / mb, "after_mb": after / mb,
+                   "saved_mb": (before - after) / mb})
+    return df, report
+
+
+def expand_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """Переводит столбцы-категории обратно в тип их значений (объекты с NaN или string[pyarrow]) - для записи в БД."""
+    columns = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not columns:
+        return df
+    df = df.copy(deep=False)
+    for col in columns:
+        df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+
+def describe_report(report: dict) -> str:
+    """Текст отчёта encode_categories для лога."""
+    return (f"столбцов {len(report['columns'])} {report['columns']}, {report['before_mb']:.1f} МБ -> "
+            f"{report['after_mb']:.1f} МБ, сэкономлено {report['saved_mb']:.1f} МБ")
@@ -1,17 +1,29 @@
-from sqlalchemy import text
-from etl_wo.common.connect_db import connect_to_db
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.health_probe import probe_tables, probe_metadata, describe_probe, DEFAULT_TIME_BUDGET
+from etl_wo.common.table_stats import table_row_count, describe_row_count
 from etl_wo.config.config import DATABASES
 
 
-def check_db(context, organization='default', db_alias='default', tables=None):
+def check_db(context, organization='default', db_alias='default', tables=None, full_count=False, db=None,
+             probe=True, time_budget=DEFAULT_TIME_BUDGET):
     """
     Проверяет подключение к базе данных и наличие заданных таблиц.
     Выводит сообщения через context.log.info().
+    Число строк берётся из статистики каталога; точный COUNT(*) выполняется только при full_count=True.
+    Соединение берётся из пула ресурса db; в результат добавляются проверка пула и его метрики.
+
+    В режиме probe (по умолчанию) все таблицы проверяются одновременно в отдельных соединениях пула
+    (существование, права на чтение и запись, число строк) в пределах общего бюджета time_budget секунд;
+    задержка проверки каждой таблицы добавляется в метаданные ассета. Иначе таблицы проверяются по очереди.
 
     :param context: Dagster context для логирования
     :param organization: Название организации (можно задать через конфигурацию джобы)
     :param db_alias: Ключ конфигурации в DATABASES (по умолчанию 'default')
     :param tables: Список таблиц для проверки (обязательно должен быть передан)
+    :param full_count: Считать точное число строк через COUNT(*) (сканирует всю таблицу)
+    :param db: (Опционально) Ресурс DatabaseResource (по умолчанию - пул с настройками по умолчанию)
+    :param probe: Проверять таблицы одновременно с ограничением по времени
+    :param time_budget: Бюджет времени на проверку всех таблиц, секунд (для probe)
     :return: Словарь с информацией о проверке
     """
     if not tables:
@@ -24,22 +36,40 @@ def check_db(context, organization='default', db_alias='default', tables=None):
         context.log.info(message)
         raise ValueError(message)
 
-    db_config = DATABASES[db_alias]
-    engine, conn = connect_to_db(db_alias, organization=organization, context=context)
+    pool = (db or DatabaseResource()).pool(db_alias, context, organization=organization)
+    health = pool.health_check()
+    if not health["ok"]:
+        message = f"❌ Ошибка подключения к базе '{db_alias}' в организации '{organization}': {health['error']}"
+        context.log.info(message)
+        raise ValueError(message)
 
-    try:
-        with engine.connect() as connection:
+    probe_results = None
+    if probe:
+        probe_results = probe_tables(pool, tables, time_budget=time_budget, full_count=full_count)
+        for table, result in probe_results.items():
+            if result["ok"]:
+                context.log.info(f"📋 Таблица '{table}': {describe_probe(result)}")
+            else:
+                context.log.warning(f"⚠️ Таблица '{table}': {describe_probe(result)}")
+        context.add_output_metadata(probe_metadata(probe_results))
+    else:
+        with pool.connection(context) as conn:
             for table in tables:
                 try:
-                    result = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
-                    message = f"📋 Таблица '{table}': {result} строк"
+                    with conn.cursor() as cursor:
+                        row_count = table_row_count(cursor, table, full_count=full_count)
+                    message = f"📋 Таблица '{table}': {describe_row_count(row_count)}"
                     context.log.info(message)
                 except Exception as e:
+                    conn.rollback()
                     message = f"⚠️ Не удалось получить количество строк для таблицы '{table}': {e}"
                     context.log.info(message)
-    finally:
-        conn.close()
+
+    metrics = pool.metrics()
+    context.log.info(f"🔌 Пул соединений {db_alias}: проверка {'успешна' if health['ok'] else 'не пройдена'} "
+                     f"({health['latency_ms']} мс), открыто {metrics['created']}, переиспользовано {metrics['reused']}")
 
     message = f"📋 Проверка завершена. Проверены таблицы: {', '.join(tables)}"
     context.log.info(message)
-    return {"db_alias": db_alias, "organization": organization, "tables": tables}
+    return {"db_alias": db_alias, "organization": organization, "tables": tables, "pool_health": health,
+            "pool_metrics": metrics, "probe": probe_results}
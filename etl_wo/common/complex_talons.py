@@ -0,0 +1,73 @@
+# common/complex_talons.py
+import numpy as np
+import pandas as pd
+
+# Ключ группы талона: несколько строк с одной парой (talon, source) - комплексный талон
+COMPLEX_KEY = ["talon", "source"]
+
+
+def key_hashes(df: pd.DataFrame) -> np.ndarray:
+    """64-битные хэши пар (talon, source); строки с пустым talon или source (их groupby пропускает) - без хэша."""
+    keys = df[COMPLEX_KEY].dropna()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def complex_mask(df: pd.DataFrame, complex_keys: np.ndarray = None) -> np.ndarray:
+    """
+    Признак комплексного талона для каждой строки за один проход по ключевым столбцам: пара (talon, source)
+    встречается больше одного раза. Строки с пустым talon или source комплексными не считаются
+    (как в прежнем цикле по groupby, который такие строки пропускал).
+
+    :param complex_keys: Хэши комплексных пар по всему файлу (см. key_hashes) - для порции потока,
+                         в которой повторы пары могут быть не видны.
+    :return: Булев массив numpy длины len(df).
+    """
+    keyed = df[COMPLEX_KEY].notna().all(axis=1).to_numpy()
+    if complex_keys is not None:
+        mask = np.zeros(len(df), dtype=bool)
+        mask[keyed] = np.isin(key_hashes(df), complex_keys)
+        return mask
+    return df.duplicated(COMPLEX_KEY, keep=False).to_numpy() & keyed
+
+
+def latest_file_mask(df: pd.DataFrame, file_rows: list, key: list = COMPLEX_KEY) -> np.ndarray:
+    """
+    Строки, которые остаются при объединении нескольких выгрузок (строки файлов идут подряд, от старых к новым):
+    для каждой пары (talon, source) - только строки самого нового файла, в котором она есть. Иначе талон,
+    попавший в две пересекающиеся выгрузки, выглядел бы как комплексный. Строки с пустым ключом остаются.
+
+    :param file_rows: Число строк каждого файла в порядке объединения.
+    :param key: Ключевые столбцы (по умолчанию COMPLEX_KEY; до переименования - исходные имена столбцов).
+    :return: Булев массив numpy длины len(df).
+    """
+    file_index = np.repeat(np.arange(len(file_rows)), file_rows)
+    keyed = df[key].notna().all(axis=1).to_numpy()
+    hashes = pd.util.hash_pandas_object(df[key], index=False).to_numpy()
+    latest = pd.Series(file_index).groupby(hashes).transform("max").to_numpy()
+    return (file_index == latest) | ~keyed
+
+
+def split_complex(df: pd.DataFrame, mask: np.ndarray) -> tuple:
+    """
+    Делит DataFrame на обычные и комплексные строки по маске: каждая часть выбирается одним take
+    (без промежуточного среза и .copy()); если комплексных строк нет, обычные - это сам df.
+
+    :return: Кортеж (обычные строки, комплексные строки).
+    """
+    if not mask.any():
+        return df, df.iloc[:0]
+    if mask.all():
+        return df.iloc[:0], df
+    return df.take(np.flatnonzero(~mask)), df.take(np.flatnonzero(mask))
+
+
+def classify_complex(df: pd.DataFrame, complex_keys: np.ndarray = None) -> tuple:
+    """
+    Проставляет признак is_complex и делит строки на обычные и комплексные.
+
+    :return: Кортеж (df с is_complex, обычные строки, комплексные строки).
+    """
+    mask = complex_mask(df, complex_keys)
+    df["is_complex"] = mask
+    normal, complex_rows = split_complex(df, mask)
+    return df, normal, complex_rows
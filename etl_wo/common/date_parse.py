@@ -0,0 +1,98 @@
+# common/date_parse.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.config.config import STATE_DIR
+
+# Формат дат в выгрузках (Квазар, талоны): дд.мм.гггг
+DEFAULT_DATE_FORMAT = "%d.%m.%Y"
+# Значения, которые считаются пустой датой, а не ошибкой ("-" - заглушка трансформаций)
+MISSING_DATES = ("", "-")
+# Отчёты о нераспознанных датах: STATE_DIR/rejects/<таблица>/<run_id>.csv
+REJECTS_DIR = os.path.join(STATE_DIR, "rejects")
+REJECT_COLUMNS = ["column", "row", "value"]
+
+
+def parse_dates(series: pd.Series, date_format: str = DEFAULT_DATE_FORMAT) -> tuple:
+    """
+    Разбирает столбец дат, обрабатывая каждую различную строку один раз: factorize даёт коды и различные
+    значения, разбираются только различные значения, а результат раскладывается по строкам одним take.
+
+    :param date_format: Формат strptime или "mixed" (формат каждого значения определяется отдельно, день первым);
+                        None - формат определяется по первому значению, как в pd.to_datetime(dayfirst=True).
+    :return: Кортеж (столбец datetime64 с NaT для пустых и нераспознанных значений,
+             булев массив нераспознанных значений длины len(series)).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, np.zeros(len(series), dtype=bool)
+    codes, uniques = pd.factorize(series)
+    text = pd.Index(uniques, dtype=object).astype(str).str.strip()
+    parsed = pd.to_datetime(text, format=date_format or None, dayfirst=True, errors="coerce")
+    rejected = np.asarray(parsed.isna()) & ~np.asarray(text.isin(MISSING_DATES))
+    # Код -1 (пропуск) указывает на добавленный в конец NaT
+    values = np.append(parsed.to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT", "ns"))
+    result = pd.Series(values[codes], index=series.index, name=series.name)
+    return result, np.append(rejected, False)[codes]
+
+
+def reject_frame(column: str, series: pd.Series, mask: np.ndarray) -> pd.DataFrame:
+    """Строки отчёта о нераспознанных значениях столбца: столбец, номер строки и исходное значение."""
+    return pd.DataFrame({"column": column, "row": series.index[mask], "value": series[mask].to_numpy()},
+                        columns=REJECT_COLUMNS)
+
+
+def reject_report_path(table_name: str, run_id: str) -> str:
+    return os.path.join(REJECTS_DIR, table_name, f"{run_id}.csv")
+
+
+def clear_rejects(path: str):
+    """Удаляет отчёт перед повторной трансформацией в том же запуске (чтобы строки отчёта не повторялись)."""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def write_rejects(path: str, rejects: list) -> int:
+    """
+    Дописывает строки отчёта (список DataFrame из reject_frame) в CSV-файл отчёта; заголовок пишется,
+    если файла ещё нет (при потоковой загрузке отчёт пополняется каждой порцией).
+
+    :return: Число записанных строк.
+    """
+    rejects = [frame for frame in rejects if len(frame)]
+    if not rejects:
+        return 0
+    report = pd.concat(rejects, ignore_index=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+    return len(report)
+
+
+def summarize_rejects(path: str) -> dict:
+    """Число нераспознанных значений по столбцам из файла отчёта (пустой словарь, если отчёта нет)."""
+    if not os.path.exists(path):
+        return {}
+    return pd.read_csv(path, usecols=["column"])["column"].value_counts().to_dict()
+
+
+def dates_to_objects(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Готовит столбцы datetime64 к построчной вставке и COPY в формате CSV: даты без времени становятся
+    datetime.date, остальные значения - datetime, NaT - None (NULL в БД).
+    """
+    columns = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    if not columns:
+        return df
+    df = df.copy(deep=False)
+    for col in columns:
+        series = df[col]
+        if (series.dropna().dt.normalize() == series.dropna()).all():
+            values = series.dt.date
+        elif series.dt.tz is None:
+            # datetime64[us] -> объекты numpy переводит в datetime (to_pydatetime в pandas 2.2 устарел)
+            values = series.to_numpy(dtype="datetime64[us]").astype(object)
+        else:
+            values = series.astype(object)
+        df[col] = pd.Series(values, index=series.index, dtype=object).where(series.notna(), None)
+    return df
@@ -0,0 +1,252 @@
+# common/db_pool.py
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from dagster import ConfigurableResource
+
+from etl_wo.config.config import DATABASES, ORGANIZATIONS, config as env_config
+
+# Пулы соединений процесса: {(имя пула, параметры подключения): ConnectionPool}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 для одной базы. Соединения переиспользуются между ассетами и потоками процесса.
+
+    При выдаче соединение, простаивавшее дольше health_check_interval секунд, проверяется запросом SELECT 1;
+    неисправные соединения закрываются и заменяются новыми. При возврате незавершённая транзакция откатывается.
+    Если все max_connections соединений заняты, запрос ждёт освобождения не дольше acquire_timeout секунд.
+    """
+
+    def __init__(self, name: str, params: dict, max_connections: int = 8, health_check_interval: float = 30.0,
+                 acquire_timeout: float = 60.0):
+        self.name = name
+        self.params = params
+        self.max_connections = max_connections
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle = []
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {"created": 0, "reused": 0, "discarded": 0, "health_checks": 0, "failed_health_checks": 0,
+                       "connect_seconds": 0.0, "wait_seconds": 0.0}
+
+    def _connect(self, context=None, connect_timeout: int = None):
+        started = time.perf_counter()
+        params = self.params if connect_timeout is None else {**self.params, "connect_timeout": connect_timeout}
+        try:
+            conn = psycopg2.connect(**params)
+        except Exception as e:
+            err_msg = f"❌ Ошибка подключения к базе {self.params.get('dbname')} ({self.name}): {e}"
+            if context:
+                context.log.info(err_msg)
+            else:
+                print(err_msg)
+            raise ValueError(err_msg)
+        with self._condition:
+            self._stats["created"] += 1
+            self._stats["connect_seconds"] += time.perf_counter() - started
+        success_msg = f"✅ Подключение к базе {self.params.get('dbname')} ({self.name}) успешно!"
+        if context:
+            context.log.info(success_msg)
+        else:
+            print(success_msg)
+        return conn
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        with self._condition:
+            self._stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._condition:
+                self._stats["failed_health_checks"] += 1
+            return False
+
+    def acquire(self, context=None, timeout: float = None, connect_timeout: int = None):
+        """
+        Выдаёт соединение из пула (или открывает новое, если свободных нет и лимит не достигнут).
+
+        :param timeout: (Опционально) Сколько секунд ждать свободного соединения (по умолчанию acquire_timeout).
+        :param connect_timeout: (Опционально) Тайм-аут открытия нового соединения, секунд (connect_timeout libpq).
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            while not self._idle and self._in_use >= self.max_connections:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise PoolError(f"Connection pool '{self.name}' exhausted: {self.max_connections} connections "
+                                    f"in use for {timeout} s.")
+                self._condition.wait(remaining)
+            idle = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._stats["wait_seconds"] += time.monotonic() - started
+
+        try:
+            if idle is not None:
+                conn, idle_since = idle
+                if self._is_healthy(conn, idle_since):
+                    with self._condition:
+                        self._stats["reused"] += 1
+                    return conn
+                self._close(conn)
+            return self._connect(context, connect_timeout)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        """Возвращает соединение в пул; незавершённая транзакция откатывается, сломанное соединение закрывается."""
+        if not conn.closed and not discard:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if conn.closed or discard:
+            self._close(conn)
+        with self._condition:
+            self._in_use -= 1
+            if not conn.closed:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def _close(self, conn):
+        with self._condition:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, context=None, timeout: float = None, connect_timeout: int = None):
+        """
+        Контекстный менеджер соединения из пула. Фиксация транзакции остаётся за вызывающим кодом:
+        если блок завершился без COMMIT или с ошибкой, транзакция откатывается при возврате в пул.
+        Параметры timeout и connect_timeout - как у acquire.
+        """
+        conn = self.acquire(context, timeout, connect_timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def health_check(self) -> dict:
+        """Проверяет доступность базы через соединение из пула: {"ok", "latency_ms", "error"}."""
+        started = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1), "error": None}
+        except Exception as e:
+            return {"ok": False, "latency_ms": round((time.perf_counter() - started) * 1000, 1), "error": str(e)}
+
+    def metrics(self) -> dict:
+        """Счётчики пула: открытые, переиспользованные и закрытые соединения, время подключений и ожидания."""
+        with self._condition:
+            return {"in_use": self._in_use, "idle": len(self._idle), "max_connections": self.max_connections,
+                    **{key: round(value, 3) if isinstance(value, float) else value
+                       for key, value in self._stats.items()}}
+
+    def close(self):
+        """Закрывает все свободные соединения пула."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+def get_pool(name: str, params: dict, **settings) -> ConnectionPool:
+    """Возвращает общий для процесса пул для заданных параметров подключения (создаёт при первом обращении)."""
+    key = (name, tuple(sorted(params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(name, params, **settings)
+        return _pools[key]
+
+
+def pool_metrics() -> dict:
+    """Метрики всех пулов процесса: {имя пула: metrics()}."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.metrics() for pool in pools}
+
+
+def close_pools():
+    """Закрывает свободные соединения всех пулов процесса (вызывается при завершении процесса)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
+
+
+class DatabaseResource(ConfigurableResource):
+    """
+    Dagster-ресурс доступа к базам: пул соединений на каждый ключ подключения, общий для всех ассетов,
+    выполняемых в одном процессе. Заменяет открытие отдельного соединения в каждой операции.
+    """
+    max_connections: int = 8
+    health_check_interval: float = 30.0
+    acquire_timeout: float = 60.0
+
+    def _settings(self) -> dict:
+        return {"max_connections": self.max_connections, "health_check_interval": self.health_check_interval,
+                "acquire_timeout": self.acquire_timeout}
+
+    def pool(self, db_alias: str = "default", context=None, organization: str = ORGANIZATIONS) -> ConnectionPool:
+        """
+        Пул для базы из DATABASES (config/config.py).
+
+        :param db_alias: Ключ конфигурации в DATABASES (по умолчанию 'default')
+        :param context: (Опционально) Dagster context для логирования
+        :param organization: Название организации (для сообщений)
+        """
+        if db_alias not in DATABASES:
+            err_msg = f"❌ Конфигурация для базы '{db_alias}' в организации '{organization}' не найдена."
+            if context:
+                context.log.info(err_msg)
+            else:
+                print(err_msg)
+            raise ValueError(err_msg)
+        db_config = DATABASES[db_alias]
+        params = {key: db_config[key] for key in ("dbname", "user", "password", "host", "port")}
+        return get_pool(db_alias, params, **self._settings())
+
+    def organization_pool(self, org: str = "local") -> ConnectionPool:
+        """Пул для базы организации из config["organizations"] (используется джобами talon)."""
+        organizations = env_config.get("organizations", {})
+        if org not in organizations:
+            raise ValueError(f"База {org} не найдена в .env")
+        db_config = organizations[org]
+        params = {key: db_config[key] for key in ("dbname", "user", "password", "host", "port")}
+        return get_pool(f"org:{org}", params, **self._settings())
+
+    def connection(self, db_alias: str = "default", context=None):
+        """Контекстный менеджер соединения из пула базы db_alias."""
+        return self.pool(db_alias, context).connection(context)
+
+    def metrics(self) -> dict:
+        """Метрики всех пулов процесса."""
+        return pool_metrics()
@@ -0,0 +1,68 @@
+# common/dedup.py
+import numpy as np
+import pandas as pd
+
+# Правила удаления повторяющихся ключей в пачке:
+# "none" - не удалять (при повторе ключей set-based upsert переключится на построчную загрузку),
+# "first" - оставить первую строку, "last" - оставить последнюю (так же, как при построчном upsert),
+# "latest:<столбец>" - оставить строку с наибольшим значением столбца (например, latest:last_change_date)
+DEDUP_RULES = ("none", "first", "last", "latest:<column>")
+DEFAULT_DEDUP_RULE = "last"
+
+
+def parse_dedup_rule(rule: str) -> tuple:
+    """
+    Разбирает правило удаления дубликатов.
+
+    :return: Кортеж (keep, column): keep - "none", "first", "last" или "latest", column - столбец для "latest".
+    """
+    keep, _, column = (rule or DEFAULT_DEDUP_RULE).strip().partition(":")
+    if keep in ("none", "first", "last") and not column:
+        return keep, None
+    if keep == "latest" and column:
+        return keep, column.strip()
+    raise ValueError(f"Unknown dedup rule '{rule}'. Expected one of: {', '.join(DEDUP_RULES)}.")
+
+
+def order_values(series: pd.Series) -> pd.Series:
+    """
+    Значения столбца для сравнения в правиле "latest": числа и даты - как есть,
+    строки - как даты в формате выгрузок (день первым); нераспознанные значения считаются самыми старыми.
+    """
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, dayfirst=True, errors="coerce")
+
+
+def drop_duplicate_keys(data: pd.DataFrame, key_columns: list, rule: str = DEFAULT_DEDUP_RULE) -> tuple:
+    """
+    Оставляет по одной строке на каждое значение ключевых столбцов. Порядок оставшихся строк сохраняется.
+
+    :param data: DataFrame с данными пачки.
+    :param key_columns: Ключевые столбцы (column_check из mapping.json).
+    :param rule: Правило выбора строки (см. DEDUP_RULES).
+    :return: Кортеж (DataFrame без повторяющихся ключей, число удалённых строк).
+    """
+    keep, column = parse_dedup_rule(rule)
+    if keep == "none" or data.empty:
+        return data, 0
+
+    if keep == "latest":
+        if column not in data.columns:
+            raise ValueError(f"Dedup column '{column}' not found in data.")
+        # При равных значениях (и отсутствии даты) побеждает более поздняя строка пачки
+        ranked = pd.DataFrame({
+            "_dedup_order": order_values(data[column]).to_numpy(),
+            "_dedup_position": np.arange(len(data)),
+        })
+        ranked[key_columns] = data[key_columns].to_numpy()
+        ranked = ranked.sort_values(["_dedup_order", "_dedup_position"], na_position="first", kind="mergesort")
+        keep_mask = np.zeros(len(data), dtype=bool)
+        keep_mask[ranked.drop_duplicates(subset=key_columns, keep="last")["_dedup_position"].to_numpy()] = True
+    else:
+        keep_mask = ~data.duplicated(subset=key_columns, keep=keep).to_numpy()
+
+    removed = len(data) - int(keep_mask.sum())
+    if not removed:
+        return data, 0
+    return data[keep_mask], removed
@@ -0,0 +1,145 @@
+# common/health_probe.py
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from etl_wo.common.table_stats import table_row_count, describe_row_count
+
+# Права, которые нужны загрузке (SELECT - проверка и подсчёт, INSERT/UPDATE/DELETE - upsert и замена групп)
+PROBE_PRIVILEGES = ("SELECT", "INSERT", "UPDATE", "DELETE")
+# Общий бюджет времени проверки всех таблиц по умолчанию, секунд
+DEFAULT_TIME_BUDGET = 5.0
+# Сколько секунд после исчерпания бюджета ждать, пока отменённые проверки вернут соединения в пул
+CANCEL_GRACE = 1.0
+
+
+class ActiveProbes:
+    """
+    Соединения выполняющихся проверок. По истечении бюджета времени их запросы отменяются на сервере
+    (conn.cancel()), поэтому потоки проверок быстро завершаются и возвращают соединения в пул;
+    проверки, получившие соединение после отмены, сразу завершаются ошибкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._cancelled = False
+
+    def start(self, table_name: str, conn):
+        with self._lock:
+            if self._cancelled:
+                raise TimeoutError("проверка отменена: бюджет времени исчерпан")
+            self._connections[table_name] = conn
+
+    def finish(self, table_name: str):
+        with self._lock:
+            self._connections.pop(table_name, None)
+
+    def cancel(self) -> int:
+        """Отменяет запросы всех выполняющихся проверок. :return: Число отменённых проверок."""
+        with self._lock:
+            self._cancelled = True
+            connections = list(self._connections.values())
+        for conn in connections:
+            try:
+                conn.cancel()
+            except Exception:
+                pass
+        return len(connections)
+
+
+def probe_table(pool, table_name: str, timeout_ms: int, full_count: bool = False, connect_timeout: int = None,
+                active: ActiveProbes = None) -> dict:
+    """
+    Лёгкая проверка одной таблицы в отдельном соединении из пула: существование, права текущего пользователя
+    и число строк (оценка из статистики каталога или COUNT(*) при full_count=True).
+    Каждый запрос ограничен statement_timeout = timeout_ms, ожидание свободного соединения пула - timeout_ms,
+    открытие нового соединения - connect_timeout секунд.
+
+    :param active: (Опционально) Реестр выполняющихся проверок, через который probe_tables отменяет запросы.
+
+    :return: Словарь {"table", "ok", "exists", "missing_privileges", "latency_ms", "error", ...число строк}.
+    """
+    started = time.perf_counter()
+    result = {"table": table_name, "ok": False, "exists": None, "missing_privileges": [], "error": None}
+    try:
+        with pool.connection(timeout=timeout_ms / 1000, connect_timeout=connect_timeout) as conn:
+            if active is not None:
+                active.start(table_name, conn)
+            try:
+                _probe_queries(conn, table_name, full_count, timeout_ms, result)
+            finally:
+                if active is not None:
+                    active.finish(table_name)
+    except Exception as e:
+        result["error"] = str(e).strip()
+    result["ok"] = bool(result["exists"]) and not result["missing_privileges"] and result["error"] is None
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _probe_queries(conn, table_name: str, full_count: bool, timeout_ms: int, result: dict):
+    """Запросы проверки таблицы; их результаты записываются в result."""
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = %s;", (timeout_ms,))
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name,))
+        result["exists"] = cursor.fetchone()[0]
+        if result["exists"]:
+            cursor.execute(
+                "SELECT " + ", ".join(["has_table_privilege(%s, %s)"] * len(PROBE_PRIVILEGES)) + ";",
+                [value for privilege in PROBE_PRIVILEGES for value in (table_name, privilege)]
+            )
+            granted = cursor.fetchone()
+            result["missing_privileges"] = [privilege for privilege, has in zip(PROBE_PRIVILEGES, granted) if not has]
+            result.update(table_row_count(cursor, table_name, full_count=full_count))
+
+
+def probe_tables(pool, tables: list, time_budget: float = DEFAULT_TIME_BUDGET, full_count: bool = False) -> dict:
+    """
+    Проверяет все таблицы одновременно (не больше max_connections пула) в пределах общего бюджета времени.
+    Таблицы, не успевшие за time_budget секунд, возвращаются с ошибкой "timeout". Их запросы отменяются
+    на сервере, а соединения возвращаются в пул (ожидание - не дольше CANCEL_GRACE секунд); проверки,
+    ещё ждущие соединения, ограничены тем же бюджетом, а открытие соединения - connect_timeout.
+
+    :return: Словарь {имя таблицы: результат probe_table}.
+    """
+    timeout_ms = max(int(time_budget * 1000), 1)
+    # connect_timeout libpq - целые секунды
+    connect_timeout = max(math.ceil(time_budget), 1)
+    active = ActiveProbes()
+    executor = ThreadPoolExecutor(max_workers=max(min(len(tables), pool.max_connections), 1))
+    futures = {executor.submit(probe_table, pool, table, timeout_ms, full_count, connect_timeout, active): table
+               for table in tables}
+    done, pending = wait(futures, timeout=time_budget)
+    executor.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        active.cancel()
+        wait(pending, timeout=CANCEL_GRACE)
+
+    results = {}
+    for future, table in futures.items():
+        if future in done:
+            results[table] = future.result()
+        else:
+            results[table] = {"table": table, "ok": False, "exists": None, "missing_privileges": [],
+                              "error": f"timeout: не уложились в {time_budget} с", "latency_ms": time_budget * 1000}
+    return results
+
+
+def probe_metadata(results: dict) -> dict:
+    """Метаданные ассета: задержка проверки каждой таблицы и сводка по проверке."""
+    metadata = {f"probe_latency_ms/{table}": result["latency_ms"] for table, result in results.items()}
+    metadata["probe_failed_tables"] = [table for table, result in results.items() if not result["ok"]]
+    metadata["probe_results"] = results
+    return metadata
+
+
+def describe_probe(result: dict) -> str:
+    """Текст результата проверки таблицы для лога."""
+    if result["error"]:
+        return f"ошибка: {result['error']} ({result['latency_ms']} мс)"
+    if not result["exists"]:
+        return f"таблица не найдена ({result['latency_ms']} мс)"
+    privileges = f", нет прав: {', '.join(result['missing_privileges'])}" if result["missing_privileges"] else ""
+    return f"{describe_row_count(result)}{privileges} ({result['latency_ms']} мс)"
@@ -0,0 +1,76 @@
+# common/ingest_ledger.py
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from etl_wo.config.config import STATE_DIR
+
+# Журнал загруженных файлов: по одному JSON на содержимое файла, STATE_DIR/ledger/<таблица>/<размер>-<sha256>.json.
+# Размер в имени позволяет не считать хэш файла, если файлов такого размера таблица ещё не загружала.
+LEDGER_DIR = os.path.join(STATE_DIR, "ledger")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками, целиком в память не загружается)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ledger_path(table_name: str, size: int, digest: str) -> str:
+    return os.path.join(LEDGER_DIR, table_name, f"{size}-{digest}.json")
+
+
+def describe_file(file_path: str) -> dict:
+    """Размер и хэш содержимого файла для журнала: {"file", "size", "content_hash"}."""
+    return {"file": file_path, "size": os.path.getsize(file_path), "content_hash": file_digest(file_path)}
+
+
+def find_ingested(table_name: str, file_path: str) -> tuple:
+    """
+    Ищет в журнале файл с тем же содержимым, уже загруженный в таблицу (имя файла не важно).
+    Хэш считается, только если в журнале таблицы есть файлы того же размера.
+
+    :return: Кортеж (запись журнала или None, описание файла или None, если хэш не понадобился).
+    """
+    size = os.path.getsize(file_path)
+    if not glob.glob(os.path.join(LEDGER_DIR, glob.escape(table_name), f"{size}-*.json")):
+        return None, None
+    info = describe_file(file_path)
+    path = ledger_path(table_name, size, info["content_hash"])
+    if not os.path.exists(path):
+        return None, info
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), info
+    except (OSError, ValueError):
+        return None, info
+
+
+def record_ingested(table_name: str, info: dict, run_id: str = None, row_count: int = None):
+    """Записывает в журнал успешно загруженный файл (info - результат describe_file) с run id и числом строк."""
+    path = ledger_path(table_name, info["size"], info["content_hash"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {
+        "table_name": table_name,
+        "content_hash": info["content_hash"],
+        "size": info["size"],
+        "file_name": os.path.basename(info["file"]),
+        "run_id": run_id,
+        "row_count": row_count,
+        "ingested_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def describe_entry(entry: dict) -> str:
+    """Текст записи журнала для лога."""
+    return (f"уже загружен {entry.get('ingested_at')} как {entry.get('file_name')} "
+            f"(run {entry.get('run_id')}, строк: {entry.get('row_count')})")
@@ -0,0 +1,70 @@
+# common/load_checkpoint.py
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from etl_wo.config.config import STATE_DIR
+
+CHECKPOINT_DIR = os.path.join(STATE_DIR, "checkpoints")
+
+
+def content_hash(data: pd.DataFrame) -> str:
+    """SHA-256 содержимого DataFrame (значения и порядок строк), по нему проверяется, что повтор грузит те же данные."""
+    row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(",".join(map(str, data.columns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def checkpoint_path(table_name: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"{table_name}.json")
+
+
+def read_checkpoint(table_name: str) -> dict:
+    """Возвращает сохранённую контрольную точку загрузки таблицы или пустой словарь."""
+    path = checkpoint_path(table_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(table_name: str, source_file: str, data_hash: str, offset: int, chunk_size: int):
+    """
+    Сохраняет контрольную точку после фиксации очередной порции.
+    Файл сначала пишется во временный и затем атомарно заменяет прежний.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(table_name)
+    state = {
+        "table_name": table_name,
+        "source_file": source_file,
+        "content_hash": data_hash,
+        "offset": offset,
+        "chunk_size": chunk_size,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def clear_checkpoint(table_name: str):
+    """Удаляет контрольную точку после успешного завершения загрузки."""
+    path = checkpoint_path(table_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def resume_offset(table_name: str, source_file: str, data_hash: str) -> int:
+    """
+    Смещение, с которого нужно продолжить загрузку: строки до него уже зафиксированы прошлой попыткой.
+    Если контрольная точка относится к другому файлу или другим данным, загрузка начинается сначала.
+    """
+    state = read_checkpoint(table_name)
+    if state.get("content_hash") == data_hash and state.get("source_file") == source_file:
+        return state.get("offset", 0)
+    return 0
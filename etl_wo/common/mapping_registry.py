@@ -0,0 +1,202 @@
+# common/mapping_registry.py
+import codecs
+import hashlib
+import json
+import os
+import threading
+
+from etl_wo.common.categorical import validate_hint
+from etl_wo.common.sql_templates import IDENTIFIER_RE, upsert_sql
+from etl_wo.common.transform_pipeline import DEFAULT_PIPELINE, parse_stages
+
+# Парсеры CSV (ключ "engine" таблицы в mapping.json): "c" - парсер pandas, строки хранятся как объекты Python;
+# "pyarrow" - многопоточный парсер Arrow, строки хранятся в буферах Arrow (тип string[pyarrow])
+CSV_ENGINES = ("c", "pyarrow")
+
+# Загруженные файлы маппинга процесса: {абсолютный путь: {"stamp", "mappings", "plans", "errors"}}.
+# Файл читается заново, только если изменились его время изменения или размер.
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def read_options(table_config: dict) -> dict:
+    """
+    Параметры чтения CSV для таблицы из mapping.json: кодировка, разделитель и парсер ("engine", см. CSV_ENGINES).
+
+    :raises ValueError: Если указан неизвестный парсер.
+    """
+    engine = table_config.get("engine", "c")
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine '{engine}'. Expected one of: {', '.join(CSV_ENGINES)}.")
+    return {
+        "encoding": table_config.get("encoding", "utf-8"),
+        "delimiter": table_config.get("delimiter", ","),
+        "engine": engine,
+    }
+
+
+def validate_table(table_name: str, table_config: dict) -> list:
+    """Ошибки настроек одной таблицы mapping.json (пустой список - настройки корректны)."""
+    errors = []
+    if not isinstance(table_config, dict):
+        return [f"{table_name}: настройки таблицы должны быть объектом"]
+    if not all(IDENTIFIER_RE.match(part) for part in table_name.split(".")):
+        errors.append(f"{table_name}: недопустимое имя таблицы")
+    # Раздел "file" нужен только таблицам, файлы которых ищет extract
+    file_config = table_config.get("file")
+    if file_config is not None and (not isinstance(file_config, dict) or not file_config.get("file_pattern")):
+        errors.append(f"{table_name}: не задан file.file_pattern")
+
+    fields = table_config.get("mapping_fields")
+    if not isinstance(fields, dict) or not fields:
+        errors.append(f"{table_name}: mapping_fields должен быть непустым объектом")
+        fields = {}
+    targets = list(fields.values())
+    invalid = [target for target in targets if not isinstance(target, str) or not IDENTIFIER_RE.match(target)]
+    if invalid:
+        errors.append(f"{table_name}: недопустимые имена столбцов в mapping_fields: {invalid}")
+    repeated = sorted({target for target in targets if targets.count(target) > 1})
+    if repeated:
+        errors.append(f"{table_name}: несколько столбцов файла переименовываются в {repeated}")
+
+    conflict_columns = table_config.get("column_check", [])
+    if not isinstance(conflict_columns, list):
+        errors.append(f"{table_name}: column_check должен быть списком")
+    else:
+        missing = [col for col in conflict_columns if col not in targets]
+        if missing:
+            errors.append(f"{table_name}: ключевых столбцов {missing} нет среди mapping_fields")
+
+    try:
+        codecs.lookup(table_config.get("encoding", "utf-8"))
+    except (LookupError, TypeError):
+        errors.append(f"{table_name}: неизвестная кодировка '{table_config.get('encoding')}'")
+    delimiter = table_config.get("delimiter", ",")
+    if not isinstance(delimiter, str) or len(delimiter) != 1:
+        errors.append(f"{table_name}: разделитель должен быть одним символом, задан '{delimiter}'")
+    try:
+        read_options(table_config)
+    except ValueError as e:
+        errors.append(f"{table_name}: {e}")
+    errors.extend(f"{table_name}: {error}" for error in validate_hint(table_config.get("categorical")))
+    try:
+        parse_stages(table_config.get("pipeline", DEFAULT_PIPELINE))
+    except ValueError as e:
+        errors.append(f"{table_name}: {e}")
+    return errors
+
+
+def compile_plan(table_name: str, table_config: dict) -> dict:
+    """
+    План обработки таблицы, собираемый один раз при загрузке mapping.json:
+      - "read_options": параметры чтения CSV, "file_mask": шаблон имени файла;
+      - "usecols": столбцы файла, которые нужно читать (остальные трансформация отбрасывает),
+        "rename": переименование столбцов файла, "columns": столбцы после переименования;
+      - "conflict_columns": ключевые столбцы (column_check), "dedup": правило удаления повторов ключей;
+      - "upsert_sql": построчный upsert для столбцов маппинга;
+      - "pipeline": этапы трансформации (ключ "pipeline", см. transform_pipeline, по умолчанию DEFAULT_PIPELINE);
+      - "categorical": подсказка, какие столбцы хранить категориями (см. categorical.encode_categories);
+      - "version": хэш настроек таблицы (меняется при любом изменении её маппинга).
+    """
+    file_config = table_config.get("file", {})
+    rename = dict(table_config.get("mapping_fields", {}))
+    columns = list(rename.values())
+    conflict_columns = list(table_config.get("column_check", []))
+    options = read_options(table_config)
+    version = hashlib.sha256(json.dumps(table_config, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return {
+        "table_name": table_name,
+        "config": table_config,
+        "file_mask": f"{file_config.get('file_pattern', '')}.{file_config.get('file_format', '')}",
+        "read_options": options,
+        "usecols": list(rename),
+        "rename": rename,
+        "columns": columns,
+        "conflict_columns": conflict_columns,
+        "dedup": table_config.get("dedup"),
+        "upsert_sql": upsert_sql(table_name, tuple(columns), tuple(conflict_columns)) if conflict_columns else None,
+        "pipeline": parse_stages(table_config.get("pipeline", DEFAULT_PIPELINE)),
+        "categorical": table_config.get("categorical"),
+        "version": version.hexdigest()[:16],
+    }
+
+
+def load_mapping(mapping_file: str, context=None) -> dict:
+    """
+    Настройки из mapping.json, прочитанные и проверенные один раз на процесс: повторные вызовы возвращают
+    сохранённый результат, пока не изменились время изменения или размер файла.
+    Таблица с ошибками в настройках не мешает остальным: для неё нет плана, ошибки сохраняются в "errors"
+    и выдаются как исключение только при обращении к этой таблице (см. table_plan).
+
+    :return: Словарь {"mappings": содержимое файла, "plans": {таблица: план compile_plan},
+             "errors": {таблица: список ошибок настроек}}.
+    :raises FileNotFoundError: Если файла нет.
+    :raises ValueError: Если файл не является корректным JSON или в нём нет объекта "tables".
+    """
+    path = os.path.abspath(mapping_file)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        if context:
+            context.log.error(f"❌ Файл маппинга {mapping_file} не найден.")
+        raise FileNotFoundError(f"Mapping file {mapping_file} not found.")
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _registry_lock:
+        entry = _registry.get(path)
+        if entry and entry["stamp"] == stamp:
+            return entry
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                mappings = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Mapping file {mapping_file} is not valid JSON: {e}")
+        tables = mappings.get("tables") if isinstance(mappings, dict) else None
+        if not isinstance(tables, dict):
+            raise ValueError(f"Mapping file {mapping_file} has no 'tables' object.")
+        errors = {}
+        for table_name, table_config in tables.items():
+            table_errors = validate_table(table_name, table_config)
+            if table_errors:
+                errors[table_name] = table_errors
+        if errors and context:
+            context.log.warning(f"⚠️ Ошибки в файле маппинга {mapping_file}, таблицы {sorted(errors)} недоступны: "
+                                f"{[error for table_errors in errors.values() for error in table_errors]}")
+        entry = {"stamp": stamp, "mappings": mappings,
+                 "plans": {table_name: compile_plan(table_name, table_config)
+                           for table_name, table_config in tables.items() if table_name not in errors},
+                 "errors": errors}
+        _registry[path] = entry
+        if context:
+            context.log.info(f"🗺️ Маппинг {mapping_file} загружен: таблиц {len(entry['plans'])}")
+        return entry
+
+
+def table_plan(mapping_file: str, table_name: str, context=None, required: bool = True) -> dict:
+    """
+    План таблицы из mapping.json (см. compile_plan).
+
+    :param required: Если False, для таблицы без настроек (например, таблицы комплексных талонов,
+                     которая загружается по ключам replace_keys) возвращается пустой словарь.
+    :raises ValueError: Если настройки таблицы содержат ошибки или таблицы нет в маппинге и required=True.
+    """
+    mapping = load_mapping(mapping_file, context)
+    errors = mapping["errors"].get(table_name)
+    if errors:
+        if context:
+            context.log.error(f"❌ Ошибки в настройках таблицы '{table_name}' в {mapping_file}: {errors}")
+        raise ValueError(f"Invalid mapping for table {table_name} in {mapping_file}: {'; '.join(errors)}")
+    plan = mapping["plans"].get(table_name)
+    if plan is None and not required:
+        return {}
+    if plan is None:
+        if context:
+            context.log.error(f"❌ Настройки для таблицы '{table_name}' не найдены в {mapping_file}.")
+        raise ValueError(f"❌ Настройки для таблицы '{table_name}' не найдены.")
+    return plan
+
+
+def clear_registry():
+    """Сбрасывает загруженные файлы маппинга (следующее обращение прочитает файл заново)."""
+    with _registry_lock:
+        _registry.clear()
@@ -0,0 +1,84 @@
+# common/parallel_load.py
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+import pandas as pd
+
+# Правила обработки ошибок при параллельной загрузке:
+# "all_or_nothing" - партиции фиксируются только если все успешно записаны, иначе откатываются все;
+# "independent" - каждая партиция фиксируется сама, ошибки остальных её не откатывают.
+PARTITION_POLICIES = ("all_or_nothing", "independent")
+
+
+def partition_frame(data: pd.DataFrame, key_columns: list, partitions: int) -> list:
+    """
+    Делит DataFrame на непересекающиеся партиции по хэшу ключевых столбцов.
+    Все строки с одинаковым ключом попадают в одну партицию, поэтому разные соединения
+    никогда не пишут одни и те же строки целевой таблицы.
+    """
+    buckets = pd.util.hash_pandas_object(data[key_columns], index=False).to_numpy() % partitions
+    return [data[buckets == number] for number in range(partitions)]
+
+
+def load_partitions(context, table_name: str, parts: list, connection, write, policy: str = "all_or_nothing") -> list:
+    """
+    Загружает партиции одновременно, каждую - в своём соединении.
+
+    :param context: Dagster execution context.
+    :param table_name: Имя целевой таблицы (для логов).
+    :param parts: Список DataFrame-партиций (см. partition_frame).
+    :param connection: Функция без аргументов, возвращающая контекстный менеджер соединения psycopg2
+                       (например, ConnectionPool.connection из db_pool).
+    :param write: Функция write(conn, part) -> dict, записывающая партицию без фиксации транзакции.
+    :param policy: Правило обработки ошибок (см. PARTITION_POLICIES).
+    :return: Список результатов write по партициям.
+
+    При policy="all_or_nothing" транзакции фиксируются только после успешной записи всех партиций.
+    Фиксация нескольких соединений не атомарна: если COMMIT одной из партиций сорвётся после
+    фиксации предыдущих, они останутся записанными - это сообщается в логе и исключении.
+    """
+    if policy not in PARTITION_POLICIES:
+        raise ValueError(f"Unknown partition policy '{policy}'. Expected one of: {', '.join(PARTITION_POLICIES)}.")
+
+    with ExitStack() as stack:
+        connections = [stack.enter_context(connection()) for _ in parts]
+        return _run_partitions(context, table_name, parts, connections, write, policy)
+
+
+def _run_partitions(context, table_name: str, parts: list, connections: list, write, policy: str) -> list:
+    def run(number):
+        conn = connections[number]
+        try:
+            result = write(conn, parts[number])
+            if policy == "independent":
+                conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+        futures = [executor.submit(run, number) for number in range(len(parts))]
+    errors = {number: future.exception() for number, future in enumerate(futures) if future.exception()}
+
+    if errors and policy == "all_or_nothing":
+        for conn in connections:
+            conn.rollback()
+        context.log.error(f"❌ {table_name}: ошибки в партициях {sorted(errors)}, все партиции откачены.")
+    elif errors:
+        context.log.error(f"❌ {table_name}: ошибки в партициях {sorted(errors)}, "
+                          f"остальные {len(parts) - len(errors)} партиций зафиксированы.")
+    else:
+        if policy == "all_or_nothing":
+            for number, conn in enumerate(connections):
+                try:
+                    conn.commit()
+                except Exception as e:
+                    context.log.error(f"❌ {table_name}: не удалось зафиксировать партицию {number}, "
+                                      f"партиции {list(range(number))} уже зафиксированы: {e}")
+                    raise
+        return [future.result() for future in futures]
+
+    first_error = errors[min(errors)]
+    raise RuntimeError(f"Parallel load into {table_name} failed in partitions {sorted(errors)}: {first_error}") \
+        from first_error
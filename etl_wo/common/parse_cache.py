@@ -0,0 +1,84 @@
+# common/parse_cache.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.config.config import STATE_DIR
+
+# Кэш разобранных CSV: STATE_DIR/parse_cache/<sha256 файла>-<версия маппинга>-<формат>.parquet.
+# Повторный запуск после ошибки загрузки (или повторный запуск джоба) читает Parquet вместо разбора CSV.
+PARSE_CACHE_DIR = os.path.join(STATE_DIR, "parse_cache")
+# Предельный размер кэша, МБ: при превышении удаляются давно не использовавшиеся файлы (0 - кэш отключён)
+PARSE_CACHE_MAX_MB = int(os.environ.get("ETL_PARSE_CACHE_MB", "2048"))
+# Версия формата записей кэша: меняется, если меняется то, как extract разбирает файл
+PARSE_CACHE_FORMAT = 1
+
+
+def cache_path(content_hash: str, version: str) -> str:
+    """Файл записи кэша; version - версия плана таблицы (см. mapping_registry.compile_plan)."""
+    return os.path.join(PARSE_CACHE_DIR, f"{content_hash}-{version}-{PARSE_CACHE_FORMAT}.parquet")
+
+
+def read_cached(path: str, engine: str) -> pd.DataFrame:
+    """
+    Читает разобранный файл из кэша (None, если записи нет или она повреждена).
+    Строки возвращаются в том же виде, что и у парсера: string[pyarrow] для "pyarrow", объекты с NaN для "c".
+    """
+    if not os.path.exists(path):
+        return None
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        table = pq.read_table(path)
+    except (OSError, pa.ArrowException):
+        return None
+    # Отмечаем использование записи: вытеснение удаляет записи с самым старым временем изменения
+    os.utime(path)
+    if engine == "pyarrow":
+        string_types = {pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}
+        return table.to_pandas(types_mapper=string_types.get, ignore_metadata=True)
+    df = table.to_pandas(ignore_metadata=True)
+    return df.where(df.notna(), np.nan)
+
+
+def write_cached(path: str, df: pd.DataFrame) -> bool:
+    """Записывает разобранный файл в кэш (атомарно: через временный файл). Ошибка записи не прерывает чтение."""
+    import pyarrow as pa
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(f"{path}.tmp", engine="pyarrow", index=False)
+        os.replace(f"{path}.tmp", path)
+    except (OSError, pa.ArrowException):
+        return False
+    return True
+
+
+def evict(max_mb: int = PARSE_CACHE_MAX_MB) -> list:
+    """
+    Удаляет давно не использовавшиеся записи кэша, пока его размер больше max_mb.
+
+    :return: Имена удалённых файлов.
+    """
+    if not os.path.isdir(PARSE_CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(PARSE_CACHE_DIR):
+        if name.endswith(".parquet"):
+            stat = os.stat(os.path.join(PARSE_CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    limit = max_mb * 1024 * 1024
+    removed = []
+    for _, size, name in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(os.path.join(PARSE_CACHE_DIR, name))
+        except OSError:
+            continue
+        total -= size
+        removed.append(name)
+    return removed
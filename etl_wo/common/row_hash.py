@@ -0,0 +1,73 @@
+# common/row_hash.py
+import pandas as pd
+
+# Столбец DataFrame с хэшем строки (в целевую таблицу не загружается)
+ROW_HASH_COLUMN = "etl_row_hash"
+# Служебная таблица с последними загруженными хэшами строк: (table_name, row_key) -> row_hash
+ROW_HASH_TABLE = "etl_row_hashes"
+# Разделитель значений составного ключа в row_key
+KEY_SEPARATOR_SQL = "chr(31)"
+
+
+def add_row_hash(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Возвращает новый DataFrame со столбцом ROW_HASH_COLUMN - стабильным 64-битным хэшем строки
+    (исходный df не изменяется, столбцы данных не копируются).
+    Хэш считается по всем столбцам данных (кроме created_at/updated_at) в алфавитном порядке имён,
+    поэтому не зависит от порядка столбцов и одинаков между запусками для одинаковых значений.
+    """
+    hash_columns = sorted(
+        col for col in df.columns if col != ROW_HASH_COLUMN and col.lower() not in ("created_at", "updated_at")
+    )
+    hashes = pd.util.hash_pandas_object(df[hash_columns], index=False)
+    # uint64 -> int64 без изменения битов, чтобы значение помещалось в bigint
+    df = df.copy(deep=False)
+    df[ROW_HASH_COLUMN] = hashes.to_numpy().view("int64")
+    return df
+
+
+def ensure_row_hash_table(cursor):
+    """Создаёт служебную таблицу хэшей, если её ещё нет."""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ROW_HASH_TABLE} (
+        table_name varchar(128) NOT NULL,
+        row_key text NOT NULL,
+        row_hash bigint NOT NULL,
+        updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (table_name, row_key)
+    );
+    """)
+
+
+def row_key_sql(alias: str, key_columns: list) -> str:
+    """SQL-выражение ключа строки для служебной таблицы: значения ключевых столбцов через разделитель."""
+    return f"concat_ws({KEY_SEPARATOR_SQL}, {', '.join([f'{alias}.{col}::text' for col in key_columns])})"
+
+
+def drop_unchanged_rows(cursor, table_name: str, staging: str, key_columns: list) -> int:
+    """
+    Удаляет из staging-таблицы строки, хэш которых совпадает с сохранённым
+    и которые по-прежнему есть в целевой таблице.
+
+    :return: Число неизменившихся (пропущенных) строк.
+    """
+    key_match = " AND ".join([f"t.{col} = s.{col}" for col in key_columns])
+    cursor.execute(f"""
+    DELETE FROM {staging} s
+    USING {ROW_HASH_TABLE} h
+    WHERE h.table_name = %s
+      AND h.row_key = {row_key_sql('s', key_columns)}
+      AND h.row_hash = s.{ROW_HASH_COLUMN}
+      AND EXISTS (SELECT 1 FROM {table_name} t WHERE {key_match});
+    """, (table_name,))
+    return cursor.rowcount
+
+
+def save_row_hashes(cursor, table_name: str, staging: str, key_columns: list):
+    """Сохраняет хэши загруженных строк из staging-таблицы в служебную таблицу."""
+    cursor.execute(f"""
+    INSERT INTO {ROW_HASH_TABLE} (table_name, row_key, row_hash, updated_at)
+    SELECT %s, {row_key_sql('s', key_columns)}, s.{ROW_HASH_COLUMN}, CURRENT_TIMESTAMP FROM {staging} s
+    ON CONFLICT (table_name, row_key)
+    DO UPDATE SET row_hash = EXCLUDED.row_hash, updated_at = EXCLUDED.updated_at;
+    """, (table_name,))
@@ -0,0 +1,143 @@
+# common/schema_cache.py
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from etl_wo.config.config import STATE_DIR
+
+SCHEMA_CACHE_DIR = os.path.join(STATE_DIR, "schema")
+
+# Кэш в памяти процесса поверх файлов: {(db_alias, table_name): схема}
+_memory_cache = {}
+_memory_lock = threading.Lock()
+
+# Отпечаток описания таблицы в каталоге. xmin строк pg_class, pg_attribute и pg_index меняется при любом
+# ALTER TABLE, создании или удалении индексов, но не при VACUUM/ANALYZE. Запрос читает только строки
+# одной таблицы по индексам каталога и выполняется гораздо быстрее, чем запрос к information_schema.
+FINGERPRINT_SQL = """
+SELECT current_database(), c.oid, c.xmin::text,
+       (SELECT string_agg(a.attnum || ':' || a.xmin::text, ',' ORDER BY a.attnum)
+        FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0),
+       (SELECT string_agg(i.indexrelid || ':' || i.xmin::text, ',' ORDER BY i.indexrelid)
+        FROM pg_index i WHERE i.indrelid = c.oid)
+FROM pg_class c
+WHERE c.oid = to_regclass(%s);
+"""
+
+COLUMNS_SQL = """
+SELECT a.attname, t.typname, a.attnotnull
+FROM pg_attribute a
+JOIN pg_type t ON t.oid = a.atttypid
+WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum;
+"""
+
+UNIQUE_INDEXES_SQL = """
+SELECT array_agg(a.attname ORDER BY k.ordinality)
+FROM pg_index i
+CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ordinality)
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+WHERE i.indrelid = to_regclass(%s) AND i.indisunique AND i.indpred IS NULL
+GROUP BY i.indexrelid
+ORDER BY i.indexrelid;
+"""
+
+
+def cache_path(db_alias: str, table_name: str) -> str:
+    return os.path.join(SCHEMA_CACHE_DIR, f"{db_alias}.{table_name}.json")
+
+
+def catalog_fingerprint(cursor, table_name: str):
+    """Отпечаток описания таблицы в каталоге или None, если таблицы нет."""
+    cursor.execute(FINGERPRINT_SQL, (table_name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return hashlib.md5("|".join(str(value) for value in row).encode("utf-8")).hexdigest()
+
+
+def read_table_schema(cursor, table_name: str) -> dict:
+    """Читает из каталога столбцы (тип, NOT NULL) и уникальные индексы таблицы."""
+    cursor.execute(COLUMNS_SQL, (table_name,))
+    columns = [{"name": name, "type": type_name, "not_null": not_null}
+               for name, type_name, not_null in cursor.fetchall()]
+    cursor.execute(UNIQUE_INDEXES_SQL, (table_name,))
+    unique = [list(index_columns) for (index_columns,) in cursor.fetchall()]
+    return {"columns": columns, "unique": unique}
+
+
+def _read_cache_file(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache_file(path: str, schema: dict):
+    os.makedirs(SCHEMA_CACHE_DIR, exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def table_schema(cursor, table_name: str, db_alias: str = "default", context=None) -> dict:
+    """
+    Описание таблицы (столбцы, типы, NOT NULL, уникальные индексы) из кэша, сохраняемого между запусками
+    в STATE_DIR/schema. Перед использованием кэша сверяется отпечаток каталога (см. FINGERPRINT_SQL):
+    если таблица менялась, описание читается из каталога заново и кэш перезаписывается.
+
+    :param cursor: Курсор psycopg2.
+    :param table_name: Имя таблицы.
+    :param db_alias: Ключ подключения (у разных баз - разные файлы кэша).
+    :param context: (Опционально) Dagster context для логирования.
+    :return: Словарь {"table_name", "fingerprint", "columns": [{"name", "type", "not_null"}], "unique": [[...]]}.
+    :raises ValueError: Если таблицы нет в базе.
+    """
+    fingerprint = catalog_fingerprint(cursor, table_name)
+    if fingerprint is None:
+        raise ValueError(f"Table {table_name} not found in database '{db_alias}'.")
+
+    key = (db_alias, table_name)
+    with _memory_lock:
+        schema = _memory_cache.get(key)
+    if schema is None or schema.get("fingerprint") != fingerprint:
+        path = cache_path(db_alias, table_name)
+        schema = _read_cache_file(path)
+        if schema.get("fingerprint") != fingerprint:
+            schema = {"table_name": table_name, "fingerprint": fingerprint,
+                      "cached_at": datetime.now().isoformat(timespec="seconds"),
+                      **read_table_schema(cursor, table_name)}
+            _write_cache_file(path, schema)
+            if context:
+                context.log.info(f"🗂️ Описание таблицы {table_name} обновлено в кэше схемы")
+        with _memory_lock:
+            _memory_cache[key] = schema
+    return schema
+
+
+def varchar_columns(schema: dict) -> list:
+    """Столбцы типа varchar (обязательные текстовые столбцы, которые трансформации заполняют "-")."""
+    return [column["name"] for column in schema["columns"] if column["type"] == "varchar"]
+
+
+def column_types(schema: dict, cols: list) -> dict:
+    """
+    Типы заданных столбцов в виде {столбец: {"type": имя типа Postgres, "not_null": bool}}.
+
+    :raises ValueError: Если каких-то столбцов нет в таблице.
+    """
+    types = {column["name"]: {"type": column["type"], "not_null": column["not_null"]} for column in schema["columns"]}
+    missing = [col for col in cols if col not in types]
+    if missing:
+        raise ValueError(f"Columns {missing} not found in table {schema['table_name']}.")
+    return {col: types[col] for col in cols}
+
+
+def has_unique_index(schema: dict, key_columns: list) -> bool:
+    """Есть ли уникальный индекс ровно по key_columns (нужен для ON CONFLICT)."""
+    return any(sorted(index) == sorted(key_columns) for index in schema["unique"])
@@ -0,0 +1,98 @@
+# common/sql_templates.py
+import hashlib
+import re
+import weakref
+from functools import lru_cache
+
+# Допустимое имя таблицы или столбца (таблица может быть указана со схемой: schema.table)
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Подготовленные на сервере запросы по соединениям: {connection: {имя запроса}}
+_prepared_statements = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=256)
+def validate_identifiers(table_name: str, cols: tuple, conflict_columns: tuple = ()) -> None:
+    """
+    Проверяет имена таблицы и столбцов перед подстановкой в текст SQL.
+    Результат кэшируется, поэтому для одного набора (таблица, столбцы, ключи) проверка выполняется один раз.
+    """
+    for part in table_name.split("."):
+        if not IDENTIFIER_RE.match(part):
+            raise ValueError(f"Недопустимое имя таблицы: '{table_name}'")
+    invalid = [col for col in cols + conflict_columns if not IDENTIFIER_RE.match(col)]
+    if invalid:
+        raise ValueError(f"Недопустимые имена столбцов для таблицы {table_name}: {invalid}")
+    missing = [col for col in conflict_columns if col not in cols]
+    if missing:
+        raise ValueError(f"Ключевые столбцы {missing} отсутствуют в данных для таблицы {table_name}")
+
+
+@lru_cache(maxsize=256)
+def upsert_sql(table_name: str, cols: tuple, conflict_columns: tuple, timestamps: bool = True) -> str:
+    """
+    Построчный INSERT ... ON CONFLICT ... RETURNING (xmax = 0) с плейсхолдерами %s.
+    Текст строится один раз для ключа (таблица, столбцы, ключевые столбцы, timestamps).
+    """
+    validate_identifiers(table_name, cols, conflict_columns)
+    insert_columns = list(cols) + (["created_at", "updated_at"] if timestamps else [])
+    values = ["%s"] * len(cols) + (["CURRENT_TIMESTAMP", "CURRENT_TIMESTAMP"] if timestamps else [])
+    update_columns = [col for col in cols if col not in conflict_columns]
+    if update_columns:
+        conflict_action = f"DO UPDATE SET {', '.join([f'{col} = EXCLUDED.{col}' for col in update_columns])}"
+    else:
+        conflict_action = "DO NOTHING"
+    return f"""
+    INSERT INTO {table_name} ({', '.join(insert_columns)})
+    VALUES ({', '.join(values)})
+    ON CONFLICT ({', '.join(conflict_columns)})
+    {conflict_action}
+    RETURNING (xmax = 0);
+    """
+
+
+@lru_cache(maxsize=256)
+def insert_sql(table_name: str, cols: tuple, timestamps: bool = True) -> str:
+    """Построчный INSERT без обработки конфликтов с плейсхолдерами %s."""
+    validate_identifiers(table_name, cols)
+    insert_columns = list(cols) + (["created_at", "updated_at"] if timestamps else [])
+    values = ["%s"] * len(cols) + (["CURRENT_TIMESTAMP", "CURRENT_TIMESTAMP"] if timestamps else [])
+    return f"""
+    INSERT INTO {table_name} ({', '.join(insert_columns)})
+    VALUES ({', '.join(values)});
+    """
+
+
+@lru_cache(maxsize=256)
+def delete_by_keys_sql(table_name: str, key_columns: tuple) -> str:
+    """DELETE строк с заданными значениями ключевых столбцов."""
+    validate_identifiers(table_name, key_columns)
+    return f"DELETE FROM {table_name} WHERE {' AND '.join([f'{col} = %s' for col in key_columns])};"
+
+
+@lru_cache(maxsize=256)
+def _prepared_forms(sql: str) -> tuple:
+    """Имя подготовленного запроса, текст PREPARE (плейсхолдеры $1..$n) и текст EXECUTE."""
+    name = f"etl_{hashlib.md5(sql.encode('utf-8')).hexdigest()[:16]}"
+    parts = sql.split("%s")
+    numbered = parts[0] + "".join(f"${number}{part}" for number, part in enumerate(parts[1:], start=1))
+    params_count = len(parts) - 1
+    prepare = f"PREPARE {name} AS {numbered.strip().rstrip(';')}"
+    execute = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * params_count)})" if params_count else "")
+    return name, prepare, execute
+
+
+def execute_prepared(cursor, sql: str, params):
+    """
+    Выполняет запрос как подготовленный на сервере: при первом использовании на соединении
+    выполняется PREPARE, далее - только EXECUTE, и сервер не разбирает и не планирует запрос заново.
+    Подготовленные запросы живут до закрытия соединения.
+    """
+    name, prepare, execute = _prepared_forms(sql)
+    prepared = _prepared_statements.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if cursor.fetchone() is None:
+            cursor.execute(prepare)
+        prepared.add(name)
+    cursor.execute(execute, params)
@@ -0,0 +1,194 @@
+# common/stream_load.py
+import numpy as np
+import pandas as pd
+from dagster import OpExecutionContext
+
+from etl_wo.common.binary_copy import session_timezone, unsupported_columns, to_native_types
+from etl_wo.common.bulk_load import create_staging_table, fill_staging, dedup_staging, merge_staging, \
+    replace_from_staging, merge_changed_rows, DEFAULT_BATCH_SIZE
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.date_parse import dates_to_objects
+from etl_wo.common.dedup import parse_dedup_rule, order_values, DEFAULT_DEDUP_RULE
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.row_hash import ROW_HASH_COLUMN, add_row_hash, ensure_row_hash_table
+from etl_wo.common.schema_cache import table_schema, column_types as schema_column_types, has_unique_index
+from etl_wo.common.sql_templates import validate_identifiers
+from etl_wo.common.table_stats import table_row_count, describe_row_count
+from etl_wo.common.universal_extract import stream_chunks
+from etl_wo.common.transform_pipeline import apply_stages
+from etl_wo.common.universal_load import COUNT_LABELS, load_drop_columns
+
+# Служебные столбцы staging-таблицы потоковой загрузки: сквозной номер строки в файле
+# и значение столбца правила "latest:<столбец>" для выбора строки среди повторяющихся ключей
+STREAM_ROW_COLUMN = "etl_row_number"
+STREAM_ORDER_COLUMN = "etl_dedup_order"
+
+# Режимы load_dataframe, которые поддерживает потоковая загрузка
+STREAM_LOAD_MODES = ("copy", "batch", "binary")
+
+
+def dedup_order_sql(rule: str) -> str:
+    """ORDER BY для dedup_staging: первая строка по этому порядку остаётся, как в drop_duplicate_keys."""
+    keep, _ = parse_dedup_rule(rule)
+    if keep == "first":
+        return f"{STREAM_ROW_COLUMN}"
+    if keep == "latest":
+        return f"{STREAM_ORDER_COLUMN} DESC NULLS LAST, {STREAM_ROW_COLUMN} DESC"
+    return f"{STREAM_ROW_COLUMN} DESC"
+
+
+def order_column(series: pd.Series) -> pd.Series:
+    """Значения правила "latest" для staging-таблицы: даты - в наносекундах (bigint), числа - как есть."""
+    values = order_values(series)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.Series(values.to_numpy(dtype="datetime64[ns]").astype("int64"), index=series.index,
+                         dtype="Int64").mask(values.isna())
+    return values.astype("float64")
+
+
+def load_stream(context: OpExecutionContext, table_name: str, stream: dict, db_alias: str, mapping_file: str,
+                load_mode: str = "copy", batch_size: int = DEFAULT_BATCH_SIZE, replace_keys: list = None,
+                change_detection: bool = False, partitions: int = 1, commit_every: int = 0,
+                full_count: bool = False, dedup: str = None, db: DatabaseResource = None, **ignored) -> dict:
+    """
+    Потоковая загрузка файла в таблицу с ограниченным объёмом памяти.
+
+    Файл читается порциями (см. universal_extract с chunksize > 0 и stream_chunks), каждая порция
+    трансформируется, приводится к виду для загрузки так же, как в load_dataframe, и сразу передаётся
+    через COPY (или пачки INSERT в режиме "batch") в одну staging-таблицу; в памяти находится только одна порция.
+    Повторяющиеся ключи удаляются уже в staging-таблице одним DELETE по правилу dedup (с учётом сквозного
+    номера строки в файле), после чего выполняется тот же set-based upsert, замена групп или загрузка только
+    изменившихся строк, что и в load_dataframe. Всё выполняется в одной транзакции, поэтому результат
+    совпадает с загрузкой файла целиком.
+
+    Режим "row", параллельная загрузка (partitions) и порционная фиксация (commit_every) в потоковом режиме
+    не поддерживаются: при повторе ключей с dedup="none" загрузка завершается ошибкой.
+
+    Параметры совпадают с load_dataframe; stream - описание потока из результата трансформации.
+
+    :return: Словарь со статусом, именем таблицы, счётчиками строк, числом порций и итоговым числом строк.
+    """
+    if load_mode not in STREAM_LOAD_MODES:
+        context.log.error(f"Load mode '{load_mode}' is not supported for streaming. "
+                          f"Expected one of: {', '.join(STREAM_LOAD_MODES)}.")
+        raise ValueError(f"Load mode '{load_mode}' is not supported for streaming.")
+    if partitions > 1 or commit_every > 0:
+        context.log.warning(f"⚠️ Параллельная загрузка и порционная фиксация не используются в потоковом режиме "
+                            f"{table_name}: файл загружается в одной транзакции.")
+    if change_detection and replace_keys:
+        context.log.warning(f"⚠️ Отслеживание изменений не поддерживается в этом режиме загрузки {table_name}, "
+                            f"загружаются все строки.")
+        change_detection = False
+
+    # Ключевые столбцы и правило повторов - из плана таблицы реестра маппинга
+    plan = table_plan(mapping_file, table_name, context, required=False)
+    conflict_columns = replace_keys or plan.get("conflict_columns", [])
+    if not conflict_columns:
+        context.log.error(f"Conflict columns (column_check) not specified for table {table_name}.")
+        raise ValueError(f"Conflict columns not specified for table {table_name}.")
+    conflict_columns_str = ", ".join(conflict_columns)
+
+    dedup = None if replace_keys else (dedup or plan.get("dedup") or DEFAULT_DEDUP_RULE)
+    keep, order_source = parse_dedup_rule(dedup) if dedup else ("none", None)
+
+    pool = (db or DatabaseResource()).pool(db_alias, context)
+    # При ошибке незафиксированная транзакция (вместе со staging-таблицей) откатывается при возврате соединения
+    with pool.connection(context) as conn:
+        with conn.cursor() as cursor:
+            schema = table_schema(cursor, table_name, db_alias, context)
+            timezone = session_timezone(cursor) if load_mode == "binary" else None
+
+            staging, cols, column_types = None, None, None
+            rows, chunks = 0, 0
+            for chunk in stream_chunks(stream):
+                chunk = apply_stages(chunk, [{"stage": "drop", "columns": load_drop_columns(change_detection)}])
+                if change_detection and ROW_HASH_COLUMN not in chunk.columns:
+                    chunk = add_row_hash(chunk)
+
+                if staging is None:
+                    # Столбцы, типы и ключи проверяются один раз - по первой порции
+                    cols = [col for col in chunk.columns if col != ROW_HASH_COLUMN]
+                    validate_identifiers(table_name, tuple(cols), tuple(conflict_columns))
+                    try:
+                        table_columns = schema_column_types(schema, cols)
+                    except ValueError as e:
+                        context.log.error(f"❌ {e}")
+                        raise
+                    if not replace_keys and not has_unique_index(schema, conflict_columns):
+                        context.log.error(f"No unique index on ({conflict_columns_str}) in table {table_name} "
+                                          f"for ON CONFLICT.")
+                        raise ValueError(f"No unique index on ({conflict_columns_str}) in table {table_name}.")
+                    if keep == "latest" and order_source not in chunk.columns:
+                        raise ValueError(f"Dedup column '{order_source}' not found in data.")
+
+                    if load_mode == "binary":
+                        column_types = table_columns
+                        unsupported = unsupported_columns(column_types)
+                        if unsupported:
+                            context.log.warning(f"⚠️ Двоичный COPY не поддерживает типы столбцов {unsupported} "
+                                                f"таблицы {table_name}, используется COPY в формате CSV.")
+                            load_mode, column_types = "copy", None
+
+                    extra_columns = {STREAM_ROW_COLUMN: "bigint"}
+                    if keep == "latest":
+                        extra_columns[STREAM_ORDER_COLUMN] = \
+                            "double precision" if pd.api.types.is_numeric_dtype(chunk[order_source]) else "bigint"
+                    if change_detection:
+                        ensure_row_hash_table(cursor)
+                        extra_columns[ROW_HASH_COLUMN] = "bigint"
+                    staging = create_staging_table(cursor, table_name, cols, extra_columns=extra_columns)
+                    staging_columns = cols + list(extra_columns)
+                    if column_types:
+                        extra_types = {"bigint": "int8", "double precision": "float8"}
+                        column_types = {**column_types, **{name: {"type": extra_types[column_type], "not_null": False}
+                                                           for name, column_type in extra_columns.items()}}
+
+                # Значение правила "latest" берётся до замены пропусков, как в drop_duplicate_keys
+                order = order_column(chunk[order_source]) if keep == "latest" else None
+                if column_types:
+                    chunk, invalid = to_native_types(chunk, {col: column_types[col] for col in cols}, timezone)
+                    if invalid:
+                        context.log.warning(f"⚠️ {table_name}: нераспознанные значения загружаются как NULL: "
+                                            f"{invalid}")
+                else:
+                    chunk = dates_to_objects(apply_stages(chunk, [{"stage": "fillna"}]))
+                chunk[STREAM_ROW_COLUMN] = np.arange(rows, rows + len(chunk), dtype="int64")
+                if order is not None:
+                    chunk[STREAM_ORDER_COLUMN] = order
+
+                fill_staging(cursor, staging, chunk, staging_columns, use_copy=load_mode != "batch",
+                             batch_size=batch_size, column_types=column_types)
+                rows += len(chunk)
+                chunks += 1
+                context.log.info(f"📥 {table_name}: порция {chunks} ({len(chunk)} строк) передана в staging-таблицу, "
+                                 f"всего {rows}")
+
+            if staging is None:
+                context.log.info(f"ℹ️ Нет данных для загрузки в таблицу {table_name}.")
+                return {"table_name": table_name, "status": "skipped"}
+
+            duplicates = 0
+            if keep != "none":
+                duplicates = dedup_staging(cursor, staging, conflict_columns, dedup_order_sql(dedup))
+                if duplicates:
+                    context.log.info(f"🧹 {table_name}: удалено {duplicates} строк с повторяющимися ключами "
+                                     f"({conflict_columns_str}), правило: {dedup}")
+
+            if replace_keys:
+                deleted, inserted = replace_from_staging(cursor, table_name, staging, cols, replace_keys)
+                counts = {"inserted": inserted, "deleted": deleted}
+            elif change_detection:
+                counts = merge_changed_rows(cursor, table_name, staging, cols, conflict_columns)
+            else:
+                counts = merge_staging(cursor, table_name, staging, cols, conflict_columns)
+        conn.commit()
+
+        with conn.cursor() as cursor:
+            row_count = table_row_count(cursor, table_name, full_count=full_count)
+        conn.rollback()
+
+    written = ", ".join(f"{COUNT_LABELS.get(key, key)} {value}" for key, value in counts.items())
+    context.log.info(f"📤 Данные загружены в {table_name} потоково ({chunks} порций, {rows} строк; {written}). "
+                     f"{describe_row_count(row_count)}")
+    return {"table_name": table_name, "status": "success", "load_mode": load_mode, "streaming": True,
+            "chunks": chunks, "rows_read": rows, **counts, "duplicates_removed": duplicates, **row_count}
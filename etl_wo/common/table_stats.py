@@ -0,0 +1,39 @@
+# common/table_stats.py
+
+
+def exact_row_count(cursor, table_name: str) -> int:
+    """Точное число строк (полное сканирование таблицы через COUNT(*))."""
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+def estimated_row_count(cursor, table_name: str):
+    """
+    Оценка числа строк по статистике каталога (pg_class.reltuples), без сканирования таблицы.
+    Возвращает None, если таблица не найдена или статистика ещё не собиралась (ANALYZE не выполнялся).
+    """
+    cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table_name,))
+    row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def table_row_count(cursor, table_name: str, full_count: bool = False) -> dict:
+    """
+    Число строк в таблице: точное при full_count=True, иначе - оценка из каталога.
+
+    :return: Словарь {"final_count": ...} для точного подсчёта или {"estimated_count": ...} для оценки.
+    """
+    if full_count:
+        return {"final_count": exact_row_count(cursor, table_name)}
+    return {"estimated_count": estimated_row_count(cursor, table_name)}
+
+
+def describe_row_count(row_count: dict) -> str:
+    """Текст для лога по результату table_row_count."""
+    if "final_count" in row_count:
+        return f"Итоговое число строк: {row_count['final_count']}"
+    if row_count.get("estimated_count") is None:
+        return "Оценка числа строк недоступна (нет статистики)"
+    return f"Число строк (оценка по статистике): ~{row_count['estimated_count']}"
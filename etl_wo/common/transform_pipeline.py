@@ -0,0 +1,190 @@
+# common/transform_pipeline.py
+import time
+
+import pandas as pd
+
+from etl_wo.common.date_parse import DEFAULT_DATE_FORMAT, parse_dates, reject_frame
+
+# Этапы трансформации, которые можно перечислить в ключе "pipeline" таблицы mapping.json:
+#   "rename"   - переименование столбцов по mapping_fields (или по "columns": {старое имя: новое});
+#   "select"   - отбор столбцов маппинга (или перечисленных в "columns");
+#   "defaults" - добавление отсутствующих обязательных столбцов (varchar из схемы БД или "columns") со значением
+#                "value" (по умолчанию "-");
+#   "fillna"   - замена пропусков на "value" (по умолчанию "-") во всех столбцах или в "columns";
+#   "drop"     - удаление столбцов "columns" (по умолчанию created_at/updated_at);
+#   "dates"    - разбор дат в столбцах "columns" по формату "format" (по умолчанию дд.мм.гггг): пустые значения
+#                становятся NULL, нераспознанные - NULL и строкой отчёта (см. date_parse), а не ошибкой запуска.
+PIPELINE_STAGES = ("rename", "select", "defaults", "fillna", "drop", "dates")
+# Трансформация по умолчанию: переименование, отбор столбцов маппинга и заполнение обязательных столбцов "-"
+DEFAULT_PIPELINE = ("rename", "select", "defaults")
+DEFAULT_FILL_VALUE = "-"
+SERVICE_COLUMNS = ("created_at", "updated_at")
+
+
+def parse_stages(pipeline) -> list:
+    """
+    Приводит описание конвейера из mapping.json к списку этапов {"stage": имя, ...параметры}.
+    Этап можно задать строкой ("fillna") или объектом ({"stage": "fillna", "value": "", "columns": [...]}).
+
+    :raises ValueError: Если этап неизвестен или задан неверно.
+    """
+    if not isinstance(pipeline, (list, tuple)):
+        raise ValueError(f"pipeline должен быть списком этапов, задан {pipeline!r}")
+    stages = []
+    for stage in pipeline:
+        stage = {"stage": stage} if isinstance(stage, str) else stage
+        if not isinstance(stage, dict) or stage.get("stage") not in PIPELINE_STAGES:
+            raise ValueError(f"Неизвестный этап конвейера {stage!r}. Допустимые этапы: {', '.join(PIPELINE_STAGES)}")
+        columns = stage.get("columns")
+        if columns is not None and not isinstance(columns, (list, dict)):
+            raise ValueError(f"columns этапа {stage['stage']} должен быть списком или объектом")
+        if stage["stage"] == "dates" and (not isinstance(columns, list) or not columns):
+            raise ValueError("Для этапа dates нужен непустой список columns")
+        stages.append(stage)
+    return stages
+
+
+def plan_pipeline(stages: list, columns, rename: dict = None, required: list = None) -> list:
+    """
+    Планировщик: сворачивает этапы в одно описание выходных столбцов, не трогая данные.
+    Переименования и отбор становятся ссылками на исходные столбцы, а заполнение пропусков и значения
+    по умолчанию - признаками столбца, поэтому каждый столбец результата создаётся не более одного раза.
+
+    :param columns: Столбцы входного DataFrame.
+    :param rename: Переименование по умолчанию для этапов "rename" и "select" (mapping_fields таблицы).
+    :param required: Обязательные столбцы по умолчанию для этапа "defaults".
+    :return: Список {"name": столбец результата, "source": исходный столбец или None,
+             "default": значение нового столбца, "fill": значение для пропусков или None,
+             "date_format": формат разбора дат или None}.
+    :raises KeyError: Если этап "select" требует столбцы, которых нет в данных.
+    """
+    entries = [{"name": col, "source": col, "default": None, "fill": None, "date_format": None} for col in columns]
+    for stage in stages:
+        kind = stage["stage"]
+        if kind == "rename":
+            mapping = stage.get("columns") or rename or {}
+            for entry in entries:
+                entry["name"] = mapping.get(entry["name"], entry["name"])
+        elif kind == "select":
+            keep = list(stage.get("columns") or (rename or {}).values())
+            if keep:
+                by_name = {entry["name"]: entry for entry in entries}
+                missing = [col for col in keep if col not in by_name]
+                if missing:
+                    raise KeyError(f"Columns {missing} not found in data.")
+                entries = [by_name[col] for col in keep]
+        elif kind == "defaults":
+            present = {entry["name"] for entry in entries}
+            for col in stage.get("columns") or required or []:
+                if col not in present:
+                    entries.append({"name": col, "source": None, "default": stage.get("value", DEFAULT_FILL_VALUE),
+                                    "fill": None, "date_format": None})
+                    present.add(col)
+        elif kind == "fillna":
+            selected = stage.get("columns")
+            for entry in entries:
+                if entry["fill"] is None and (selected is None or entry["name"] in selected):
+                    entry["fill"] = stage.get("value", DEFAULT_FILL_VALUE)
+        elif kind == "drop":
+            dropped = {col.lower() for col in stage.get("columns") or SERVICE_COLUMNS}
+            entries = [entry for entry in entries if entry["name"].lower() not in dropped]
+        elif kind == "dates":
+            # Пропуски в датах остаются пустыми (NULL), поэтому fillna к столбцам дат не применяется
+            for entry in entries:
+                if entry["source"] is not None and entry["name"] in stage["columns"]:
+                    entry["date_format"] = stage.get("format", DEFAULT_DATE_FORMAT)
+    return entries
+
+
+def _record(stats: list, stage: str, started: float, columns: int, new_bytes: int = 0):
+    if stats is not None:
+        stats.append({"stage": stage, "seconds": time.perf_counter() - started, "columns": columns,
+                      "new_mb": new_bytes / (1024 * 1024)})
+
+
+def run_pipeline(df: pd.DataFrame, plan: list, stats: list = None, rejects: list = None) -> pd.DataFrame:
+    """
+    Выполняет план plan_pipeline за один проход в режиме Copy-on-Write: столбцы, которые только
+    переименовываются или отбираются, не копируются (результат ссылается на данные df, поэтому df
+    после трансформации не изменяется на месте), пропуски заполняются только в столбцах, где они есть,
+    а столбцы значений по умолчанию создаются один раз. Столбцы дат (этап "dates") и столбцы datetime64
+    пропуски сохраняют: в БД они передаются как NULL.
+
+    :param stats: Список, в который добавляется время и объём новых данных каждого этапа
+                  ("select", "fillna", "dates", "defaults", "assemble"); см. describe_stats.
+    :param rejects: Список, в который добавляются строки отчёта о нераспознанных датах (см. date_parse.reject_frame).
+    :return: DataFrame результата.
+    """
+    with pd.option_context("mode.copy_on_write", True):
+        started = time.perf_counter()
+        data = {entry["name"]: df[entry["source"]] for entry in plan if entry["source"] is not None}
+        _record(stats, "select", started, len(data))
+
+        started = time.perf_counter()
+        filled, filled_bytes = 0, 0
+        for entry in plan:
+            if entry["source"] is None or entry["fill"] is None or entry["date_format"]:
+                continue
+            if not pd.api.types.is_datetime64_any_dtype(data[entry["name"]]) and data[entry["name"]].hasnans:
+                data[entry["name"]] = data[entry["name"]].fillna(entry["fill"])
+                filled += 1
+                filled_bytes += data[entry["name"]].memory_usage(index=False)
+        _record(stats, "fillna", started, filled, filled_bytes)
+
+        started = time.perf_counter()
+        parsed, parsed_bytes = 0, 0
+        for entry in plan:
+            if entry["date_format"]:
+                source = data[entry["name"]]
+                data[entry["name"]], rejected = parse_dates(source, entry["date_format"])
+                if rejects is not None and rejected.any():
+                    rejects.append(reject_frame(entry["name"], source, rejected))
+                parsed += 1
+                parsed_bytes += data[entry["name"]].memory_usage(index=False)
+        _record(stats, "dates", started, parsed, parsed_bytes)
+
+        started = time.perf_counter()
+        defaults, default_bytes = 0, 0
+        for entry in plan:
+            if entry["source"] is None:
+                data[entry["name"]] = pd.Series(entry["default"], index=df.index, dtype=object)
+                defaults += 1
+                default_bytes += data[entry["name"]].memory_usage(index=False)
+        _record(stats, "defaults", started, defaults, default_bytes)
+
+        started = time.perf_counter()
+        result = pd.DataFrame({entry["name"]: data[entry["name"]] for entry in plan}, index=df.index, copy=False)
+        _record(stats, "assemble", started, len(plan))
+    return result
+
+
+def apply_stages(df: pd.DataFrame, stages: list, rename: dict = None, required: list = None,
+                 stats: list = None, rejects: list = None) -> pd.DataFrame:
+    """Планирует и выполняет этапы конвейера для df (см. plan_pipeline и run_pipeline)."""
+    return run_pipeline(df, plan_pipeline(stages, df.columns, rename=rename, required=required), stats, rejects)
+
+
+def summarize_stats(stats: list) -> dict:
+    """Суммирует статистику этапов по имени (например, по всем порциям потока)."""
+    summary = {}
+    for item in stats:
+        total = summary.setdefault(item["stage"], {"seconds": 0.0, "columns": 0, "new_mb": 0.0})
+        total["seconds"] += item["seconds"]
+        total["columns"] += item["columns"]
+        total["new_mb"] += item["new_mb"]
+    return summary
+
+
+def describe_stats(stats: list) -> str:
+    """Текст статистики этапов для лога."""
+    return ", ".join(f"{stage}: {total['seconds'] * 1000:.1f} мс, столбцов {total['columns']}, "
+                     f"новых данных {total['new_mb']:.1f} МБ" for stage, total in summarize_stats(stats).items())
+
+
+def stats_metadata(stats: list) -> dict:
+    """Метаданные ассета: время (мс) и объём новых данных (МБ) каждого этапа конвейера."""
+    metadata = {}
+    for stage, total in summarize_stats(stats).items():
+        metadata[f"pipeline/{stage}_ms"] = round(total["seconds"] * 1000, 1)
+        metadata[f"pipeline/{stage}_new_mb"] = round(total["new_mb"], 2)
+    return metadata
@@ -1,15 +1,29 @@
 import os
-import json
 import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
 from dagster import OpExecutionContext
 
+from etl_wo.common.ingest_ledger import find_ingested, describe_file, describe_entry
+from etl_wo.common.mapping_registry import CSV_ENGINES, read_options, table_plan
+from etl_wo.common.parse_cache import PARSE_CACHE_MAX_MB, cache_path, read_cached, write_cached, evict
+
+ARROW_STRING_DTYPE = "string[pyarrow]"
+
 
 def universal_extract(
         context: OpExecutionContext,
         mapping_file: str,
         data_folder: str,
-        table_name: str
+        table_name: str,
+        chunksize: int = 0,
+        all_files: bool = False,
+        files: list = None,
+        workers: int = 0,
+        force: bool = False,
+        parse_cache: bool = True
 ) -> dict:
     """
     Универсальная функция для извлечения данных.
@@ -19,31 +33,42 @@ def universal_extract(
       mapping_file: Путь к файлу mapping.json с настройками таблиц
       data_folder: Путь к папке, в которой находятся файлы данных (CSV)
       table_name: Имя таблицы в mapping.json, для которой производится поиск файла
+      chunksize: Размер порции для потокового режима (0 - файл читается целиком)
+      all_files: Читать все подходящие файлы папки, а не только последний
+      files: (Опционально) Имена файлов для чтения (например, готовые файлы, отобранные сенсором)
+      workers: Число процессов для одновременного чтения файлов (0 - по числу файлов, не больше числа CPU)
+      force: Читать файлы, даже если такое же содержимое уже загружено (см. журнал загрузок ingest_ledger)
+      parse_cache: Использовать кэш разобранных файлов в Parquet (см. parse_cache)
 
     Функция:
-      1. Загружает настройки из mapping.json.
+      1. Получает план таблицы из реестра маппинга (mapping_registry).
       2. Получает настройки для указанной таблицы (шаблон файла, формат, кодировку, разделитель).
       3. Ищет файлы в data_folder, удовлетворяющие шаблону.
       4. Выбирает последний (по сортировке) файл из найденных.
       5. Считывает CSV-файл с использованием заданных параметров.
-      6. Возвращает словарь с ключами "table_name" и "data" (pandas DataFrame).
-    """
-    # Проверяем наличие файла маппинга
-    if not os.path.exists(mapping_file):
-        context.log.info(f"❌ Файл маппинга {mapping_file} не найден.")
-        raise FileNotFoundError(f"❌ Файл маппинга {mapping_file} не найден.")
+      6. Возвращает словарь с ключами "table_name", "data" (pandas DataFrame) и "source_file" (путь к файлу).
 
-    # Загружаем настройки маппинга
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
+    При all_files=True (или заданном списке files) читаются все выбранные файлы: одновременно, в пуле процессов.
+    Строки объединяются в порядке времени изменения файлов (строки более нового файла идут позже и при
+    повторе ключа побеждают), результат передаётся в одну загрузку. "source_file" - самый новый файл,
+    "source_files" - все файлы по порядку, "file_rows" - число строк каждого файла в том же порядке (оно же
+    добавляется в метаданные ассета).
 
-    table_config = mappings.get("tables", {}).get(table_name)
-    if not table_config:
-        context.log.info(f"❌ Настройки для таблицы '{table_name}' не найдены в {mapping_file}.")
-        raise ValueError(f"❌ Настройки для таблицы '{table_name}' не найдены.")
+    Перед чтением каждый файл сверяется с журналом загрузок (ingest_ledger): файлы, содержимое которых
+    уже загружено в таблицу (под любым именем), пропускаются без разбора, если не задан force. Если пропущены
+    все файлы, возвращается {"skipped": True, "data": None}. "ingest" - размер, хэш и число строк
+    прочитанных файлов для записи в журнал после успешной загрузки.
 
-    file_pattern = table_config.get("file", {}).get("file_pattern", "")
-    file_format = table_config.get("file", {}).get("file_format", "")
+    Из файла читаются только столбцы, перечисленные в mapping_fields (остальные трансформация всё равно
+    отбрасывает). Разобранный файл сохраняется в кэш Parquet по хэшу содержимого и версии плана таблицы:
+    повторное чтение того же файла (повтор после ошибки загрузки, повторный запуск) берёт его из кэша.
+
+    При chunksize > 0 (потоковый режим) файл здесь не читается: вместо "data" (None) возвращается
+    описание потока "stream" с параметрами чтения, а порции по chunksize строк читает загрузка
+    (см. stream_chunks), поэтому объём памяти не зависит от размера файла.
+    """
+    # План таблицы из реестра маппинга (mapping.json читается заново, только если файл изменился)
+    plan = table_plan(mapping_file, table_name, context)
 
     # Проверяем наличие папки с данными
     if not os.path.exists(data_folder):
@@ -57,27 +82,182 @@ def universal_extract(
 
     # Ищем файлы, удовлетворяющие шаблону: file_pattern.file_format
     matching_files = [
-        f for f in data_files if fnmatch.fnmatch(f, f"{file_pattern}.{file_format}")
+        f for f in data_files if fnmatch.fnmatch(f, plan["file_mask"])
     ]
     if not matching_files:
-        context.log.info(f"❌ Не найдено файлов по шаблону {file_pattern}.{file_format} в {data_folder}.")
-        raise ValueError(f"❌ Не найдено файлов по шаблону {file_pattern}.{file_format} в {data_folder}.")
+        context.log.info(f"❌ Не найдено файлов по шаблону {plan['file_mask']} в {data_folder}.")
+        raise ValueError(f"❌ Не найдено файлов по шаблону {plan['file_mask']} в {data_folder}.")
+
+    if files:
+        missing = sorted(set(files) - set(matching_files))
+        if missing:
+            context.log.info(f"❌ Файлы {missing} не найдены в {data_folder} или не подходят под шаблон.")
+            raise ValueError(f"❌ Файлы {missing} не найдены в {data_folder}.")
+        matching_files = list(files)
+    elif not all_files:
+        # Выбираем последний файл из отсортированного списка
+        matching_files = sorted(matching_files)[-1:]
+    file_paths = order_by_timestamp([os.path.join(data_folder, f) for f in matching_files])
+
+    # Пропускаем файлы, содержимое которых уже загружено (или повторяется среди выбранных файлов)
+    ingest, skipped = [], []
+    for path in file_paths:
+        entry, info = (None, None) if force else find_ingested(table_name, path)
+        info = info or describe_file(path)
+        if entry or info["content_hash"] in {item["content_hash"] for item in ingest}:
+            reason = describe_entry(entry) if entry else "повторяет другой выбранный файл"
+            context.log.info(f"♻️ {os.path.basename(path)}: {reason}, пропускаем")
+            skipped.append(os.path.basename(path))
+        else:
+            ingest.append(info)
+    file_paths = [info["file"] for info in ingest]
+    if not file_paths:
+        context.add_output_metadata({"files": 0, "skipped_files": skipped})
+        return {"table_name": table_name, "data": None, "source_file": None, "source_files": [],
+                "skipped": True, "ingest": []}
+    file_path = file_paths[-1]
+    options = plan["read_options"]
+
+    if chunksize > 0:
+        context.log.info(f"📥 Потоковый режим: файлов {len(file_paths)}, чтение порциями по {chunksize} строк")
+        return {"table_name": table_name, "data": None, "source_file": file_path, "source_files": file_paths,
+                "ingest": ingest,
+                "stream": {"source_files": file_paths, "read_options": options, "chunksize": chunksize,
+                           "usecols": plan["usecols"]}}
+
+    # Читаем CSV с использованием параметров из маппинга (или разобранные ранее файлы из кэша)
+    cache_files = None
+    if parse_cache and PARSE_CACHE_MAX_MB > 0:
+        cache_files = [cache_path(info["content_hash"], plan["version"]) for info in ingest]
+    frames, cached = read_files(file_paths, options, workers, plan["usecols"], cache_files)
+    if any(cached):
+        context.log.info(f"⚡ Из кэша разобранных файлов: "
+                         f"{[os.path.basename(path) for path, hit in zip(file_paths, cached) if hit]}")
+    if cache_files and not all(cached):
+        evicted = evict()
+        if evicted:
+            context.log.info(f"🧹 Из кэша разобранных файлов удалено записей: {len(evicted)}")
+    row_counts = {os.path.basename(path): len(frame) for path, frame in zip(file_paths, frames)}
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    if len(file_paths) > 1:
+        context.log.info(f"📥 Загружено {len(df)} строк из {len(file_paths)} файлов "
+                         f"(парсер {options['engine']}): {row_counts}")
+    else:
+        text_value = f"📥 Загружено {len(df)} строк из {os.path.basename(file_path)} (парсер {options['engine']})"
+        context.log.info(text_value)
+    context.add_output_metadata({"files": len(file_paths), "rows": len(df),
+                                 **{f"rows/{name}": count for name, count in row_counts.items()},
+                                 "cached_files": sum(cached),
+                                 **({"skipped_files": skipped} if skipped else {})})
+    for info, frame in zip(ingest, frames):
+        info["rows"] = len(frame)
+
+    return {"table_name": table_name, "data": df, "source_file": file_path, "source_files": file_paths,
+            "file_rows": [len(frame) for frame in frames], "ingest": ingest}
+
+
+def order_by_timestamp(file_paths: list) -> list:
+    """Файлы в порядке времени изменения (от старых к новым), при равном времени - по имени."""
+    return sorted(file_paths, key=lambda path: (os.path.getmtime(path), os.path.basename(path)))
+
+
+def read_files(file_paths: list, options: dict, workers: int = 0, usecols: list = None,
+               cache_files: list = None) -> tuple:
+    """
+    Читает файлы одновременно в пуле процессов (разбор CSV упирается в GIL, поэтому потоки не помогают).
+    Один файл (или все файлы при одном процессе) читается в текущем процессе.
+
+    :return: Кортеж (список DataFrame в порядке file_paths, список признаков "прочитан из кэша").
+    """
+    workers = workers or min(len(file_paths), os.cpu_count() or 1)
+    count = len(file_paths)
+    args = (file_paths, [options] * count, [usecols] * count, cache_files or [None] * count)
+    if count == 1 or workers == 1:
+        results = list(map(read_file, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(read_file, *args))
+    return [df for df, _ in results], [hit for _, hit in results]
+
+
+def read_file(file_path: str, options: dict, usecols: list = None, cache_file: str = None) -> tuple:
+    """
+    Читает один файл: из кэша Parquet (cache_file), если запись есть, иначе разбирает CSV
+    (только столбцы usecols, которые есть в файле) и сохраняет результат в кэш.
+
+    :return: Кортеж (DataFrame, признак "прочитан из кэша").
+    """
+    if cache_file:
+        df = read_cached(cache_file, options.get("engine"))
+        if df is not None:
+            return df, True
+    df = read_csv(file_path, options, usecols=mapped_columns(file_path, options, usecols))
+    if cache_file:
+        write_cached(cache_file, df)
+    return df, False
+
+
+def mapped_columns(file_path: str, options: dict, usecols: list = None) -> list:
+    """Столбцы файла, которые есть в usecols плана таблицы (None - читать все столбцы)."""
+    if not usecols:
+        return None
+    wanted = set(usecols)
+    header = pd.read_csv(file_path, encoding=options["encoding"], delimiter=options["delimiter"], nrows=0).columns
+    columns = [col for col in header if col in wanted]
+    return columns or None
+
 
-    # Выбираем последний файл из отсортированного списка
-    matched_file = sorted(matching_files)[-1]
-    file_path = os.path.join(data_folder, matched_file)
+def read_csv(file_path: str, options: dict, usecols: list = None) -> pd.DataFrame:
+    """
+    Читает CSV целиком; все столбцы - строки, пустые значения - пропуски (как в pd.read_csv с dtype=str).
+    С парсером "pyarrow" файл разбирается pyarrow.csv сразу в строковые столбцы Arrow без вывода типов
+    (вывод типов в pd.read_csv(engine="pyarrow") превращает, например, "0123" в "123").
+    """
+    if options.get("engine") != "pyarrow":
+        return pd.read_csv(file_path, encoding=options["encoding"], delimiter=options["delimiter"], dtype=str,
+                           usecols=usecols)
+
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
 
-    # Читаем CSV с использованием параметров из маппинга
-    encoding = table_config.get("encoding", "utf-8")
-    delimiter = table_config.get("delimiter", ",")
-    df = pd.read_csv(
+    columns = usecols or list(pd.read_csv(file_path, encoding=options["encoding"], delimiter=options["delimiter"],
+                                          nrows=0).columns)
+    table = pa_csv.read_csv(
         file_path,
-        encoding=encoding,
-        delimiter=delimiter,
-        dtype=str
+        read_options=pa_csv.ReadOptions(encoding=options["encoding"]),
+        parse_options=pa_csv.ParseOptions(delimiter=options["delimiter"], newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types={col: pa.string() for col in columns},
+                                              include_columns=usecols, null_values=sorted(STR_NA_VALUES),
+                                              strings_can_be_null=True),
     )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
 
-    text_value = f"📥 Загружено {len(df)} строк из {matched_file}"
-    context.log.info(text_value)
 
-    return {"table_name": table_name, "data": df}
+def iter_csv_chunks(stream: dict, usecols: list = None):
+    """
+    Читает файлы потока (см. universal_extract с chunksize > 0) по порядку, порциями по stream["chunksize"] строк.
+    Порции читает парсер pandas (pyarrow не читает по строкам); при парсере "pyarrow" строки хранятся в Arrow.
+    Читаются только столбцы usecols (по умолчанию - столбцы маппинга из плана таблицы, stream["usecols"]).
+    """
+    options = stream["read_options"]
+    for source_file in stream["source_files"]:
+        file_columns = usecols or mapped_columns(source_file, options, stream.get("usecols"))
+        reader = pd.read_csv(source_file, chunksize=stream["chunksize"], usecols=file_columns,
+                             encoding=options["encoding"], delimiter=options["delimiter"],
+                             dtype=ARROW_STRING_DTYPE if options.get("engine") == "pyarrow" else str)
+        with reader:
+            yield from reader
+
+
+def stream_chunks(stream: dict):
+    """
+    Порции потока после трансформации: к каждой прочитанной порции применяется stream["transform"]
+    (функция DataFrame -> DataFrame, её добавляет ассет трансформации). Пустые порции пропускаются.
+    """
+    transform = stream.get("transform")
+    for chunk in iter_csv_chunks(stream):
+        if transform is not None:
+            chunk = transform(chunk)
+        if not chunk.empty:
+            yield chunk
@@ -1,79 +1,385 @@
 # common/universal_load.py
-import json
-import os
-
 import psycopg2
-from dagster import OpExecutionContext
+from dagster import OpExecutionContext, Field, String, Int, Bool
+
+from etl_wo.common.binary_copy import session_timezone, unsupported_columns, to_native_types
+from etl_wo.common.categorical import expand_categories
+from etl_wo.common.date_parse import dates_to_objects
+from etl_wo.common.bulk_load import copy_upsert, batch_upsert, replace_by_keys, changed_rows_upsert, log_batch_rate, \
+    DEFAULT_BATCH_SIZE
+from etl_wo.common.dedup import drop_duplicate_keys, DEFAULT_DEDUP_RULE
+from etl_wo.common.load_checkpoint import content_hash, resume_offset, save_checkpoint, clear_checkpoint
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.parallel_load import partition_frame, load_partitions, PARTITION_POLICIES
+from etl_wo.common.schema_cache import table_schema, column_types as schema_column_types, has_unique_index
+from etl_wo.common.row_hash import ROW_HASH_COLUMN, add_row_hash, ensure_row_hash_table
+from etl_wo.common.sql_templates import validate_identifiers, upsert_sql, execute_prepared
+from etl_wo.common.table_stats import table_row_count, describe_row_count
+from etl_wo.common.transform_pipeline import SERVICE_COLUMNS, apply_stages
+from etl_wo.common.db_pool import DatabaseResource
+
+# Режимы загрузки: "copy" - COPY в staging-таблицу и один set-based upsert,
+# "batch" - многострочные INSERT ... VALUES пачками (без COPY),
+# "binary" - как "copy", но данные приводятся к типам столбцов таблицы и передаются двоичным COPY,
+# "row" - построчный INSERT ... ON CONFLICT (запасной вариант)
+LOAD_MODES = ("copy", "batch", "binary", "row")
+
+# Подписи счётчиков строк для логов
+COUNT_LABELS = {"inserted": "вставлено", "updated": "обновлено", "deleted": "удалено", "unchanged": "без изменений"}
+
+# Общая схема op config для ассетов, вызывающих load_dataframe
+LOAD_CONFIG_SCHEMA = {
+    "load_mode": Field(String, default_value="copy", is_required=False,
+                       description="Режим загрузки: copy (COPY + set-based upsert), batch (пачки VALUES), "
+                                   "binary (типизированный двоичный COPY) или row (построчно)"),
+    "batch_size": Field(Int, default_value=DEFAULT_BATCH_SIZE, is_required=False,
+                        description="Число строк в одном INSERT для режима batch"),
+    "change_detection": Field(Bool, default_value=False, is_required=False,
+                              description="Записывать только новые и изменившиеся строки (по хэшу строки)"),
+    "partitions": Field(Int, default_value=1, is_required=False,
+                        description="Число партиций (и соединений) для параллельной загрузки"),
+    "partition_policy": Field(String, default_value="all_or_nothing", is_required=False,
+                              description="При ошибке в партиции: all_or_nothing - откатить все, "
+                                          "independent - сохранить успешные"),
+    "commit_every": Field(Int, default_value=0, is_required=False,
+                          description="Фиксировать транзакцию каждые N строк с контрольной точкой для "
+                                      "продолжения при повторе (0 - одна транзакция)"),
+    "full_count": Field(Bool, default_value=False, is_required=False,
+                        description="Считать итоговое число строк через COUNT(*) (иначе - оценка из каталога)"),
+    "prepared_statements": Field(Bool, default_value=True, is_required=False,
+                                 description="Использовать подготовленные на сервере запросы в режиме row "
+                                             "(отключить за пулером в режиме transaction)"),
+    "dedup": Field(String, is_required=False,
+                   description="Правило удаления повторяющихся ключей в пачке: none, first, last или "
+                               "latest:<столбец> (по умолчанию - ключ dedup таблицы в mapping.json, иначе last)"),
+}
+
 
-from etl_wo.common.connect_db import connect_to_db
+def load_options(op_config: dict) -> dict:
+    """Выбирает из op config параметры, относящиеся к load_dataframe."""
+    return {key: op_config[key] for key in LOAD_CONFIG_SCHEMA if key in op_config}
+
+
+def load_drop_columns(change_detection: bool) -> list:
+    """
+    Столбцы, которые удаляются перед загрузкой: генерируемые автоматически (created_at и updated_at)
+    и хэш строки, если отслеживание изменений не используется.
+    """
+    return list(SERVICE_COLUMNS) + ([] if change_detection else [ROW_HASH_COLUMN])
 
 
 def load_dataframe(context: OpExecutionContext, table_name: str, data, db_alias: str, mapping_file: str,
-                   sql_generator) -> dict:
+                   sql_generator=None, load_mode: str = "copy", batch_size: int = DEFAULT_BATCH_SIZE,
+                   replace_keys: list = None, change_detection: bool = False, partitions: int = 1,
+                   partition_policy: str = "all_or_nothing", commit_every: int = 0, source_file: str = None,
+                   full_count: bool = False, prepared_statements: bool = True, dedup: str = None,
+                   db: DatabaseResource = None) -> dict:
     """
     Универсальная функция для загрузки DataFrame в таблицу БД.
-    Использует уже настроенное подключение через connect_to_db.
+    Соединения берутся из общего пула процесса (ресурс DatabaseResource) по ключу db_alias.
+    Описание целевой таблицы (столбцы, типы, уникальные индексы) берётся из кэша схемы (schema_cache):
+    до записи проверяется, что все столбцы есть в таблице и что для column_check есть уникальный индекс.
+
+    По умолчанию данные передаются через COPY во временную staging-таблицу и сливаются в целевую
+    одним INSERT ... ON CONFLICT по column_check из mapping.json. Если COPY недоступен (например,
+    за пулером соединений), режим "batch" отправляет строки многострочными INSERT ... VALUES.
+    Режим "binary" берёт типы столбцов целевой таблицы из кэша схемы, векторно приводит столбцы к нативным
+    типам (даты, числа, логические значения) и передаёт их двоичным COPY; пропуски передаются как NULL,
+    если столбец это допускает (в остальных режимах пропуски заменяются на "-").
+    Построчный режим ("row") оставлен как запасной: он же используется автоматически,
+    если в пачке есть повторяющиеся ключи.
+
+    Если задан replace_keys, вместо upsert выполняется замена групп: все строки с теми же значениями
+    replace_keys удаляются одним DELETE ... USING и вставляются заново (в режиме "row" - через sql_generator).
+
+    При change_detection=True (режимы "copy" и "batch") строки сравниваются по хэшу (столбец etl_row_hash,
+    его добавляет трансформация или, если его нет, сама загрузка) с хэшами прошлой загрузки
+    из служебной таблицы etl_row_hashes: неизменившиеся строки не перезаписываются.
+
+    При partitions > 1 данные делятся по хэшу ключевых столбцов на непересекающиеся партиции, которые
+    загружаются одновременно в отдельных соединениях. partition_policy определяет реакцию на ошибку:
+    "all_or_nothing" (по умолчанию) - откатываются все партиции, "independent" - успешные сохраняются.
+
+    При commit_every > 0 данные фиксируются порциями по commit_every строк, и после каждой порции
+    сохраняется контрольная точка (файл-источник, смещение, хэш содержимого). Повторный запуск с теми же
+    данными продолжает загрузку с последней зафиксированной порции. После успешной загрузки
+    контрольная точка удаляется.
+
+    Число вставленных, обновлённых и удалённых строк считается по самим запросам (вставка и обновление
+    различаются через RETURNING (xmax = 0)). Размер таблицы после загрузки по умолчанию берётся
+    из статистики каталога; точный COUNT(*) выполняется только при full_count=True.
+
+    Тексты построчных запросов строятся один раз для набора (таблица, столбцы, ключи) и в режиме "row"
+    выполняются как подготовленные на сервере (PREPARE/EXECUTE), если prepared_statements=True.
+
+    Перед upsert строки с повторяющимися значениями column_check удаляются из пачки по правилу dedup
+    (параметр или ключ "dedup" таблицы в mapping.json, по умолчанию "last"), чтобы set-based upsert
+    не срывался на повторе ключа. В режиме замены групп повторы ключей допустимы и не удаляются.
 
     :param context: Dagster execution context.
     :param table_name: Имя таблицы в БД.
     :param data: Pandas DataFrame с данными для загрузки.
     :param db_alias: Ключ подключения (например, 'default').
-    :param sql_generator: Функция, генерирующая SQL-запросы и параметры.
-    :return: Словарь с итоговым числом строк, статусом и именем таблицы.
+    :param mapping_file: Путь к файлу mapping.json.
+    :param sql_generator: Функция, генерирующая SQL-запросы и параметры для построчного режима.
+    :param load_mode: Режим загрузки: "copy" (по умолчанию), "batch", "binary" или "row".
+    :param batch_size: Число строк в одном INSERT для режима "batch".
+    :param replace_keys: (Опционально) Столбцы группы для режима замены (например, ["talon", "source"]).
+    :param change_detection: Пропускать строки, не изменившиеся с прошлой загрузки.
+    :param partitions: Число партиций для параллельной загрузки (1 - без распараллеливания).
+    :param partition_policy: Правило обработки ошибок партиций: "all_or_nothing" или "independent".
+    :param commit_every: Размер порции для промежуточных фиксаций (0 - одна транзакция на всю загрузку).
+    :param source_file: (Опционально) Файл, из которого получены данные (сохраняется в контрольной точке).
+    :param full_count: Считать итоговое число строк в таблице точно (COUNT(*)).
+    :param prepared_statements: Выполнять построчные запросы как подготовленные на сервере.
+    :param dedup: (Опционально) Правило удаления повторяющихся ключей: "none", "first", "last" или "latest:<столбец>".
+    :param db: (Опционально) Ресурс DatabaseResource ассета (по умолчанию - пул с настройками по умолчанию).
+    :return: Словарь со статусом, именем таблицы, счётчиками строк и итоговым (или оценочным) числом строк.
     """
-    # Удаляем столбцы, которые генерируются автоматически (например, created_at и updated_at)
-    data = data.drop(columns=[col for col in data.columns if col.lower() in ("created_at", "updated_at")],
-                     errors='ignore')
+    if load_mode not in LOAD_MODES:
+        context.log.error(f"Unknown load mode '{load_mode}'. Expected one of: {', '.join(LOAD_MODES)}.")
+        raise ValueError(f"Unknown load mode '{load_mode}'.")
+    if partition_policy not in PARTITION_POLICIES:
+        context.log.error(f"Unknown partition policy '{partition_policy}'. "
+                          f"Expected one of: {', '.join(PARTITION_POLICIES)}.")
+        raise ValueError(f"Unknown partition policy '{partition_policy}'.")
 
-    # Загружаем настройки маппинга
-    if not os.path.exists(mapping_file):
-        context.log.error(f"Mapping file {mapping_file} not found.")
-        raise FileNotFoundError(f"Mapping file {mapping_file} not found.")
+    if change_detection and (replace_keys or load_mode == "row"):
+        context.log.warning(f"⚠️ Отслеживание изменений не поддерживается в этом режиме загрузки {table_name}, "
+                            f"загружаются все строки.")
+        change_detection = False
 
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
+    # Удаляем столбцы, которые генерируются автоматически (например, created_at и updated_at),
+    # и хэш строки, если отслеживание изменений не используется
+    # (этап "drop" конвейера трансформации: оставшиеся столбцы не копируются)
+    data = apply_stages(data, [{"stage": "drop", "columns": load_drop_columns(change_detection)}])
+    # Столбцы-категории (см. categorical.encode_categories) переводятся обратно в строки только перед записью в БД
+    data = expand_categories(data)
+    if change_detection and ROW_HASH_COLUMN not in data.columns:
+        data = add_row_hash(data)
 
-    table_config = mappings.get("tables", {}).get(table_name, {})
-    conflict_columns = table_config.get("column_check", [])
+    # Ключевые столбцы и правило повторов - из плана таблицы реестра маппинга
+    plan = table_plan(mapping_file, table_name, context, required=False)
+    conflict_columns = replace_keys or plan.get("conflict_columns", [])
     if not conflict_columns:
         context.log.error(f"Conflict columns (column_check) not specified for table {table_name}.")
         raise ValueError(f"Conflict columns not specified for table {table_name}.")
     conflict_columns_str = ", ".join(conflict_columns)
 
-    # Формируем список столбцов для вставки
-    cols = list(data.columns)
-    insert_columns = cols + ["created_at", "updated_at"]
+    # Формируем список столбцов для вставки и один раз проверяем имена перед подстановкой в SQL
+    cols = [col for col in data.columns if col != ROW_HASH_COLUMN]
+    validate_identifiers(table_name, tuple(cols), tuple(conflict_columns))
+
+    # Удаляем повторяющиеся ключи в пачке (при замене групп несколько строк на ключ - норма)
+    duplicates = 0
+    if not replace_keys:
+        dedup = dedup or plan.get("dedup") or DEFAULT_DEDUP_RULE
+        data, duplicates = drop_duplicate_keys(data, conflict_columns, dedup)
+        if duplicates:
+            context.log.info(f"🧹 {table_name}: удалено {duplicates} строк с повторяющимися ключами "
+                             f"({conflict_columns_str}), правило: {dedup}")
+
+    pool = (db or DatabaseResource()).pool(db_alias, context)
+    if partitions > pool.max_connections:
+        context.log.error(f"Partitions ({partitions}) exceed pool size ({pool.max_connections}) for {db_alias}.")
+        raise ValueError(f"Partitions ({partitions}) exceed pool size ({pool.max_connections}).")
+
+    def connection():
+        return pool.connection(context)
 
-    # Генерируем SQL-запросы с использованием conflict_columns из маппинга
-    def sql_generator(data, table_name):
+    # Описание целевой таблицы берём из кэша схемы (сверка отпечатка каталога - один быстрый запрос)
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            schema = table_schema(cursor, table_name, db_alias, context)
+            timezone = session_timezone(cursor) if load_mode == "binary" else None
+    try:
+        table_columns = schema_column_types(schema, cols)
+    except ValueError as e:
+        context.log.error(f"❌ {e}")
+        raise
+    if not replace_keys and not has_unique_index(schema, conflict_columns):
+        context.log.error(f"No unique index on ({conflict_columns_str}) in table {table_name} for ON CONFLICT.")
+        raise ValueError(f"No unique index on ({conflict_columns_str}) in table {table_name}.")
+
+    column_types = None
+    if load_mode == "binary":
+        column_types = table_columns
+        unsupported = unsupported_columns(column_types)
+        if unsupported:
+            context.log.warning(f"⚠️ Двоичный COPY не поддерживает типы столбцов {unsupported} таблицы {table_name}, "
+                                f"используется COPY в формате CSV.")
+            load_mode, column_types = "copy", None
+
+    if column_types:
+        data, invalid = to_native_types(data, column_types, timezone)
+        if invalid:
+            context.log.warning(f"⚠️ {table_name}: нераспознанные значения загружаются как NULL: {invalid}")
+    else:
+        # Заполняем отсутствующие значения (заново создаются только столбцы, в которых есть пропуски);
+        # пустые даты (этап "dates") передаются как NULL
+        data = dates_to_objects(apply_stages(data, [{"stage": "fillna"}]))
+
+    def write(conn, part):
+        return write_frame(context, conn, table_name, part, cols, conflict_columns, sql_generator=sql_generator,
+                           load_mode=load_mode, batch_size=batch_size, replace_keys=replace_keys,
+                           change_detection=change_detection, prepared_statements=prepared_statements,
+                           column_types=column_types)
+
+    if commit_every > 0 and (partitions > 1 or replace_keys):
+        context.log.warning(f"⚠️ Порционная фиксация не используется для {table_name} "
+                            f"при параллельной загрузке и замене групп.")
+        commit_every = 0
+
+    if partitions > 1:
+        parts = partition_frame(data, conflict_columns, partitions)
+        context.log.info(f"🧩 {table_name}: {len(data)} строк разделено на {partitions} партиций "
+                         f"по ({conflict_columns_str}), правило ошибок: {partition_policy}")
+        if change_detection:
+            # Служебную таблицу создаём заранее, чтобы партиции не создавали её одновременно
+            with connection() as conn:
+                with conn.cursor() as cursor:
+                    ensure_row_hash_table(cursor)
+                conn.commit()
+        results = load_partitions(context, table_name, parts, connection, write, policy=partition_policy)
+    elif commit_every > 0:
+        with connection() as conn:
+            results = write_in_chunks(context, conn, table_name, data, write, commit_every, source_file)
+    else:
+        # При ошибке незафиксированная транзакция откатывается при возврате соединения в пул
+        with connection() as conn:
+            results = [write(conn, data)]
+            conn.commit()
+
+    counts = {}
+    for result in results:
+        for key, value in result.get("counts", {}).items():
+            counts[key] = counts.get(key, 0) + value
+    modes = {result["load_mode"] for result in results}
+    if modes:
+        load_mode = modes.pop() if len(modes) == 1 else "mixed"
+
+    # Получаем итоговое (или оценочное) число строк в таблице
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            row_count = table_row_count(cursor, table_name, full_count=full_count)
+        conn.rollback()
+
+    context.log.debug(f"🔌 Пул соединений {db_alias}: {pool.metrics()}")
+    written = ", ".join(f"{COUNT_LABELS.get(key, key)} {value}" for key, value in counts.items())
+    context.log.info(f"📤 Данные загружены в {table_name}" + (f" ({written})" if written else "") +
+                     f". {describe_row_count(row_count)}")
+    return {"table_name": table_name, "status": "success", "load_mode": load_mode, **counts,
+            "duplicates_removed": duplicates, **row_count}
+
+
+def write_in_chunks(context: OpExecutionContext, conn, table_name: str, data, write, commit_every: int,
+                    source_file: str = None) -> list:
+    """
+    Записывает данные порциями по commit_every строк, фиксируя каждую порцию и сохраняя контрольную точку.
+    Если для тех же данных уже есть контрольная точка, уже зафиксированные порции пропускаются.
+
+    :return: Список результатов write по записанным порциям.
+    """
+    data_hash = content_hash(data)
+    offset = resume_offset(table_name, source_file, data_hash)
+    if offset:
+        context.log.info(f"⏩ {table_name}: продолжаем загрузку со строки {offset} из {len(data)} "
+                         f"(контрольная точка прошлой попытки)")
+
+    results = []
+    try:
+        while offset < len(data):
+            chunk = data.iloc[offset:offset + commit_every]
+            results.append(write(conn, chunk))
+            conn.commit()
+            offset += len(chunk)
+            save_checkpoint(table_name, source_file, data_hash, offset, commit_every)
+            context.log.info(f"💾 {table_name}: зафиксировано {offset} из {len(data)} строк")
+    except Exception:
+        conn.rollback()
+        context.log.error(f"❌ {table_name}: загрузка прервана, зафиксировано {offset} из {len(data)} строк. "
+                          f"Повторный запуск продолжит с этого места.")
+        raise
+
+    clear_checkpoint(table_name)
+    return results
+
+
+def row_upsert_generator(cols: list, conflict_columns: list):
+    """Возвращает генератор построчных INSERT ... ON CONFLICT с conflict_columns из маппинга."""
+    def upsert_sql_generator(data, table_name):
+        sql = upsert_sql(table_name, tuple(cols), tuple(conflict_columns))
         for _, row in data.iterrows():
-            sql = f"""
-            INSERT INTO {table_name} ({', '.join(insert_columns)})
-            VALUES ({', '.join(['%s'] * len(cols))}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            ON CONFLICT ({conflict_columns_str})
-            DO UPDATE SET {', '.join([f"{col} = EXCLUDED.{col}" for col in cols if col not in conflict_columns])};
-            """
             yield sql, tuple(row[col] for col in cols)
 
-    # Получаем подключение к базе (используется уже настроенная функция)
-    engine, conn = connect_to_db(db_alias=db_alias, organization=None, context=context)
-    cursor = conn.cursor()
-
-    # Заполняем отсутствующие значения
-    data.fillna("-", inplace=True)
+    return upsert_sql_generator
 
-    # Выполняем SQL-запросы, сгенерированные sql_generator'ом
-    for sql, params in sql_generator(data, table_name):
-        cursor.execute(sql, params)
 
-    conn.commit()
+def write_frame(context: OpExecutionContext, conn, table_name: str, data, cols: list, conflict_columns: list,
+                sql_generator=None, load_mode: str = "copy", batch_size: int = DEFAULT_BATCH_SIZE,
+                replace_keys: list = None, change_detection: bool = False, prepared_statements: bool = True,
+                column_types: dict = None) -> dict:
+    """
+    Записывает подготовленный DataFrame в таблицу в текущей транзакции соединения (без COMMIT).
+    column_types задаются для режима "binary" (данные уже приведены к нативным типам).
 
-    # Получаем итоговое число строк в таблице
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-    final_count = cursor.fetchone()[0]
+    :return: Словарь с фактически использованным режимом (load_mode) и счётчиками строк (counts).
+    """
+    conflict_columns_str = ", ".join(conflict_columns)
 
-    cursor.close()
-    conn.close()
+    def load_rows(cursor):
+        # Выполняем SQL-запросы, сгенерированные sql_generator'ом, и считаем затронутые строки:
+        # upsert-запросы возвращают RETURNING (xmax = 0), для остальных используется rowcount
+        rows_data = data[cols] if ROW_HASH_COLUMN in data.columns else data
+        if column_types:
+            # Пропуски нативных типов (NaN, NaT, <NA>) передаются как NULL
+            rows_data = rows_data.astype(object).where(rows_data.notna(), None)
+        row_counts = {"inserted": 0, "updated": 0}
+        execute = execute_prepared if prepared_statements else type(cursor).execute
+        for sql, params in (sql_generator or row_upsert_generator(cols, conflict_columns))(rows_data, table_name):
+            execute(cursor, sql, params)
+            if cursor.description:
+                for (was_inserted,) in cursor.fetchall():
+                    row_counts["inserted" if was_inserted else "updated"] += 1
+            elif sql.lstrip().upper().startswith("DELETE"):
+                row_counts["deleted"] = row_counts.get("deleted", 0) + cursor.rowcount
+            else:
+                row_counts["inserted"] += cursor.rowcount
+        return row_counts
 
-    context.log.info(f"📤 Данные загружены в {table_name}. Итоговое число строк: {final_count}")
-    return {"table_name": table_name, "status": "success", "final_count": final_count}
+    counts = {}
+    with conn.cursor() as cursor:
+        if replace_keys and load_mode != "row":
+            deleted, inserted = replace_by_keys(cursor, table_name, data, replace_keys,
+                                                use_copy=load_mode != "batch", batch_size=batch_size,
+                                                column_types=column_types)
+            counts = {"inserted": inserted, "deleted": deleted}
+            context.log.info(f"🔁 {table_name}: удалено {deleted} строк, вставлено {inserted} строк "
+                             f"по ключам ({conflict_columns_str})")
+        elif load_mode in ("copy", "batch", "binary"):
+            try:
+                if change_detection:
+                    counts = changed_rows_upsert(cursor, table_name, data, conflict_columns,
+                                                 use_copy=load_mode != "batch", batch_size=batch_size,
+                                                 column_types=column_types)
+                    context.log.info(f"🔍 {table_name}: вставлено {counts['inserted']}, обновлено {counts['updated']}, "
+                                     f"без изменений {counts['unchanged']}")
+                elif load_mode in ("copy", "binary"):
+                    counts = copy_upsert(cursor, table_name, data, conflict_columns, column_types=column_types)
+                    context.log.info(f"📦 COPY{' (binary)' if column_types else ''}: {len(data)} строк передано "
+                                     f"через staging-таблицу в {table_name}")
+                else:
+                    counts = batch_upsert(cursor, table_name, data, conflict_columns, batch_size=batch_size,
+                                          report=log_batch_rate(context, table_name))
+            except psycopg2.errors.CardinalityViolation:
+                # Один и тот же ключ встречается в пачке несколько раз - set-based upsert невозможен
+                conn.rollback()
+                context.log.warning(
+                    f"⚠️ В данных для {table_name} повторяются ключи ({conflict_columns_str}), "
+                    f"переключаемся на построчную загрузку."
+                )
+                load_mode = "row"
+                counts = load_rows(cursor)
+        else:
+            counts = load_rows(cursor)
+    return {"load_mode": load_mode, "counts": counts}
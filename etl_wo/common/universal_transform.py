@@ -1,8 +1,9 @@
-import os
-import json
 import pandas as pd
 from dagster import OpExecutionContext
 
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.transform_pipeline import apply_stages
+
 
 def universal_transform(
         context: OpExecutionContext,
@@ -20,7 +21,7 @@ def universal_transform(
       df: DataFrame, полученный на этапе извлечения.
 
     Функция:
-      1. Загружает настройки из mapping.json.
+      1. Получает план таблицы из реестра маппинга (mapping.json).
       2. Получает ожидаемые имена столбцов (mapping_fields) для указанной таблицы.
       3. Сверяет имена столбцов в DataFrame с ожидаемыми.
       4. Логгирует отсутствующие столбцы (если есть).
@@ -31,21 +32,8 @@ def universal_transform(
          - "missing_columns" (список отсутствующих столбцов).
     """
 
-    # Проверяем наличие файла маппинга
-    if not os.path.exists(mapping_file):
-        context.log.error(f"❌ Файл маппинга {mapping_file} не найден.")
-        raise FileNotFoundError(f"Файл маппинга {mapping_file} не найден.")
-
-    # Загружаем настройки маппинга
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
-
-    table_config = mappings.get("tables", {}).get(table_name)
-    if not table_config:
-        context.log.error(f"❌ Настройки для таблицы '{table_name}' не найдены в {mapping_file}.")
-        raise ValueError(f"Настройки для таблицы '{table_name}' не найдены.")
-
-    mapping_fields = table_config.get("mapping_fields", {})
+    # Переименование столбцов - из плана таблицы реестра маппинга
+    mapping_fields = table_plan(mapping_file, table_name, context)["rename"]
 
     # Сверяем имена столбцов в DataFrame с ожидаемыми
     missing_columns = [col for col in mapping_fields.keys() if col not in df.columns]
@@ -54,7 +42,8 @@ def universal_transform(
 
     # Переименовываем только те столбцы, которые реально есть в DataFrame
     rename_dict = {orig: new for orig, new in mapping_fields.items() if orig in df.columns}
-    transformed_df = df.rename(columns=rename_dict)
+    # (этап "rename" конвейера: столбцы не копируются)
+    transformed_df = apply_stages(df, [{"stage": "rename", "columns": rename_dict}])
 
     context.log.info(f"✅ Итоговый список столбцов: {list(transformed_df.columns)}")
 
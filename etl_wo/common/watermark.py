@@ -0,0 +1,93 @@
+# common/watermark.py
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.common.complex_talons import COMPLEX_KEY
+from etl_wo.common.date_parse import parse_dates
+from etl_wo.config.config import STATE_DIR
+
+# Отметки инкрементальной загрузки: STATE_DIR/watermarks/<таблица>.json с наибольшим значением
+# столбца изменения (по умолчанию last_change_date) по каждому источнику (source)
+WATERMARK_DIR = os.path.join(STATE_DIR, "watermarks")
+DEFAULT_WATERMARK_COLUMN = "last_change_date"
+WATERMARK_KEY = "source"
+# Даты журнала бывают с временем и без: каждое различное значение разбирается по своему формату (день первым)
+WATERMARK_DATE_FORMAT = "mixed"
+
+
+def watermark_path(table_name: str) -> str:
+    return os.path.join(WATERMARK_DIR, f"{table_name}.json")
+
+
+def read_watermarks(table_name: str) -> dict:
+    """Сохранённые отметки таблицы: {"column": столбец, "marks": {источник: ISO-время}} или пустой словарь."""
+    path = watermark_path(table_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def source_marks(df: pd.DataFrame, column: str = DEFAULT_WATERMARK_COLUMN, key: str = WATERMARK_KEY) -> dict:
+    """
+    Наибольшее значение столбца изменения по каждому источнику (ISO-время).
+    Пустые и нераспознанные даты не учитываются.
+    """
+    values, _ = parse_dates(df[column], WATERMARK_DATE_FORMAT)
+    frame = pd.DataFrame({"key": df[key].astype(object).to_numpy(), "value": values.to_numpy()}).dropna()
+    if frame.empty:
+        return {}
+    return {str(source): value.isoformat() for source, value in frame.groupby("key")["value"].max().items()}
+
+
+def incremental_mask(df: pd.DataFrame, marks: dict, column: str = DEFAULT_WATERMARK_COLUMN,
+                     key: str = WATERMARK_KEY) -> np.ndarray:
+    """
+    Строки, которые нужно загрузить при инкрементальной загрузке: значение столбца изменения не меньше отметки
+    своего источника (равные отметке загружаются повторно - даты журнала бывают без времени, а повторный upsert
+    не меняет данных), строки источников без отметки и строки с пустой или нераспознанной датой.
+    Строки талона (пара (talon, source)) берутся все, если изменилась хотя бы одна из них: комплексный
+    талон заменяется загрузкой целиком.
+
+    :return: Булев массив numpy длины len(df).
+    """
+    if not marks:
+        return np.ones(len(df), dtype=bool)
+    values, _ = parse_dates(df[column], WATERMARK_DATE_FORMAT)
+    thresholds = pd.to_datetime(df[key].astype(str).map(marks).to_numpy())
+    keep = (values.isna() | pd.isna(thresholds) | (values.to_numpy() >= thresholds)).to_numpy()
+    if keep.all() or not set(COMPLEX_KEY) <= set(df.columns):
+        return keep
+    hashes = pd.util.hash_pandas_object(df[COMPLEX_KEY], index=False).to_numpy()
+    return np.isin(hashes, hashes[keep])
+
+
+def save_watermarks(table_name: str, column: str, marks: dict, run_id: str = None) -> dict:
+    """
+    Сдвигает отметки таблицы после успешной загрузки: по каждому источнику сохраняется наибольшее
+    из прежней и новой отметки. Файл сначала пишется во временный и затем атомарно заменяет прежний.
+
+    :return: Сохранённые отметки {источник: ISO-время}.
+    """
+    state = read_watermarks(table_name)
+    merged = dict(state.get("marks", {})) if state.get("column") == column else {}
+    for source, value in marks.items():
+        if source not in merged or pd.Timestamp(value) > pd.Timestamp(merged[source]):
+            merged[source] = value
+    os.makedirs(WATERMARK_DIR, exist_ok=True)
+    path = watermark_path(table_name)
+    state = {
+        "table_name": table_name,
+        "column": column,
+        "marks": merged,
+        "run_id": run_id,
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+    return merged
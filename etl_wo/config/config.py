@@ -42,3 +42,6 @@ DATABASES = {
 }
 
 ORGANIZATIONS = os.environ.get('ORGANIZATIONS', 'МозаикаМед')
+
+# Каталог для служебного состояния ETL (контрольные точки загрузки и т.п.)
+STATE_DIR = os.environ.get('ETL_STATE_DIR') or 'etl_wo/data/.state'
@@ -1,14 +1,14 @@
 import json
-import psycopg2
-from sqlalchemy import create_engine
 from dagster import asset, Output, OpExecutionContext
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.health_probe import probe_tables, probe_metadata, describe_probe, DEFAULT_TIME_BUDGET
 from etl_wo.config.config import config
 
 # Загружаем настройки подключения к БД
 organizations = config.get("organizations", {})
 
 @asset
-def check_db(context: OpExecutionContext):
+def check_db(context: OpExecutionContext, db: DatabaseResource):
     """
     Проверяет подключение к базе данных и наличие таблицы в .env.
     """
@@ -21,14 +21,13 @@ def check_db(context: OpExecutionContext):
 
     db_config = organizations[org]
 
-    # Подключаемся через SQLAlchemy
+    # Проверяем подключение через соединение из общего пула процесса
+    pool = db.organization_pool(org)
+    health = pool.health_check()
     try:
-        engine = create_engine(
-            f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
-        )
-        with engine.connect() as conn:
-            conn.close()
-        text_value = f"✅ Подключение к {org}.{db_config['dbname']} успешно!"
+        if not health["ok"]:
+            raise ValueError(health["error"])
+        text_value = f"✅ Подключение к {org}.{db_config['dbname']} успешно! ({health['latency_ms']} мс)"
         context.log.info(text_value)
         print(text_value)
     except Exception as e:
@@ -43,15 +42,17 @@ def check_db(context: OpExecutionContext):
         context.log.info(text_value)
         raise ValueError(text_value)
 
-    # Для каждой таблицы выводим количество строк
-    with engine.connect() as conn:
-        for table in tables:
-            try:
-                from sqlalchemy import text
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
-                context.log.info(f"📋 Таблица {table}: {result} строк")
-            except Exception as ex:
-                context.log.info(f"⚠️ Не удалось получить число строк для таблицы {table}: {ex}")
+    # Проверяем все таблицы одновременно (существование, права, число строк: оценка из каталога,
+    # точный COUNT(*) - по full_count) в пределах бюджета времени
+    full_count = context.op_config.get("full_count", False)
+    time_budget = context.op_config.get("time_budget", DEFAULT_TIME_BUDGET)
+    results = probe_tables(pool, tables, time_budget=time_budget, full_count=full_count)
+    for table, result in results.items():
+        if result["ok"]:
+            context.log.info(f"📋 Таблица {table}: {describe_probe(result)}")
+        else:
+            context.log.info(f"⚠️ Таблица {table}: {describe_probe(result)}")
+    context.add_output_metadata(probe_metadata(results))
 
     text_value = f"📋 В БД {org} найдены таблицы: {', '.join(tables)}"
     context.log.info(text_value)
@@ -4,13 +4,15 @@ from .extract import talon_extract2
 from .transform import talon_transform2
 from .load_normal import talon_load_normal
 from .load_complex import talon_load_complex
+from .ledger import talon_ingest_ledger
 
 talons_assets = [
     talon_db_check,
     talon_extract2,
     talon_transform2,
     talon_load_complex,
-    talon_load_normal
+    talon_load_normal,
+    talon_ingest_ledger
 ]
 
 
@@ -21,3 +23,4 @@ def job_talons():
     transform_result = talon_transform2(extract_result)
     normal_load = talon_load_normal(transform_result)
     complex_load = talon_load_complex(transform_result)
+    talon_ingest_ledger(extract_result, normal_load, complex_load)
@@ -1,4 +1,4 @@
-from dagster import asset, Field, String, OpExecutionContext, AssetIn
+from dagster import asset, Field, String, Int, Bool, Array, OpExecutionContext, AssetIn
 
 from etl_wo.jobs.job1.flow_config import TABLE_NAME, MAPPING_FILE, DATA_FOLDER
 
@@ -8,6 +8,20 @@ from etl_wo.jobs.job1.flow_config import TABLE_NAME, MAPPING_FILE, DATA_FOLDER
         "mapping_file": Field(String, default_value=MAPPING_FILE),
         "data_folder": Field(String, default_value=DATA_FOLDER),
         "table_name": Field(String, default_value=TABLE_NAME),
+        "chunksize": Field(Int, default_value=0, is_required=False,
+                           description="Потоковый режим: читать и загружать файл порциями по chunksize строк "
+                                       "(0 - читать файл целиком)"),
+        "all_files": Field(Bool, default_value=False, is_required=False,
+                           description="Читать все подходящие файлы папки одновременно (строки - по времени файлов) "
+                                       "вместо последнего файла"),
+        "files": Field(Array(String), is_required=False,
+                       description="Имена файлов для чтения (задаёт сенсор)"),
+        "workers": Field(Int, default_value=0, is_required=False,
+                         description="Число процессов для чтения файлов (0 - по числу файлов и CPU)"),
+        "force": Field(Bool, default_value=False, is_required=False,
+                       description="Загрузить файлы повторно, даже если такое же содержимое уже загружено"),
+        "parse_cache": Field(Bool, default_value=True, is_required=False,
+                             description="Брать разобранные ранее файлы из кэша Parquet и сохранять в него новые"),
     },
     ins={"talon_db_check": AssetIn()}
 )
@@ -16,6 +30,11 @@ def talon_extract2(context: OpExecutionContext, talon_db_check: dict) -> dict:
     Извлекает CSV-файл для таблицы.
     Перед выполнением происходит проверка БД (результат передаётся через db_check).
     Все параметры можно переопределить через интерфейс Dagster.
+    При chunksize > 0 файл не читается целиком: возвращается описание потока для загрузки порциями.
+    При all_files (или списке files) все файлы читаются одновременно и загружаются одной загрузкой; талон,
+    который есть в нескольких файлах, берётся из самого нового (см. talon_transform2). Потоковый режим
+    с несколькими файлами не поддерживается.
+    Файлы, содержимое которых уже загружено (журнал загрузок), пропускаются, если не задан force.
     """
 
     config = context.op_config
@@ -24,5 +43,13 @@ def talon_extract2(context: OpExecutionContext, talon_db_check: dict) -> dict:
     table_name = config["table_name"]
 
     from etl_wo.common.universal_extract import universal_extract
-    result = universal_extract(context, mapping_file, data_folder, table_name)
+    result = universal_extract(context, mapping_file, data_folder, table_name,
+                               chunksize=config.get("chunksize", 0), all_files=config.get("all_files", False),
+                               files=config.get("files"), workers=config.get("workers", 0),
+                               force=config.get("force", False),
+                               parse_cache=config.get("parse_cache", True))
+    if result.get("stream") is not None and len(result["source_files"]) > 1:
+        # Комплексные пары потока ищутся по всем файлам сразу, а строки старых выгрузок не отбрасываются
+        context.log.error("❌ Потоковый режим талонов читает только один файл за запуск.")
+        raise ValueError("chunksize > 0 is not supported together with several talon files (all_files/files).")
     return result
@@ -0,0 +1,32 @@
+from dagster import asset, OpExecutionContext, AssetIn
+
+from etl_wo.common.ingest_ledger import record_ingested
+from etl_wo.common.watermark import save_watermarks
+
+
+@asset(
+    ins={
+        "talon_extract2": AssetIn(),
+        "talon_load_normal": AssetIn(),
+        "talon_load_complex": AssetIn(),
+    }
+)
+def talon_ingest_ledger(context: OpExecutionContext, talon_extract2: dict, talon_load_normal: dict,
+                        talon_load_complex: dict) -> dict:
+    """
+    Записывает загруженные файлы в журнал загрузок (ingest_ledger) после того, как обе загрузки
+    (обычные и комплексные талоны) завершились: файл с тем же содержимым больше не будет загружаться.
+    В режиме incremental здесь же сдвигаются отметки last_change_date по источникам (см. common/watermark).
+    """
+    table_name = talon_extract2.get("table_name")
+    ingest = talon_extract2.get("ingest") or []
+    for info in ingest:
+        record_ingested(table_name, info, run_id=context.run_id, row_count=info.get("rows"))
+    if ingest:
+        context.log.info(f"📒 В журнал загрузок {table_name} записано файлов: {len(ingest)}")
+
+    watermark = talon_load_normal.get("watermark")
+    if watermark and watermark["marks"]:
+        marks = save_watermarks(watermark["table_name"], watermark["column"], watermark["marks"], context.run_id)
+        context.log.info(f"🔖 Отметки {watermark['column']} для {watermark['table_name']}: {marks}")
+    return {"table_name": table_name, "files": len(ingest)}
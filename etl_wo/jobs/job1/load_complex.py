@@ -1,41 +1,54 @@
-from dagster import asset, OpExecutionContext, AssetIn
+from dagster import asset, OpExecutionContext, AssetIn, Field, String
 import numpy as np
-from etl_wo.common.universal_load import load_dataframe
+from etl_wo.common.sql_templates import delete_by_keys_sql, insert_sql
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.universal_load import load_dataframe, LOAD_CONFIG_SCHEMA, load_options
+from etl_wo.common.stream_load import load_stream
+from etl_wo.jobs.job1.flow_config import MAPPING_FILE
 
 def complex_sql_generator(data, table_name):
     # Исключаем столбцы, которые генерируются автоматически: created_at и updated_at
     cols = [col for col in data.columns if col.lower() not in ("created_at", "updated_at")]
-    # Формируем итоговый список столбцов для INSERT: обычные столбцы + created_at и updated_at
-    insert_columns = cols + ["created_at", "updated_at"]
+    # Тексты запросов строятся один раз (кэш sql_templates): удаление по ключу и вставка,
+    # где для created_at и updated_at вставляется CURRENT_TIMESTAMP
+    delete_sql = delete_by_keys_sql(table_name, ("talon", "source"))
+    sql = insert_sql(table_name, tuple(cols))
     groups = data.groupby(["talon", "source"])
     for (talon, source), group in groups:
         talon_key = str(talon) if isinstance(talon, np.generic) else talon
         source_key = str(source) if isinstance(source, np.generic) else source
         # Удаляем существующие записи по ключу
-        delete_sql = f"DELETE FROM {table_name} WHERE talon = %s AND source = %s;"
         yield delete_sql, (talon_key, source_key)
-        # Для каждой группы формируем запрос на вставку, где для created_at и updated_at вставляем CURRENT_TIMESTAMP
         for _, row in group.iterrows():
-            sql = f"""
-            INSERT INTO {table_name} ({', '.join(insert_columns)})
-            VALUES ({', '.join(['%s'] * len(cols))}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP);
-            """
             values = tuple(row[col] for col in cols)
             yield sql, values
 
 @asset(
+    config_schema={
+        "mapping_file": Field(String, default_value=MAPPING_FILE, is_required=False),
+        **LOAD_CONFIG_SCHEMA
+    },
     ins={"talon_transform2": AssetIn()}
 )
-def talon_load_complex(context: OpExecutionContext, talon_transform2: dict):
+def talon_load_complex(context: OpExecutionContext, talon_transform2: dict, db: DatabaseResource):
     """
     Загружает данные для комплексных талонов.
+    Все строки по затронутым парам (talon, source) заменяются целиком: по умолчанию set-based
+    (staging-таблица, один DELETE ... USING и один INSERT ... SELECT в одной транзакции),
+    в режиме load_mode="row" - построчно через complex_sql_generator.
     """
     payload = talon_transform2.get("complex", {})
     table_name = payload.get("table_name")
     data = payload.get("data")
 
+    if payload.get("stream") is not None:
+        return load_stream(context, table_name, payload["stream"], db_alias="default",
+                           mapping_file=context.op_config["mapping_file"], replace_keys=["talon", "source"], db=db,
+                           **load_options(context.op_config))
     if data is None or data.empty:
         context.log.info(f"ℹ️ Нет данных для таблицы {table_name} (комплексные талоны).")
         return {"table_name": table_name, "status": "skipped"}
 
-    return load_dataframe(context, table_name, data, db_alias="default", sql_generator=complex_sql_generator)
+    return load_dataframe(context, table_name, data, db_alias="default", mapping_file=context.op_config["mapping_file"],
+                          sql_generator=complex_sql_generator, replace_keys=["talon", "source"],
+                          db=db, **load_options(context.op_config))
@@ -1,38 +1,47 @@
-from dagster import asset, OpExecutionContext, Field, StringSource, AssetIn
-from etl_wo.common.universal_load import load_dataframe
+from dagster import asset, OpExecutionContext, Field, StringSource, String, AssetIn
+from etl_wo.common.sql_templates import upsert_sql
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.universal_load import load_dataframe, LOAD_CONFIG_SCHEMA, load_options
+from etl_wo.common.stream_load import load_stream
+from etl_wo.jobs.job1.flow_config import MAPPING_FILE
 
 def normal_sql_generator(data, table_name):
     # Исключаем столбцы, которые не должны передаваться вручную: created_at и updated_at
     cols = [col for col in data.columns if col.lower() not in ("created_at", "updated_at")]
-    # Формируем список столбцов для вставки: берем все наши данные и добавляем created_at и updated_at
-    insert_columns = cols + ["created_at", "updated_at"]
+    # Текст запроса строится один раз (кэш sql_templates): для обычных столбцов значения берутся из row,
+    # а для created_at и updated_at вставляется CURRENT_TIMESTAMP прямо в запрос
+    sql = upsert_sql(table_name, tuple(cols), ("talon", "source"))
     for _, row in data.iterrows():
-        # Для обычных столбцов берем значения из row, а для created_at и updated_at вставляем CURRENT_TIMESTAMP прямо в запрос
-        sql = f"""
-        INSERT INTO {table_name} ({', '.join(insert_columns)})
-        VALUES ({', '.join(['%s'] * len(cols))}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ON CONFLICT (talon, source)
-        DO UPDATE SET {', '.join([f"{col} = EXCLUDED.{col}" for col in cols if col not in ('talon', 'source')])};
-        """
         yield sql, tuple(row[col] for col in cols)
 
 @asset(
     config_schema={
         "organization": Field(StringSource, default_value="default", is_required=False),
-        "table_name": Field(StringSource, default_value="load_data_sick_leave_sheets", is_required=False)
+        "table_name": Field(StringSource, default_value="load_data_sick_leave_sheets", is_required=False),
+        "mapping_file": Field(String, default_value=MAPPING_FILE, is_required=False),
+        **LOAD_CONFIG_SCHEMA
     },
     ins={"talon_transform2": AssetIn()}
 )
-def talon_load_normal(context: OpExecutionContext, talon_transform2: dict):
+def talon_load_normal(context: OpExecutionContext, talon_transform2: dict, db: DatabaseResource):
     """
     Загружает данные для обычных талонов (режим upsert).
+    Новые отметки инкрементальной загрузки (watermark) передаются в результате: их сохраняет
+    talon_ingest_ledger после того, как завершились обе загрузки.
     """
     payload = talon_transform2.get("normal", {})
     table_name = payload.get("table_name")
     data = payload.get("data")
 
+    if payload.get("stream") is not None:
+        return load_stream(context, table_name, payload["stream"], db_alias="default",
+                           mapping_file=context.op_config["mapping_file"], db=db,
+                           **load_options(context.op_config))
     if data is None or data.empty:
         context.log.info(f"ℹ️ Нет данных для таблицы {table_name} (обычные талоны).")
-        return {"table_name": table_name, "status": "skipped"}
+        return {"table_name": table_name, "status": "skipped", "watermark": payload.get("watermark")}
 
-    return load_dataframe(context, table_name, data, db_alias="default", sql_generator=normal_sql_generator)
+    result = load_dataframe(context, table_name, data, db_alias="default",
+                            mapping_file=context.op_config["mapping_file"], sql_generator=normal_sql_generator,
+                            source_file=payload.get("source_file"), db=db, **load_options(context.op_config))
+    return {**result, "watermark": payload.get("watermark")}
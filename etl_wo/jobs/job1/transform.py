@@ -1,11 +1,79 @@
-import json
+from functools import partial
+
+import numpy as np
 import pandas as pd
-from dagster import asset, Field, String, OpExecutionContext, AssetIn
+from dagster import asset, Field, String, Bool, OpExecutionContext, AssetIn
 
-from etl_wo.common.connect_db import connect_to_db
+from etl_wo.common.categorical import encode_categories, describe_report
+from etl_wo.common.complex_talons import COMPLEX_KEY, key_hashes, complex_mask, split_complex, latest_file_mask
+from etl_wo.common.date_parse import reject_report_path, write_rejects, summarize_rejects, clear_rejects
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.row_hash import add_row_hash
+from etl_wo.common.schema_cache import table_schema, varchar_columns
+from etl_wo.common.transform_pipeline import DEFAULT_PIPELINE, parse_stages, apply_stages, describe_stats, \
+    stats_metadata
+from etl_wo.common.universal_extract import iter_csv_chunks
+from etl_wo.common.watermark import DEFAULT_WATERMARK_COLUMN, read_watermarks, source_marks, incremental_mask
 from etl_wo.config.config import ORGANIZATIONS
 from etl_wo.jobs.job1.flow_config import MAPPING_FILE, TABLE_NAME, NORMAL_TABLE, COMPLEX_TABLE
 
+def find_complex_keys(stream: dict, column_mapping: dict) -> np.ndarray:
+    """
+    Хэши пар (talon, source), встречающихся в файле потока больше одного раза.
+    Файл читается порциями и только по двум ключевым столбцам: в памяти хранятся лишь 8 байт на строку.
+    """
+    source_columns = {target: source for source, target in column_mapping.items()}
+    usecols = [source_columns[col] for col in COMPLEX_KEY]
+    hashes = [key_hashes(chunk.rename(columns=column_mapping)) for chunk in iter_csv_chunks(stream, usecols=usecols)]
+    if not hashes:
+        return np.empty(0, dtype="uint64")
+    values, counts = np.unique(np.concatenate(hashes), return_counts=True)
+    return values[counts > 1]
+
+
+def transform_frame(df: pd.DataFrame, column_mapping: dict, db_columns: list, change_detection: bool = False,
+                    complex_keys: np.ndarray = None, pipeline: list = None, stats: list = None,
+                    reject_report: str = None) -> pd.DataFrame:
+    """
+    Трансформация одного DataFrame (всего файла или порции потока): этапы конвейера таблицы (по умолчанию -
+    переименование и отбор столбцов по маппингу, заполнение отсутствующих обязательных столбцов "-") за один
+    проход, признак is_complex, хэш строки при change_detection.
+    Для порции потока комплексные пары (talon, source) определяются по всему файлу заранее (complex_keys).
+
+    :param pipeline: Этапы конвейера (план таблицы "pipeline", по умолчанию DEFAULT_PIPELINE).
+    :param stats: (Опционально) Список, в который добавляется статистика этапов.
+    :param reject_report: (Опционально) CSV-файл, в который дописываются нераспознанные даты (этап "dates").
+    """
+    # Приводим столбцы к требуемому виду
+    rejects = []
+    df = apply_stages(df, pipeline or parse_stages(DEFAULT_PIPELINE), rename=column_mapping, required=db_columns,
+                      stats=stats, rejects=rejects)
+    if reject_report:
+        write_rejects(reject_report, rejects)
+
+    # Определяем комплексные записи: если по паре (talon, source) найдено более одной записи,
+    # помечаем их как комплексные (один векторный проход по ключевым столбцам)
+    df["is_complex"] = complex_mask(df, complex_keys)
+
+    if change_detection:
+        df = add_row_hash(df)
+    return df
+
+
+def transform_part(df: pd.DataFrame, part: str, **params) -> pd.DataFrame:
+    """
+    Трансформация порции потока с отбором строк одной части: "normal" или "complex".
+    Нераспознанные даты порции записываются в отчёт только при обработке части "normal" (порция читается
+    для каждой части, и без этого строки отчёта повторялись бы).
+    """
+    if part != "normal":
+        params = {**params, "reject_report": None}
+    df = transform_frame(df, **params)
+    normal_df, complex_df = split_complex(df, df["is_complex"].to_numpy())
+    return complex_df if part == "complex" else normal_df
+
+
 @asset(
     config_schema={
         "mapping_file": Field(String, default_value=MAPPING_FILE),
@@ -14,19 +82,40 @@ from etl_wo.jobs.job1.flow_config import MAPPING_FILE, TABLE_NAME, NORMAL_TABLE,
         "complex_table": Field(String, default_value=COMPLEX_TABLE),
         # Можно добавить параметр для выбора базы, если требуется:
         "db_alias": Field(String, default_value="default"),
+        "change_detection": Field(Bool, default_value=False, is_required=False),
+        "incremental": Field(Bool, default_value=False, is_required=False,
+                             description="Загружать только строки, изменившиеся не раньше сохранённой отметки "
+                                         "(наибольшего значения watermark_column по источнику) прошлой загрузки"),
+        "full_refresh": Field(Bool, default_value=False, is_required=False,
+                              description="В режиме incremental загрузить все строки без учёта отметок "
+                                          "(отметки после загрузки всё равно сдвигаются)"),
+        "watermark_column": Field(String, default_value=DEFAULT_WATERMARK_COLUMN, is_required=False,
+                                  description="Столбец даты изменения строки для отметок инкрементальной загрузки"),
     },
     ins={"talon_extract2": AssetIn()}
 )
-def talon_transform2(context: OpExecutionContext, talon_extract2: dict) -> dict:
+def talon_transform2(context: OpExecutionContext, talon_extract2: dict, db: DatabaseResource) -> dict:
     """
     Трансформация данных:
-      1. Загружает настройки маппинга из mapping.json и переименовывает столбцы.
+      1. Берёт маппинг столбцов и этапы конвейера трансформации из реестра маппинга (mapping.json).
       2. Получает список обязательных столбцов из схемы таблицы базы данных.
-      3. Если в DataFrame отсутствуют обязательные столбцы, добавляет их со значением дефолта "-".
+      3. Выполняет этапы конвейера (по умолчанию: переименование и отбор столбцов, добавление отсутствующих
+         обязательных столбцов со значением дефолта "-") за один проход без копирования столбцов.
       4. Добавляет столбец "is_complex" (по умолчанию False) и определяет комплексные записи
-         (если по паре (talon, source) найдено более одной строки).
-      5. Делит данные на два DataFrame: normal и complex.
-      6. Возвращает словарь с ключами "normal" и "complex", где для каждого указывается имя таблицы для загрузки.
+         (если по паре (talon, source) найдено более одной строки). Если прочитано несколько файлов,
+         строки каждой пары берутся только из самого нового файла, в котором она есть.
+      5. При change_detection добавляет столбец с хэшем строки (etl_row_hash).
+      6. В режиме incremental оставляет только строки, изменившиеся не раньше отметки своего источника
+         (все строки талона, если изменилась хотя бы одна); новые отметки сохраняются после загрузки
+         (talon_ingest_ledger). full_refresh загружает все строки.
+      7. Хранит текстовые столбцы с малым числом различных значений категориями (ключ "categorical" таблицы
+         в mapping.json или автоматический выбор); в строки они переводятся только при загрузке в БД.
+      8. Делит данные на два DataFrame: normal и complex.
+      9. Возвращает словарь с ключами "normal" и "complex", где для каждого указывается имя таблицы для загрузки.
+
+    В потоковом режиме (extract с chunksize > 0) файл здесь читается только по столбцам talon и source, чтобы
+    найти комплексные пары по всему файлу; остальные шаги добавляются к описанию потока каждой части
+    и применяются загрузкой к каждой порции файла.
     """
     # Получаем параметры конфигурации
     config = context.op_config
@@ -36,34 +125,27 @@ def talon_transform2(context: OpExecutionContext, talon_extract2: dict) -> dict:
     complex_table = config["complex_table"]
     db_alias = config["db_alias"]
 
+    if talon_extract2.get("skipped"):
+        context.log.info("ℹ️ Файлы уже загружены ранее, трансформация пропущена.")
+        return {"normal": {"table_name": normal_table, "data": None},
+                "complex": {"table_name": complex_table, "data": None}}
+
     # Извлекаем DataFrame из предыдущего этапа
     df = talon_extract2.get("data")
-    if df is None:
+    stream = talon_extract2.get("stream")
+    if df is None and stream is None:
         context.log.error("❌ Ошибка: Нет данных для трансформации!")
         raise ValueError("Нет данных для трансформации.")
 
-    # Загружаем маппинг и переименовываем столбцы
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
-    table_config = mappings.get("tables", {}).get(table_name, {})
-    column_mapping = table_config.get("mapping_fields", {})
-
-    # Приводим столбцы к требуемому виду
-    df = df.rename(columns=column_mapping)
-    df = df[list(column_mapping.values())]
+    # Маппинг столбцов - из плана таблицы реестра маппинга (mapping.json читается, только если изменился)
+    plan = table_plan(mapping_file, table_name, context)
+    column_mapping = plan["rename"]
 
     # Получаем список обязательных столбцов (только для varchar) из схемы таблицы БД
-    engine, conn = connect_to_db(db_alias=db_alias, organization=ORGANIZATIONS, context=context)
-    sql = f"""
-      SELECT column_name 
-      FROM information_schema.columns 
-      WHERE table_name = '{table_name}' 
-        AND data_type = 'character varying';
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(sql)
-        db_columns = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    # (из кэша схемы: каталог читается заново, только если таблица изменилась)
+    with db.pool(db_alias, context, organization=ORGANIZATIONS).connection(context) as conn:
+        with conn.cursor() as cursor:
+            db_columns = varchar_columns(table_schema(cursor, table_name, db_alias, context))
 
     if not db_columns:
         context.log.error(f"❌ Не удалось получить список столбцов для таблицы {table_name} из базы данных.")
@@ -71,24 +153,63 @@ def talon_transform2(context: OpExecutionContext, talon_extract2: dict) -> dict:
 
     context.log.info(f"✅ Обязательные столбцы из БД (varchar): {db_columns}")
 
-    # Заполняем отсутствующие обязательные столбцы дефолтным значением
-    for col in db_columns:
-        if col not in df.columns:
-            df[col] = "-"
+    params = {"column_mapping": column_mapping, "db_columns": db_columns,
+              "change_detection": config["change_detection"], "pipeline": plan["pipeline"],
+              "reject_report": reject_report_path(table_name, context.run_id)}
+    clear_rejects(params["reject_report"])
+    source_file = talon_extract2.get("source_file")
+    if stream is not None:
+        complex_keys = find_complex_keys(stream, column_mapping)
+        if config["incremental"]:
+            context.log.info("ℹ️ В потоковом режиме загружаются все строки файла, отметки incremental не сдвигаются.")
+        context.log.info(f"🔄 Трансформация будет применена к каждой порции потока. "
+                         f"Комплексных пар (talon, source): {len(complex_keys)}. "
+                         f"Нераспознанные даты будут записаны в {params['reject_report']}")
+        return {
+            part: {"table_name": part_table, "data": None, "source_file": source_file,
+                   "stream": {**stream, "transform": partial(transform_part, part=part, complex_keys=complex_keys,
+                                                             **params)}}
+            for part, part_table in (("normal", normal_table), ("complex", complex_table))
+        }
 
-    # Добавляем столбец is_complex по умолчанию
-    df["is_complex"] = False
+    # Несколько выгрузок читаются одним DataFrame: талон, попавший в несколько файлов, берётся только из самого
+    # нового из них, иначе его строки из разных файлов были бы приняты за комплексный талон
+    file_rows = talon_extract2.get("file_rows") or []
+    if len(file_rows) > 1:
+        source_columns = {target: source for source, target in column_mapping.items()}
+        keep = latest_file_mask(df, file_rows, [source_columns.get(col, col) for col in COMPLEX_KEY])
+        if not keep.all():
+            df = df.take(np.flatnonzero(keep))
+        context.log.info(f"📑 Файлов: {len(file_rows)}, отброшено строк талонов, которые есть в более новых файлах: "
+                         f"{int((~keep).sum())}")
 
-    # Определяем комплексные записи: если по паре (talon, source) найдено более одной записи,
-    # помечаем их как комплексные
-    grouped = df.groupby(["talon", "source"])
-    for (talon, source), group in grouped:
-        if len(group) > 1:
-            df.loc[group.index, "is_complex"] = True
+    stats = []
+    df = transform_frame(df, stats=stats, **params)
+
+    # Инкрементальная загрузка: признак is_complex уже определён по всему файлу, отбрасываются
+    # только талоны, ни одна строка которых не изменилась после отметки своего источника
+    watermark = None
+    if config["incremental"]:
+        column = config["watermark_column"]
+        if column not in df.columns:
+            context.log.error(f"❌ Столбец отметок {column} отсутствует в данных {table_name}.")
+            raise ValueError(f"Watermark column '{column}' not found in data.")
+        state = {} if config["full_refresh"] else read_watermarks(table_name)
+        marks = state.get("marks", {}) if state.get("column") == column else {}
+        watermark = {"table_name": table_name, "column": column, "marks": source_marks(df, column)}
+        keep = incremental_mask(df, marks, column)
+        if not keep.all():
+            df = df.take(np.flatnonzero(keep))
+        mode = "полная загрузка (full_refresh)" if config["full_refresh"] else f"отметки {marks or 'отсутствуют'}"
+        context.log.info(f"⏩ Инкрементальная загрузка, {mode}: загружается {int(keep.sum())} строк, "
+                         f"пропущено {int((~keep).sum())} не изменившихся")
+
+    # Текстовые столбцы с малым числом различных значений (department, doctor, status и т.п.) хранятся
+    # категориями до записи в БД; обе части после деления ссылаются на одни и те же категории
+    df, categories = encode_categories(df, plan["categorical"])
 
     # Делим DataFrame на два: обычные и комплексные записи
-    normal_df = df[df["is_complex"] == False].copy()
-    complex_df = df[df["is_complex"] == True].copy()
+    normal_df, complex_df = split_complex(df, df["is_complex"].to_numpy())
 
     normal_count = len(normal_df)
     complex_count = len(complex_df)
@@ -96,8 +217,19 @@ def talon_transform2(context: OpExecutionContext, talon_extract2: dict) -> dict:
         f"🔄 Трансформация завершена. Всего строк: {len(df)}. "
         f"Обычных: {normal_count}. Комплексных: {complex_count}."
     )
+    context.log.info(f"⏱️ Этапы трансформации: {describe_stats(stats)}")
+    rejected = summarize_rejects(params["reject_report"])
+    if rejected:
+        context.log.warning(f"⚠️ Нераспознанные даты загружаются как NULL {rejected}, отчёт: {params['reject_report']}")
+    if categories["columns"]:
+        context.log.info(f"🗜️ Категории: {describe_report(categories)}")
+    context.add_output_metadata({**stats_metadata(stats), "categorical_columns": len(categories["columns"]),
+                                 "categorical_saved_mb": round(categories["saved_mb"], 2),
+                                 "date_rejects": sum(rejected.values())})
 
     return {
-        "normal": {"table_name": normal_table, "data": normal_df},
-        "complex": {"table_name": complex_table, "data": complex_df}
+        # Новые отметки передаются через загрузку обычных талонов и сохраняются после обеих загрузок
+        "normal": {"table_name": normal_table, "data": normal_df, "source_file": source_file,
+                   "watermark": watermark},
+        "complex": {"table_name": complex_table, "data": complex_df, "source_file": source_file}
     }
@@ -1,15 +1,22 @@
-from dagster import asset, Field, Array, String, OpExecutionContext
+from dagster import asset, Field, Array, String, Bool, Float, OpExecutionContext
 from etl_wo.common.check_db import check_db
+from etl_wo.common.health_probe import DEFAULT_TIME_BUDGET
+from etl_wo.common.db_pool import DatabaseResource
 from etl_wo.config.config import ORGANIZATIONS
 
 
 @asset(
     config_schema={
         "organization": Field(String, default_value=ORGANIZATIONS),
-        "tables": Field(Array(String))
+        "tables": Field(Array(String)),
+        "full_count": Field(Bool, default_value=False, is_required=False),
+        "probe": Field(Bool, default_value=True, is_required=False,
+                       description="Проверять таблицы одновременно с ограничением по времени"),
+        "time_budget": Field(Float, default_value=DEFAULT_TIME_BUDGET, is_required=False,
+                             description="Бюджет времени на проверку всех таблиц, секунд")
     }
 )
-def kvazar_db_check(context: OpExecutionContext) -> dict:
+def kvazar_db_check(context: OpExecutionContext, db: DatabaseResource) -> dict:
     """
     Проверяет подключение к базе и наличие указанных таблиц.
     Все сообщения выводятся через context.log.info() для единого лога.
@@ -18,5 +25,6 @@ def kvazar_db_check(context: OpExecutionContext) -> dict:
     organization = config["organization"]
     tables = config["tables"]
     # Передаём context в функцию проверки
-    result = check_db(context, organization=organization, tables=tables)
+    result = check_db(context, organization=organization, tables=tables, full_count=config["full_count"], db=db,
+                      probe=config["probe"], time_budget=config["time_budget"])
     return result
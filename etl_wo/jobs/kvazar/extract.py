@@ -1,4 +1,4 @@
-from dagster import asset, Field, String, OpExecutionContext, AssetIn
+from dagster import asset, Field, String, Int, Bool, Array, OpExecutionContext, AssetIn
 
 
 
@@ -7,6 +7,20 @@ from dagster import asset, Field, String, OpExecutionContext, AssetIn
         "mapping_file": Field(String),
         "data_folder": Field(String),
         "table_name": Field(String),
+        "chunksize": Field(Int, default_value=0, is_required=False,
+                           description="Потоковый режим: читать и загружать файл порциями по chunksize строк "
+                                       "(0 - читать файл целиком)"),
+        "all_files": Field(Bool, default_value=False, is_required=False,
+                           description="Читать все подходящие файлы папки одновременно (строки - по времени файлов) "
+                                       "вместо последнего файла"),
+        "files": Field(Array(String), is_required=False,
+                       description="Имена файлов для чтения (задаёт сенсор)"),
+        "workers": Field(Int, default_value=0, is_required=False,
+                         description="Число процессов для чтения файлов (0 - по числу файлов и CPU)"),
+        "force": Field(Bool, default_value=False, is_required=False,
+                       description="Загрузить файлы повторно, даже если такое же содержимое уже загружено"),
+        "parse_cache": Field(Bool, default_value=True, is_required=False,
+                             description="Брать разобранные ранее файлы из кэша Parquet и сохранять в него новые"),
     },
     ins={"kvazar_db_check": AssetIn()}
 )
@@ -15,6 +29,9 @@ def kvazar_extract(context: OpExecutionContext, kvazar_db_check: dict) -> dict:
     Извлекает CSV-файл для таблицы.
     Перед выполнением происходит проверка БД (результат передаётся через db_check).
     Все параметры можно переопределить через интерфейс Dagster.
+    При chunksize > 0 файл не читается целиком: возвращается описание потока для загрузки порциями.
+    При all_files (или списке files) все файлы читаются одновременно и загружаются одной загрузкой.
+    Файлы, содержимое которых уже загружено (журнал загрузок), пропускаются, если не задан force.
     """
 
     config = context.op_config
@@ -23,5 +40,9 @@ def kvazar_extract(context: OpExecutionContext, kvazar_db_check: dict) -> dict:
     table_name = config["table_name"]
 
     from etl_wo.common.universal_extract import universal_extract
-    result = universal_extract(context, mapping_file, data_folder, table_name)
+    result = universal_extract(context, mapping_file, data_folder, table_name,
+                               chunksize=config.get("chunksize", 0), all_files=config.get("all_files", False),
+                               files=config.get("files"), workers=config.get("workers", 0),
+                               force=config.get("force", False),
+                               parse_cache=config.get("parse_cache", True))
     return result
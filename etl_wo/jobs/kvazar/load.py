@@ -1,12 +1,17 @@
 import glob
 import os
-import json
 from dagster import asset, OpExecutionContext, Field, StringSource, AssetIn, String
-from etl_wo.common.universal_load import load_dataframe
+from etl_wo.common.sql_templates import upsert_sql
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.ingest_ledger import record_ingested
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.universal_load import load_dataframe, LOAD_CONFIG_SCHEMA, load_options
+from etl_wo.common.stream_load import load_stream
 
-def clear_data_folder(data_folder):
-    # Получаем список всех файлов в папке
-    files = glob.glob(os.path.join(data_folder, '*'))
+def clear_data_folder(data_folder, files=None):
+    # Получаем список всех файлов в папке (или только загруженных файлов, если они известны:
+    # файлы, появившиеся во время загрузки, остаются для следующего запуска)
+    files = files or glob.glob(os.path.join(data_folder, '*'))
     for file in files:
         try:
             os.remove(file)
@@ -15,68 +20,75 @@ def clear_data_folder(data_folder):
             print(f"Не удалось удалить {file}: {e}")
 
 def kvazar_sql_generator(data, table_name, mapping_file):
-    # Загружаем настройки маппинга из mapping_file
-    if not os.path.exists(mapping_file):
-        raise FileNotFoundError(f"Mapping file {mapping_file} not found.")
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
-    table_config = mappings.get("tables", {}).get(table_name, {})
-    conflict_columns = table_config.get("column_check", [])
+    # Конфликтные столбцы - из плана таблицы реестра маппинга (mapping_file читается, только если изменился)
+    plan = table_plan(mapping_file, table_name)
+    conflict_columns = plan["conflict_columns"]
     if not conflict_columns:
         raise ValueError(f"Conflict columns (column_check) not specified for table {table_name}.")
-    conflict_columns_str = ", ".join(conflict_columns)
 
     # Исключаем автоматически генерируемые столбцы
     cols = [col for col in data.columns if col.lower() not in ("created_at", "updated_at")]
-    # Формируем список столбцов для вставки: добавляем created_at и updated_at
-    insert_columns = cols + ["created_at", "updated_at"]
 
-    # Генерируем SQL-запросы с использованием конфликтных столбцов из маппинга
+    # Для столбцов маппинга запрос уже собран в плане; иначе текст строится один раз (кэш sql_templates),
+    # created_at и updated_at заполняются CURRENT_TIMESTAMP
+    if cols == plan["columns"]:
+        sql = plan["upsert_sql"]
+    else:
+        sql = upsert_sql(table_name, tuple(cols), tuple(conflict_columns))
     for _, row in data.iterrows():
-        update_clause = ", ".join([f"{col} = EXCLUDED.{col}" for col in cols if col not in conflict_columns])
-        sql = f"""
-        INSERT INTO {table_name} ({', '.join(insert_columns)})
-        VALUES ({', '.join(['%s'] * len(cols))}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ON CONFLICT ({conflict_columns_str})
-        DO UPDATE SET {update_clause};
-        """
         yield sql, tuple(row[col] for col in cols)
 
 @asset(
     config_schema={
         "table_name": Field(StringSource, is_required=True, description="Имя таблицы для загрузки"),
         "data_folder": Field(String, is_required=True, description="Путь к папке с CSV-файлами"),
-        "mapping_file": Field(String, is_required=True, description="Путь к файлу mapping.json")
+        "mapping_file": Field(String, is_required=True, description="Путь к файлу mapping.json"),
+        **LOAD_CONFIG_SCHEMA
     },
     ins={"kvazar_transform": AssetIn()}
 )
-def kvazar_load(context: OpExecutionContext, kvazar_transform: dict):
+def kvazar_load(context: OpExecutionContext, kvazar_transform: dict, db: DatabaseResource):
     """
     Загружает данные для указанной таблицы.
     Все параметры (table_name, data_folder, mapping_file) передаются через op config.
     При формировании SQL используется список конфликтных столбцов из mapping.json (ключ column_check).
+    Режим загрузки задаётся параметром load_mode (по умолчанию COPY + set-based upsert).
+    Если extract работал в потоковом режиме (chunksize > 0), файл загружается порциями (load_stream).
+    После успешной загрузки файлы записываются в журнал загрузок (ingest_ledger).
     """
     table_name = context.op_config["table_name"]
     data_folder = context.op_config["data_folder"]
     mapping_file = context.op_config["mapping_file"]
     data = kvazar_transform.get("data")
+    stream = kvazar_transform.get("stream")
 
-    if data is None or data.empty:
+    if stream is not None:
+        result = load_stream(context, table_name, stream, db_alias="default", mapping_file=mapping_file, db=db,
+                             **load_options(context.op_config))
+    elif data is None or data.empty:
         context.log.info(f"ℹ️ Нет данных для загрузки в таблицу {table_name}.")
         return {"table_name": table_name, "status": "skipped"}
-
-    # Вызываем универсальную функцию загрузки, передавая наш генератор SQL с mapping_file
-    result = load_dataframe(
-        context,
-        table_name,
-        data,
-        db_alias="default",
-        mapping_file=mapping_file,
-        sql_generator=lambda d, t: kvazar_sql_generator(d, t, mapping_file)
-    )
+    else:
+        # Вызываем универсальную функцию загрузки, передавая наш генератор SQL с mapping_file
+        result = load_dataframe(
+            context,
+            table_name,
+            data,
+            db_alias="default",
+            mapping_file=mapping_file,
+            sql_generator=lambda d, t: kvazar_sql_generator(d, t, mapping_file),
+            source_file=kvazar_transform.get("source_file"),
+            db=db,
+            **load_options(context.op_config)
+        )
 
     if result.get("status") == "success":
-        clear_data_folder(data_folder)
+        # Записываем загруженные файлы в журнал: файл с тем же содержимым больше не будет загружаться
+        ingest = kvazar_transform.get("ingest") or []
+        for info in ingest:
+            rows = info.get("rows", result.get("rows_read") if len(ingest) == 1 else None)
+            record_ingested(table_name, info, run_id=context.run_id, row_count=rows)
+        clear_data_folder(data_folder, kvazar_transform.get("source_files"))
         context.log.info(f"✅ Папка {data_folder} очищена")
 
     return result
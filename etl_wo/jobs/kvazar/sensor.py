@@ -5,6 +5,8 @@ import fnmatch
 
 from dagster import sensor, RunRequest, SkipReason
 
+from etl_wo.common.ingest_ledger import find_ingested, describe_entry
+from etl_wo.common.mapping_registry import load_mapping
 from etl_wo.config.config import ORGANIZATIONS
 from etl_wo.jobs.kvazar import (
     kvazar_job_eln,
@@ -15,10 +17,13 @@ from etl_wo.jobs.kvazar import (
 )
 
 MIN_FILE_AGE_SECONDS = 60
+# Отметка в состоянии сенсора для файла, содержимое которого уже загружено: файл не запускается и не удаляется,
+# пока не изменится (значение - префикс и время изменения файла)
+DUPLICATE_PREFIX = "duplicate:"
 
 
 def _load_state(context) -> dict:
-    """Загружаем из cursor словарь вида {filename: run_key}."""
+    """Загружаем из cursor словарь вида {filename: run_key или отметка DUPLICATE_PREFIX}."""
     if context.cursor:
         return json.loads(context.cursor)
     return {}
@@ -29,21 +34,75 @@ def _save_state(context, state: dict):
     context.update_cursor(json.dumps(state, ensure_ascii=False))
 
 
-def create_sensor(job, sensor_name, data_folder, table_name, mapping_file):
+def _run_config(data_folder: str, table_name: str, mapping_file: str, files: list = None) -> dict:
+    """Конфиг запуска джоба Kvazar; files - готовые файлы, которые extract читает одновременно."""
+    extract_config = {
+        "data_folder": data_folder,
+        "mapping_file": mapping_file,
+        "table_name": table_name,
+    }
+    if files:
+        extract_config["files"] = files
+    # ✅ Добавляем ВСЕ блоки в конфиг:
+    return {
+        "ops": {
+            "kvazar_db_check": {
+                "config": {
+                    "organization": ORGANIZATIONS,  # можно заменить на реальный список
+                    "tables": [table_name]
+                }
+            },
+            "kvazar_extract": {
+                "config": extract_config
+            },
+            "kvazar_transform": {
+                "config": {
+                    "mapping_file": mapping_file,
+                    "table_name": table_name
+                }
+            },
+            "kvazar_load": {
+                "config": {
+                    "table_name": table_name,
+                    "data_folder": data_folder,
+                    "mapping_file": mapping_file
+                }
+            }
+        }
+    }
+
+
+def create_sensor(job, sensor_name, data_folder, table_name, mapping_file, all_files=False):
+    """
+    Сенсор папки выгрузок Kvazar. По умолчанию на каждый готовый файл запускается отдельный джоб;
+    при all_files=True все готовые файлы, ещё не взятые в обработку, передаются одному запуску
+    (extract читает их одновременно, и они загружаются одной загрузкой).
+    Файлы, содержимое которых уже есть в журнале загрузок (ingest_ledger), не запускаются и не удаляются:
+    они отмечаются в состоянии сенсора и пропускаются, пока не изменятся. Чтобы загрузить такой файл повторно,
+    его запускают вручную с files=[имя файла] и force=True в конфиге kvazar_extract.
+    """
     @sensor(job=job, name=sensor_name)
     def _sensor(context):
         sensor_state = _load_state(context)  # {filename: run_key}
 
-        # Проверяем наличие mapping.json
-        if not os.path.exists(mapping_file):
+        # План таблицы из реестра маппинга: mapping.json читается заново, только если файл изменился
+        try:
+            mapping = load_mapping(mapping_file)
+        except FileNotFoundError:
             context.log.info(f"❌ Файл маппинга {mapping_file} не найден.")
             yield SkipReason("Mapping file not found.")
             return
-
-        with open(mapping_file, "r", encoding="utf-8") as f:
-            mapping = json.load(f)
-        table_config = mapping.get("tables", {}).get(table_name)
-        if not table_config:
+        except ValueError as e:
+            context.log.info(f"❌ Файл маппинга {mapping_file} содержит ошибки: {e}")
+            yield SkipReason("Mapping file is invalid.")
+            return
+        if table_name in mapping["errors"]:
+            context.log.info(f"❌ Настройки таблицы '{table_name}' в {mapping_file} содержат ошибки: "
+                             f"{mapping['errors'][table_name]}")
+            yield SkipReason("Mapping config for table is invalid.")
+            return
+        plan = mapping["plans"].get(table_name)
+        if not plan:
             context.log.info(f"❌ Настройки для таблицы '{table_name}' не найдены в {mapping_file}.")
             yield SkipReason("Mapping config for table not found.")
             return
@@ -64,10 +123,8 @@ def create_sensor(job, sensor_name, data_folder, table_name, mapping_file):
         valid_files = []
         invalid_files = []
 
-        # Получаем шаблон файлов
-        file_pattern = table_config.get("file", {}).get("file_pattern", "")
-        file_format = table_config.get("file", {}).get("file_format", "")
-        valid_pattern = f"{file_pattern}.{file_format}"
+        # Шаблон файлов: file_pattern.file_format
+        valid_pattern = plan["file_mask"]
 
         for file in files:
             file_path = os.path.join(data_folder, file)
@@ -94,8 +151,22 @@ def create_sensor(job, sensor_name, data_folder, table_name, mapping_file):
             yield SkipReason("Нет валидных файлов.")
             return
 
+        # Отметки повторов для файлов, которых больше нет в папке, не нужны
+        for file in [file for file, value in sensor_state.items()
+                     if value.startswith(DUPLICATE_PREFIX) and file not in valid_files]:
+            del sensor_state[file]
+
+        new_files = []
         for file in valid_files:
             existing_run_key = sensor_state.get(file)
+            file_path = os.path.join(data_folder, file)
+
+            if existing_run_key and existing_run_key.startswith(DUPLICATE_PREFIX):
+                if existing_run_key == f"{DUPLICATE_PREFIX}{os.path.getmtime(file_path)}":
+                    continue
+                # Файл изменился после проверки: сверяем его с журналом заново
+                del sensor_state[file]
+                existing_run_key = None
 
             if existing_run_key:
                 runs = context.instance.get_runs()
@@ -120,42 +191,28 @@ def create_sensor(job, sensor_name, data_folder, table_name, mapping_file):
                         del sensor_state[file]
 
             if file not in sensor_state:
+                # Файл с уже загруженным содержимым (например, повторно выложенная выгрузка) не запускаем
+                entry, _ = find_ingested(table_name, file_path)
+                if entry:
+                    context.log.info(f"♻️ Файл {file} {describe_entry(entry)}, пропускаем без загрузки "
+                                     f"(для повторной загрузки запустите джоб с files=['{file}'] и force=True).")
+                    sensor_state[file] = f"{DUPLICATE_PREFIX}{os.path.getmtime(file_path)}"
+                    continue
+                new_files.append(file)
+
+        if all_files and new_files:
+            new_files.sort()
+            new_run_key = f"{new_files[-1]}-{len(new_files)}-{int(time.time())}"
+            context.log.info(f"Запуск процесса обновления для {len(new_files)} файлов c run_key={new_run_key}.")
+            yield RunRequest(run_key=new_run_key,
+                             run_config=_run_config(data_folder, table_name, mapping_file, files=new_files))
+            for file in new_files:
+                sensor_state[file] = new_run_key
+        else:
+            for file in new_files:
                 new_run_key = f"{file}-{int(time.time())}"
                 context.log.info(f"Запуск процесса обновления для файла {file} c run_key={new_run_key}.")
-
-                # ✅ Добавляем ВСЕ блоки в конфиг:
-                run_config = {
-                    "ops": {
-                        "kvazar_db_check": {
-                            "config": {
-                                "organization": ORGANIZATIONS,  # можно заменить на реальный список
-                                "tables": [table_name]
-                            }
-                        },
-                        "kvazar_extract": {
-                            "config": {
-                                "data_folder": data_folder,
-                                "mapping_file": mapping_file,
-                                "table_name": table_name,
-                            }
-                        },
-                        "kvazar_transform": {
-                            "config": {
-                                "mapping_file": mapping_file,
-                                "table_name": table_name
-                            }
-                        },
-                        "kvazar_load": {
-                            "config": {
-                                "table_name": table_name,
-                                "data_folder": data_folder,
-                                "mapping_file": mapping_file
-                            }
-                        }
-                    }
-                }
-
-                yield RunRequest(run_key=new_run_key, run_config=run_config)
+                yield RunRequest(run_key=new_run_key, run_config=_run_config(data_folder, table_name, mapping_file))
                 sensor_state[file] = new_run_key
 
         _save_state(context, sensor_state)
@@ -169,7 +226,8 @@ kvazar_sensor_eln = create_sensor(
     "kvazar_sensor_eln",
     "etl_wo/data/kvazar/eln",
     "load_data_sick_leave_sheets",
-    "etl_wo/config/mapping.json"
+    "etl_wo/config/mapping.json",
+    all_files=True
 )
 
 kvazar_sensor_emd = create_sensor(
@@ -177,7 +235,8 @@ kvazar_sensor_emd = create_sensor(
     "kvazar_sensor_emd",
     "etl_wo/data/kvazar/emd",
     "load_data_emd",
-    "etl_wo/config/mapping.json"
+    "etl_wo/config/mapping.json",
+    all_files=True
 )
 
 kvazar_sensor_recipes = create_sensor(
@@ -185,7 +244,8 @@ kvazar_sensor_recipes = create_sensor(
     "kvazar_sensor_recipes",
     "etl_wo/data/kvazar/recipe",
     "load_data_recipes",
-    "etl_wo/config/mapping.json"
+    "etl_wo/config/mapping.json",
+    all_files=True
 )
 
 kvazar_sensor_death = create_sensor(
@@ -193,7 +253,8 @@ kvazar_sensor_death = create_sensor(
     "kvazar_sensor_death",
     "etl_wo/data/kvazar/death",
     "load_data_death",
-    "etl_wo/config/mapping.json"
+    "etl_wo/config/mapping.json",
+    all_files=True
 )
 
 kvazar_sensor_reference = create_sensor(
@@ -201,5 +262,6 @@ kvazar_sensor_reference = create_sensor(
     "kvazar_sensor_reference",
     "etl_wo/data/kvazar/reference",
     "load_data_reference",
-    "etl_wo/config/mapping.json"
+    "etl_wo/config/mapping.json",
+    all_files=True
 )
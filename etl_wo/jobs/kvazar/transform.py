@@ -1,58 +1,90 @@
-import json
-from dagster import asset, Field, String, OpExecutionContext, AssetIn
-from etl_wo.common.connect_db import connect_to_db
+from functools import partial
+
+import pandas as pd
+from dagster import asset, Field, String, Bool, OpExecutionContext, AssetIn
+from etl_wo.common.categorical import encode_categories, describe_report
+from etl_wo.common.date_parse import reject_report_path, write_rejects, summarize_rejects, clear_rejects
+from etl_wo.common.db_pool import DatabaseResource
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.row_hash import add_row_hash
+from etl_wo.common.schema_cache import table_schema, varchar_columns
+from etl_wo.common.transform_pipeline import DEFAULT_PIPELINE, parse_stages, apply_stages, describe_stats, \
+    stats_metadata
 from etl_wo.config.config import ORGANIZATIONS
 
 
+def transform_frame(df: pd.DataFrame, column_mapping: dict, db_columns: list,
+                    change_detection: bool = False, pipeline: list = None, stats: list = None,
+                    reject_report: str = None) -> pd.DataFrame:
+    """
+    Трансформация одного DataFrame (всего файла или порции потока): этапы конвейера таблицы
+    (по умолчанию - переименование и отбор столбцов по маппингу, заполнение отсутствующих обязательных
+    столбцов "-") за один проход, хэш строки при change_detection.
+
+    :param pipeline: Этапы конвейера (план таблицы "pipeline", по умолчанию DEFAULT_PIPELINE).
+    :param stats: (Опционально) Список, в который добавляется статистика этапов.
+    :param reject_report: (Опционально) CSV-файл, в который дописываются нераспознанные даты (этап "dates").
+    """
+    rejects = []
+    df = apply_stages(df, pipeline or parse_stages(DEFAULT_PIPELINE), rename=column_mapping, required=db_columns,
+                      stats=stats, rejects=rejects)
+    if reject_report:
+        write_rejects(reject_report, rejects)
+
+    if change_detection:
+        df = add_row_hash(df)
+    return df
+
+
 @asset(
     config_schema={
         "mapping_file": Field(String),
-        "table_name": Field(String)
+        "table_name": Field(String),
+        "change_detection": Field(Bool, default_value=False, is_required=False,
+                                  description="Добавить хэш строки для пропуска неизменившихся строк при загрузке")
     },
     ins={"kvazar_extract": AssetIn()}
 )
-def kvazar_transform(context: OpExecutionContext, kvazar_extract: dict) -> dict:
+def kvazar_transform(context: OpExecutionContext, kvazar_extract: dict, db: DatabaseResource) -> dict:
     """
     Универсальная трансформация данных для sick_leave:
-      1. Загружает настройки маппинга из mapping.json и переименовывает столбцы.
+      1. Берёт маппинг столбцов и этапы конвейера трансформации из реестра маппинга (mapping.json).
       2. Извлекает обязательные столбцы (varchar) из схемы таблицы в базе данных.
-      3. Добавляет отсутствующие обязательные столбцы со значением "-" по умолчанию.
-      4. Возвращает единственный словарь с ключами "table_name" и "data".
+      3. Выполняет этапы конвейера (по умолчанию: переименование и отбор столбцов, добавление отсутствующих
+         обязательных столбцов со значением "-") за один проход без копирования столбцов.
+      4. При change_detection добавляет столбец с хэшем строки (etl_row_hash).
+      5. Хранит текстовые столбцы с малым числом различных значений категориями (ключ "categorical" таблицы
+         в mapping.json или автоматический выбор); в строки они переводятся только при загрузке в БД.
+      6. Возвращает единственный словарь с ключами "table_name" и "data".
+
+    В потоковом режиме (extract с chunksize > 0) данных ещё нет: трансформация добавляется к описанию потока
+    и применяется загрузкой к каждой порции файла.
     """
     # Получаем конфигурацию
     config = context.op_config
     mapping_file = config["mapping_file"]
     table_name = config["table_name"]
 
+    if kvazar_extract.get("skipped"):
+        context.log.info(f"ℹ️ Файлы для {table_name} уже загружены ранее, трансформация пропущена.")
+        return {"table_name": table_name, "data": None, "skipped": True}
+
     # Извлекаем DataFrame из предыдущего этапа
     df = kvazar_extract.get("data")
-    if df is None:
+    stream = kvazar_extract.get("stream")
+    if df is None and stream is None:
         context.log.error("❌ Ошибка: Нет данных для трансформации!")
         raise ValueError("Нет данных для трансформации.")
 
-    # Загружаем маппинг и переименовываем столбцы согласно mapping.json
-    with open(mapping_file, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
-    table_config = mappings.get("tables", {}).get(table_name, {})
-    column_mapping = table_config.get("mapping_fields", {})
-
-    # Переименовываем столбцы
-    df = df.rename(columns=column_mapping)
-    # Ограничиваем DataFrame только колонками из маппинга
-    df = df[list(column_mapping.values())]
+    # Маппинг столбцов - из плана таблицы реестра маппинга (mapping.json читается, только если изменился)
+    plan = table_plan(mapping_file, table_name, context)
+    column_mapping = plan["rename"]
 
     # Получаем обязательные столбцы (varchar) из схемы таблицы в базе данных
-    engine, conn = connect_to_db(organization=ORGANIZATIONS, context=context)
-    sql = f"""
-      SELECT column_name 
-      FROM information_schema.columns 
-      WHERE table_name = '{table_name}' 
-        AND data_type = 'character varying';
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(sql)
-        db_columns = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    # (из кэша схемы: каталог читается заново, только если таблица изменилась)
+    with db.pool(context=context, organization=ORGANIZATIONS).connection(context) as conn:
+        with conn.cursor() as cursor:
+            db_columns = varchar_columns(table_schema(cursor, table_name, "default", context))
 
     if not db_columns:
         context.log.error(f"❌ Не удалось получить список обязательных столбцов для таблицы {table_name}.")
@@ -60,10 +92,32 @@ def kvazar_transform(context: OpExecutionContext, kvazar_extract: dict) -> dict:
 
     context.log.info(f"✅ Обязательные столбцы из БД (varchar): {db_columns}")
 
-    # Заполняем отсутствующие обязательные столбцы дефолтным значением "-"
-    for col in db_columns:
-        if col not in df.columns:
-            df[col] = "-"
+    transform = partial(transform_frame, column_mapping=column_mapping, db_columns=db_columns,
+                        change_detection=config.get("change_detection", False), pipeline=plan["pipeline"],
+                        reject_report=reject_report_path(table_name, context.run_id))
+    clear_rejects(transform.keywords["reject_report"])
+    if stream is not None:
+        context.log.info(f"🔄 Трансформация для {table_name} будет применена к каждой порции потока. "
+                         f"Нераспознанные даты будут записаны в {transform.keywords['reject_report']}")
+        return {"table_name": table_name, "data": None, "source_file": kvazar_extract.get("source_file"),
+                "source_files": kvazar_extract.get("source_files"), "ingest": kvazar_extract.get("ingest"),
+                "stream": {**stream, "transform": transform}}
 
+    stats = []
+    df = transform(df, stats=stats)
     context.log.info(f"🔄 Трансформация для {table_name} завершена. Всего строк: {len(df)}")
-    return {"table_name": table_name, "data": df}
+    context.log.info(f"⏱️ Этапы трансформации {table_name}: {describe_stats(stats)}")
+    rejected = summarize_rejects(transform.keywords["reject_report"])
+    if rejected:
+        context.log.warning(f"⚠️ {table_name}: нераспознанные даты загружаются как NULL {rejected}, "
+                            f"отчёт: {transform.keywords['reject_report']}")
+
+    # Текстовые столбцы с малым числом различных значений хранятся категориями до записи в БД
+    df, categories = encode_categories(df, plan["categorical"])
+    if categories["columns"]:
+        context.log.info(f"🗜️ Категории {table_name}: {describe_report(categories)}")
+    context.add_output_metadata({**stats_metadata(stats), "categorical_columns": len(categories["columns"]),
+                                 "categorical_saved_mb": round(categories["saved_mb"], 2),
+                                 "date_rejects": sum(rejected.values())})
+    return {"table_name": table_name, "data": df, "source_file": kvazar_extract.get("source_file"),
+            "source_files": kvazar_extract.get("source_files"), "ingest": kvazar_extract.get("ingest")}
@@ -1,17 +1,14 @@
-import pandas as pd
-import json
 import os
 import fnmatch
 from dagster import asset, Output, OpExecutionContext
 
+from etl_wo.common.mapping_registry import load_mapping
+from etl_wo.common.universal_extract import read_csv, mapped_columns
+
 # Пути к файлам
 MAPPING_PATH = "etl_wo/config/mapping.json"
 DATA_PATH = "etl_wo/data/"
 
-# Загружаем mapping.json
-with open(MAPPING_PATH, "r", encoding="utf-8") as f:
-    mappings = json.load(f)
-
 
 @asset
 def talon_extract(context: OpExecutionContext, check_db: dict, talon_download_oms_file: str) -> dict:
@@ -28,9 +25,9 @@ def talon_extract(context: OpExecutionContext, check_db: dict, talon_download_om
     matched_table = None
     matched_file = None
 
-    for table_name, config in mappings["tables"].items():
-        file_pattern = config.get("file", {}).get("file_pattern", "")
-        file_format = config.get("file", {}).get("file_format", "")
+    # Планы таблиц из реестра маппинга (mapping.json читается при запуске, а не при импорте модуля)
+    plans = load_mapping(MAPPING_PATH, context)["plans"]
+    for table_name, plan in plans.items():
 
         # Проверяем, что таблица зарегистрирована в настройках БД
         if table_name not in db_tables:
@@ -40,7 +37,7 @@ def talon_extract(context: OpExecutionContext, check_db: dict, talon_download_om
             continue
 
         # Находим все файлы, соответствующие шаблону
-        matching_files = [f for f in data_files if fnmatch.fnmatch(f, f"{file_pattern}.{file_format}")]
+        matching_files = [f for f in data_files if fnmatch.fnmatch(f, plan["file_mask"])]
         if matching_files:
             # Выбираем последний файл из отсортированного списка
             matched_file = sorted(matching_files)[-1]
@@ -50,15 +47,11 @@ def talon_extract(context: OpExecutionContext, check_db: dict, talon_download_om
     if not matched_table:
         raise ValueError("❌ Не найден файл, соответствующий таблице в mapping.json и имеющийся в БД")
 
-    table_config = mappings["tables"][matched_table]
+    options = plans[matched_table]["read_options"]
     file_path = os.path.join(DATA_PATH, matched_file)
 
-    df = pd.read_csv(
-        file_path,
-        encoding=table_config["encoding"],
-        delimiter=table_config["delimiter"],
-        dtype=str
-    )
+    # Читаем только столбцы маппинга: остальные трансформация всё равно отбрасывает
+    df = read_csv(file_path, options, usecols=mapped_columns(file_path, options, plans[matched_table]["usecols"]))
     text_value = f"📥 Загружено {len(df)} строк из {matched_file}"
     context.log.info(text_value)
 
@@ -1,8 +1,11 @@
 import json
-import psycopg2
 import numpy as np
-from dagster import asset, OpExecutionContext, Field, StringSource
+from dagster import asset, OpExecutionContext, Field, StringSource, String, Bool
 
+from etl_wo.common.bulk_load import replace_by_keys
+from etl_wo.common.sql_templates import delete_by_keys_sql, insert_sql, execute_prepared
+from etl_wo.common.table_stats import table_row_count, describe_row_count
+from etl_wo.common.db_pool import DatabaseResource
 from etl_wo.config.config import config as env_config
 
 organizations = env_config.get("organizations", {})
@@ -10,10 +13,14 @@ organizations = env_config.get("organizations", {})
 
 @asset(
     config_schema={
-        "organization": Field(StringSource, default_value="local", is_required=False)
+        "organization": Field(StringSource, default_value="local", is_required=False),
+        "load_mode": Field(String, default_value="set", is_required=False,
+                           description="Режим загрузки: set (один DELETE ... USING и bulk INSERT) или row (по группам)"),
+        "full_count": Field(Bool, default_value=False, is_required=False,
+                            description="Считать итоговое число строк через COUNT(*) (иначе - оценка из каталога)")
     }
 )
-def talon_load_complex(context: OpExecutionContext, talon_transform: dict):
+def talon_load_complex(context: OpExecutionContext, talon_transform: dict, db: DatabaseResource):
     """Загружает данные для комплексных талонов в таблицу load_data_complex_talons."""
     payload = talon_transform.get("complex", {})
     table_name = payload.get("table_name")
@@ -22,46 +29,41 @@ def talon_load_complex(context: OpExecutionContext, talon_transform: dict):
     org = context.op_config.get("organization", "local")
     if org not in organizations:
         raise ValueError(f"База {org} не найдена в db_connections.json")
-    db_config = organizations[org]
 
-    conn = psycopg2.connect(
-        dbname=db_config["dbname"],
-        user=db_config["user"],
-        password=db_config["password"],
-        host=db_config["host"],
-        port=db_config["port"]
-    )
-    cursor = conn.cursor()
+    # Соединение берётся из общего пула процесса; незафиксированная транзакция откатывается при возврате в пул
+    with db.organization_pool(org).connection(context) as conn:
+        cursor = conn.cursor()
+        full_count = context.op_config.get("full_count", False)
 
-    if data is None or data.empty:
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        final_count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
-        text_value = f"ℹ️ Нет данных для таблицы {table_name} (комплексные талоны). Итоговое число строк: {final_count}"
-        context.log.info(text_value)
-        print(text_value)
-        return {"table_name": table_name, "status": "skipped"}
+        if data is None or data.empty:
+            row_count = table_row_count(cursor, table_name, full_count=full_count)
+            cursor.close()
+            text_value = f"ℹ️ Нет данных для таблицы {table_name} (комплексные талоны). {describe_row_count(row_count)}"
+            context.log.info(text_value)
+            print(text_value)
+            return {"table_name": table_name, "status": "skipped"}
 
-    data.fillna("-", inplace=True)
-    groups = data.groupby(["talon", "source"])
-    for (talon, source), group in groups:
-        talon_key = str(talon) if isinstance(talon, np.generic) else talon
-        source_key = str(source) if isinstance(source, np.generic) else source
-        delete_sql = f"DELETE FROM {table_name} WHERE talon = %s AND source = %s;"
-        cursor.execute(delete_sql, (talon_key, source_key))
-        for _, row in group.iterrows():
-            insert_sql = f"""
-            INSERT INTO {table_name} ({', '.join(data.columns)})
-            VALUES ({', '.join(['%s'] * len(data.columns))});
-            """
-            values = tuple(x.item() if hasattr(x, "item") else x for x in row)
-            cursor.execute(insert_sql, values)
+        data.fillna("-", inplace=True)
+        if context.op_config.get("load_mode", "set") == "set":
+            deleted, inserted = replace_by_keys(cursor, table_name, data, ["talon", "source"], timestamps=False)
+        else:
+            deleted = inserted = 0
+            delete_sql = delete_by_keys_sql(table_name, ("talon", "source"))
+            row_insert_sql = insert_sql(table_name, tuple(data.columns), timestamps=False)
+            groups = data.groupby(["talon", "source"])
+            for (talon, source), group in groups:
+                talon_key = str(talon) if isinstance(talon, np.generic) else talon
+                source_key = str(source) if isinstance(source, np.generic) else source
+                execute_prepared(cursor, delete_sql, (talon_key, source_key))
+                deleted += cursor.rowcount
+                for _, row in group.iterrows():
+                    values = tuple(x.item() if hasattr(x, "item") else x for x in row)
+                    execute_prepared(cursor, row_insert_sql, values)
+                    inserted += cursor.rowcount
 
-    conn.commit()
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-    final_count = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
-    context.log.info(f"📤 Комплексные талоны загружены в {table_name}. Итоговое число строк: {final_count}")
-    return {"table_name": table_name, "status": "success"}
+        conn.commit()
+        row_count = table_row_count(cursor, table_name, full_count=full_count)
+        cursor.close()
+        context.log.info(f"📤 Комплексные талоны загружены в {table_name}: удалено {deleted}, вставлено {inserted}. "
+                         f"{describe_row_count(row_count)}")
+        return {"table_name": table_name, "status": "success", "inserted": inserted, "deleted": deleted, **row_count}
@@ -1,8 +1,12 @@
 import json
-import psycopg2
 import numpy as np
-from dagster import asset, OpExecutionContext, Field, StringSource
+from dagster import asset, OpExecutionContext, Field, StringSource, String, Int, Bool
 
+from etl_wo.common.bulk_load import batch_upsert, log_batch_rate, DEFAULT_BATCH_SIZE
+from etl_wo.common.dedup import drop_duplicate_keys, DEFAULT_DEDUP_RULE
+from etl_wo.common.sql_templates import upsert_sql, execute_prepared
+from etl_wo.common.table_stats import table_row_count, describe_row_count
+from etl_wo.common.db_pool import DatabaseResource
 from etl_wo.config.config import config as env_config
 
 organizations = env_config.get("organizations", {})
@@ -10,10 +14,18 @@ organizations = env_config.get("organizations", {})
 
 @asset(
     config_schema={
-        "organization": Field(StringSource, default_value="local", is_required=False)
+        "organization": Field(StringSource, default_value="local", is_required=False),
+        "load_mode": Field(String, default_value="batch", is_required=False,
+                           description="Режим загрузки: batch (пачки VALUES) или row (построчно)"),
+        "batch_size": Field(Int, default_value=DEFAULT_BATCH_SIZE, is_required=False),
+        "dedup": Field(String, default_value=DEFAULT_DEDUP_RULE, is_required=False,
+                       description="Правило удаления повторяющихся (talon, source) в режиме batch: "
+                                   "none, first, last или latest:<столбец>"),
+        "full_count": Field(Bool, default_value=False, is_required=False,
+                            description="Считать итоговое число строк через COUNT(*) (иначе - оценка из каталога)")
     }
 )
-def talon_load_normal(context: OpExecutionContext, talon_transform: dict):
+def talon_load_normal(context: OpExecutionContext, talon_transform: dict, db: DatabaseResource):
     """Загружает данные для обычных талонов в таблицу load_data_talons."""
     payload = talon_transform.get("normal", {})
     table_name = payload.get("table_name")
@@ -22,40 +34,39 @@ def talon_load_normal(context: OpExecutionContext, talon_transform: dict):
     org = context.op_config.get("organization", "local")
     if org not in organizations:
         raise ValueError(f"База {org} не найдена в db_connections.json")
-    db_config = organizations[org]
-
-    conn = psycopg2.connect(
-        dbname=db_config["dbname"],
-        user=db_config["user"],
-        password=db_config["password"],
-        host=db_config["host"],
-        port=db_config["port"]
-    )
-    cursor = conn.cursor()
-
-    if data is None or data.empty:
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        final_count = cursor.fetchone()[0]
+
+    # Соединение берётся из общего пула процесса; незафиксированная транзакция откатывается при возврате в пул
+    with db.organization_pool(org).connection(context) as conn:
+        cursor = conn.cursor()
+        full_count = context.op_config.get("full_count", False)
+
+        if data is None or data.empty:
+            row_count = table_row_count(cursor, table_name, full_count=full_count)
+            cursor.close()
+            text_value = f"ℹ️ Нет данных для таблицы {table_name} (обычные талоны). {describe_row_count(row_count)}"
+            context.log.info(text_value)
+            print(text_value)
+            return {"table_name": table_name, "status": "skipped"}
+
+        data.fillna("-", inplace=True)
+        if context.op_config.get("load_mode", "batch") == "batch":
+            dedup = context.op_config.get("dedup", DEFAULT_DEDUP_RULE)
+            data, duplicates = drop_duplicate_keys(data, ["talon", "source"], dedup)
+            if duplicates:
+                context.log.info(f"🧹 {table_name}: удалено {duplicates} строк с повторяющимися ключами "
+                                 f"(talon, source), правило: {dedup}")
+            counts = batch_upsert(cursor, table_name, data, ["talon", "source"],
+                                  batch_size=context.op_config.get("batch_size", DEFAULT_BATCH_SIZE),
+                                  timestamps=False, report=log_batch_rate(context, table_name))
+        else:
+            counts = {"inserted": 0, "updated": 0}
+            sql = upsert_sql(table_name, tuple(data.columns), ("talon", "source"), timestamps=False)
+            for _, row in data.iterrows():
+                execute_prepared(cursor, sql, tuple(row))
+                counts["inserted" if cursor.fetchone()[0] else "updated"] += 1
+        conn.commit()
+        row_count = table_row_count(cursor, table_name, full_count=full_count)
         cursor.close()
-        conn.close()
-        text_value = f"ℹ️ Нет данных для таблицы {table_name} (обычные талоны). Итоговое число строк: {final_count}"
-        context.log.info(text_value)
-        print(text_value)
-        return {"table_name": table_name, "status": "skipped"}
-
-    data.fillna("-", inplace=True)
-    for _, row in data.iterrows():
-        sql = f"""
-        INSERT INTO {table_name} ({', '.join(data.columns)})
-        VALUES ({', '.join(['%s'] * len(data.columns))})
-        ON CONFLICT (talon, source)
-        DO UPDATE SET {', '.join([f"{col} = EXCLUDED.{col}" for col in data.columns if col not in ('talon', 'source')])};
-        """
-        cursor.execute(sql, tuple(row))
-    conn.commit()
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-    final_count = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
-    context.log.info(f"📤 Обычные талоны загружены в {table_name}. Итоговое число строк: {final_count}")
-    return {"table_name": table_name, "status": "success"}
+        context.log.info(f"📤 Обычные талоны загружены в {table_name}: вставлено {counts['inserted']}, "
+                         f"обновлено {counts['updated']}. {describe_row_count(row_count)}")
+        return {"table_name": table_name, "status": "success", **counts, **row_count}
@@ -1,7 +1,11 @@
-import json
 import pandas as pd
 from dagster import asset, OpExecutionContext
 
+from etl_wo.common.complex_talons import classify_complex
+from etl_wo.common.date_parse import reject_report_path, write_rejects
+from etl_wo.common.mapping_registry import table_plan
+from etl_wo.common.transform_pipeline import apply_stages, describe_stats
+
 @asset
 def talon_transform(context: OpExecutionContext, talon_extract: dict):
     """
@@ -22,13 +26,7 @@ def talon_transform(context: OpExecutionContext, talon_extract: dict):
         raise ValueError(text_value)
 
     MAPPING_PATH = "etl_wo/config/mapping.json"
-    with open(MAPPING_PATH, "r", encoding="utf-8") as f:
-        mappings = json.load(f)
-    table_config = mappings["tables"].get(table_name, {})
-    column_mapping = table_config.get("mapping_fields", {})
-
-    df = df.rename(columns=column_mapping)
-    df = df[list(column_mapping.values())]
+    plan = table_plan(MAPPING_PATH, table_name, context)
 
     required_columns = [
         "talon", "report_period", "source", "account_number", "upload_date", "status",
@@ -41,19 +39,17 @@ def talon_transform(context: OpExecutionContext, talon_extract: dict):
         "additional_status_info", "is_complex"
     ]
 
-    for col in required_columns:
-        if col not in df.columns and col != "is_complex":
-            df[col] = "-"
-
-    df["is_complex"] = False
-
-    grouped = df.groupby(["talon", "source"])
-    for (talon, source), group in grouped:
-        if len(group) > 1:
-            df.loc[group.index, "is_complex"] = True
-
-    normal_df = df[df["is_complex"] == False].copy()
-    complex_df = df[df["is_complex"] == True].copy()
+    # Переименование, отбор столбцов и заполнение отсутствующих обязательных столбцов "-" - за один проход
+    stats, rejects = [], []
+    df = apply_stages(df, plan["pipeline"], rename=plan["rename"],
+                      required=[col for col in required_columns if col != "is_complex"], stats=stats, rejects=rejects)
+    context.log.info(f"⏱️ Этапы трансформации: {describe_stats(stats)}")
+    if rejects:
+        reject_report = reject_report_path(table_name, context.run_id)
+        context.log.warning(f"⚠️ Нераспознанные даты ({write_rejects(reject_report, rejects)}) загружаются как NULL, "
+                            f"отчёт: {reject_report}")
+
+    df, normal_df, complex_df = classify_complex(df)
     normal_count = len(normal_df)
     complex_count = len(complex_df)
     context.log.info(f"🔄 Трансформация завершена. Всего строк: {len(df)}. "
@@ -0,0 +1,31 @@
+import pytest
+
+from etl_wo.common import ingest_ledger
+from etl_wo.common.mapping_registry import clear_registry
+
+
+class FakeLog:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakeContext:
+    """Контекст ассета для функций, которым нужны только лог и метаданные."""
+    log = FakeLog()
+
+    def add_output_metadata(self, metadata, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def context():
+    return FakeContext()
+
+
+@pytest.fixture
+def state_dirs(tmp_path, monkeypatch):
+    """Журнал загрузок во временном каталоге и пустой реестр маппинга."""
+    monkeypatch.setattr(ingest_ledger, "LEDGER_DIR", str(tmp_path / "ledger"))
+    clear_registry()
+    yield tmp_path
+    clear_registry()
@@ -0,0 +1,90 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from dagster import AssetKey, asset, build_input_context, build_output_context, materialize
+
+from etl_wo.common.arrow_io import ArrowIOManager
+
+
+def output_context(run_id: str):
+    return build_output_context(run_id=run_id, step_key="kvazar_extract", name="result",
+                                asset_key=AssetKey("kvazar_extract"))
+
+
+def test_round_trip_keeps_frames_and_result_shape(tmp_path):
+    manager = ArrowIOManager(base_dir=str(tmp_path))
+    df = pd.DataFrame({
+        "number": ["1", np.nan, "3"],
+        "amount": [1.5, np.nan, 3.0],
+        "status": pd.Categorical(["a", "b", "a"]),
+        "code": pd.array(["x", None, "z"], dtype="string[pyarrow]"),
+    })
+    result = {"table_name": "load_data_sick_leave_sheets", "normal": {"data": df}, "source_file": "eln_1.csv"}
+    manager.handle_output(output_context("run-1"), result)
+    loaded = manager.load_input(build_input_context(upstream_output=output_context("run-1")))
+
+    assert loaded["table_name"] == result["table_name"] and loaded["source_file"] == "eln_1.csv"
+    pd.testing.assert_frame_equal(loaded["normal"]["data"], df)
+
+
+def test_runs_with_shared_asset_key_do_not_overwrite_each_other(tmp_path):
+    manager = ArrowIOManager(base_dir=str(tmp_path))
+    manager.handle_output(output_context("run-eln"), {"table_name": "load_data_sick_leave_sheets",
+                                                      "data": pd.DataFrame({"number": ["1"]})})
+    manager.handle_output(output_context("run-emd"), {"table_name": "load_data_emd",
+                                                      "data": pd.DataFrame({"id": ["2", "3"]})})
+
+    loaded = manager.load_input(build_input_context(upstream_output=output_context("run-eln")))
+    assert loaded["table_name"] == "load_data_sick_leave_sheets"
+    assert loaded["data"]["number"].tolist() == ["1"]
+
+
+def test_asset_materialized_alone_reads_latest_upstream_result(tmp_path):
+    @asset
+    def upstream():
+        return {"data": pd.DataFrame({"talon": ["1", "2"]})}
+
+    @asset
+    def downstream(upstream):
+        return len(upstream["data"])
+
+    resources = {"io_manager": ArrowIOManager(base_dir=str(tmp_path))}
+    assert materialize([upstream, downstream], resources=resources).success
+    result = materialize([upstream, downstream], selection=["downstream"], resources=resources)
+    assert result.output_for_node("downstream") == 2
+
+
+def age_files(directory, hours: float):
+    mtime = time.time() - hours * 3600
+    for root, _, names in os.walk(directory):
+        for name in names:
+            os.utime(os.path.join(root, name), (mtime, mtime))
+
+
+def test_expired_results_remove_payload_and_frames_together(tmp_path):
+    manager = ArrowIOManager(base_dir=str(tmp_path), retention_hours=1.0)
+    frame = pd.DataFrame({"number": ["1"]})
+    manager.handle_output(output_context("run-old"), {"data": frame})
+    age_files(tmp_path, hours=2)
+    manager.handle_output(output_context("run-new"), {"data": frame})
+
+    remaining = {os.path.relpath(os.path.join(root, name), tmp_path)
+                 for root, _, names in os.walk(tmp_path) for name in names}
+    assert not any("run-old" in path for path in remaining)
+    assert len(manager.load_input(build_input_context(upstream_output=output_context("run-new")))["data"]) == 1
+
+
+def test_old_frames_of_live_result_are_kept(tmp_path):
+    manager = ArrowIOManager(base_dir=str(tmp_path), retention_hours=1.0)
+    manager.handle_output(output_context("run-1"), {"data": pd.DataFrame({"number": ["1", "2"]})})
+    for root, _, names in os.walk(tmp_path):
+        for name in names:
+            if name.endswith(".arrow"):
+                old = time.time() - 2 * 3600
+                os.utime(os.path.join(root, name), (old, old))
+    manager.handle_output(output_context("run-2"), {"data": pd.DataFrame({"number": ["3"]})})
+
+    loaded = manager.load_input(build_input_context(upstream_output=output_context("run-1")))
+    assert loaded["data"]["number"].tolist() == ["1", "2"]
@@ -0,0 +1,34 @@
+import struct
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from etl_wo.common.binary_copy import NULL_FIELD, convert_column, encode_rows, numeric_bytes, to_native_types
+
+
+def test_numeric_bytes_encodes_base_10000_digits():
+    # 12345.678: группы 1, 2345, 6780, вес 1, масштаб 3
+    assert numeric_bytes(Decimal("12345.678")) == struct.pack(">hhhh3h", 3, 1, 0, 3, 1, 2345, 6780)
+    assert numeric_bytes(Decimal("-0.5")) == struct.pack(">hhhh1h", 1, -1, 0x4000, 1, 5000)
+    assert numeric_bytes(0.0) == struct.pack(">hhhh", 0, 0, 0, 1)
+
+
+def test_numeric_bytes_rejects_infinity():
+    with pytest.raises(ValueError):
+        numeric_bytes(float("inf"))
+
+
+@pytest.mark.parametrize("type_name", ["numeric", "int4", "int8"])
+def test_infinite_values_become_invalid(type_name):
+    data = pd.DataFrame({"amount": ["inf", "-inf", "2"]})
+    column_types = {"amount": {"type": type_name, "not_null": False}}
+    converted, invalid = to_native_types(data, column_types)
+    assert converted["amount"].isna().tolist() == [True, True, False]
+    assert invalid == {"amount": 2}
+    payload = encode_rows(converted, ["amount"], column_types)
+    assert payload.count(NULL_FIELD) == 2
+
+
+def test_float_columns_keep_infinity():
+    assert convert_column(pd.Series(["inf", "1,5"]), "float8").tolist() == [float("inf"), 1.5]
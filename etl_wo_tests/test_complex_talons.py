@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_wo.benchmarks.complex_talons import generate_journal, legacy_classify
+from etl_wo.common.complex_talons import classify_complex, complex_mask, key_hashes, split_complex
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_classification_matches_legacy_loop(seed):
+    journal = generate_journal(3000, complex_share=0.2, seed=seed)
+    journal.loc[journal.index[::97], "source"] = np.nan
+
+    legacy_df, legacy_normal, legacy_complex = legacy_classify(journal.copy())
+    df, normal, complex_rows = classify_complex(journal.copy())
+
+    assert df["is_complex"].tolist() == legacy_df["is_complex"].tolist()
+    pd.testing.assert_frame_equal(normal, legacy_normal)
+    pd.testing.assert_frame_equal(complex_rows, legacy_complex)
+
+
+def test_stream_chunks_match_whole_file():
+    journal = generate_journal(2000, complex_share=0.2, seed=3)
+    values, counts = np.unique(key_hashes(journal), return_counts=True)
+    complex_keys = values[counts > 1]
+
+    chunks = [complex_mask(journal.iloc[start:start + 300], complex_keys) for start in range(0, len(journal), 300)]
+    assert np.concatenate(chunks).tolist() == complex_mask(journal).tolist()
+
+
+def test_split_without_complex_rows_returns_input():
+    df = pd.DataFrame({"talon": ["1", "2"], "source": ["A", "A"]})
+    normal, complex_rows = split_complex(df, complex_mask(df))
+    assert normal is df
+    assert complex_rows.empty and list(complex_rows.columns) == list(df.columns)
@@ -0,0 +1,47 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from etl_wo.common.date_parse import dates_to_objects, parse_dates, reject_frame, summarize_rejects, write_rejects
+
+
+def test_parse_dates_matches_to_datetime():
+    series = pd.Series(["01.02.2024", "15.03.2023", "01.02.2024", None, "", "-", "31.02.2024", "x"] * 50)
+    values, rejected = parse_dates(series)
+
+    expected = pd.to_datetime(series, format="%d.%m.%Y", errors="coerce")
+    pd.testing.assert_series_equal(values, expected, check_names=False)
+    assert rejected.tolist() == [False, False, False, False, False, False, True, True] * 50
+
+
+def test_mixed_format_parses_dates_with_and_without_time():
+    values, rejected = parse_dates(pd.Series(["03.02.2024", "03.02.2024 10:15:00"]), "mixed")
+    assert values.tolist() == [pd.Timestamp("2024-02-03"), pd.Timestamp("2024-02-03 10:15")]
+    assert not rejected.any()
+
+
+def test_datetime_column_is_returned_as_is():
+    series = pd.Series(pd.to_datetime(["2024-01-01", None]))
+    values, rejected = parse_dates(series)
+    assert values is series and not rejected.any()
+
+
+def test_reject_report(tmp_path):
+    series = pd.Series(["01.02.2024", "bad", "worse"], index=[10, 11, 12])
+    _, rejected = parse_dates(series)
+    path = str(tmp_path / "rejects" / "run.csv")
+    assert write_rejects(path, [reject_frame("issue_date", series, rejected)]) == 2
+    assert write_rejects(path, [reject_frame("issue_date", series.iloc[:2], rejected[:2])]) == 1
+    assert summarize_rejects(path) == {"issue_date": 3}
+    assert pd.read_csv(path)["row"].tolist() == [11, 12, 11]
+
+
+def test_dates_to_objects():
+    df = pd.DataFrame({"day": pd.to_datetime(["2024-01-02", None]),
+                       "moment": pd.to_datetime(["2024-01-02 10:00", "2024-01-03 00:00"]),
+                       "text": ["a", "b"]})
+    result = dates_to_objects(df)
+    assert result["day"].tolist() == [datetime.date(2024, 1, 2), None]
+    assert result["moment"].tolist() == [datetime.datetime(2024, 1, 2, 10), datetime.datetime(2024, 1, 3)]
+    assert np.issubdtype(df["day"].dtype, np.datetime64)
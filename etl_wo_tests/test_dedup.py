@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from etl_wo.common.dedup import drop_duplicate_keys, parse_dedup_rule
+
+
+def batch() -> pd.DataFrame:
+    return pd.DataFrame({
+        "talon": ["1", "2", "1", "3", "1"],
+        "source": ["A", "A", "A", "A", "B"],
+        "status": ["old", "x", "new", "y", "z"],
+        "last_change_date": ["02.01.2024", "01.01.2024", "01.01.2024", "bad", "01.01.2024"],
+    })
+
+
+def test_keep_last_matches_row_by_row_upsert():
+    data, removed = drop_duplicate_keys(batch(), ["talon", "source"], "last")
+    assert removed == 1
+    assert data["status"].tolist() == ["x", "new", "y", "z"]
+
+
+def test_keep_first():
+    data, removed = drop_duplicate_keys(batch(), ["talon", "source"], "first")
+    assert removed == 1
+    assert data["status"].tolist() == ["old", "x", "y", "z"]
+
+
+def test_latest_by_date_column():
+    # 02.01.2024 (день первым) позже 01.01.2024, поэтому остаётся первая строка пары 1/A
+    data, removed = drop_duplicate_keys(batch(), ["talon", "source"], "latest:last_change_date")
+    assert removed == 1
+    assert data["status"].tolist() == ["old", "x", "y", "z"]
+
+
+def test_without_duplicates_returns_input():
+    df = batch().iloc[:2]
+    data, removed = drop_duplicate_keys(df, ["talon", "source"])
+    assert data is df and removed == 0
+
+
+@pytest.mark.parametrize("rule", ["latest", "first:status", "newest"])
+def test_unknown_rule(rule):
+    with pytest.raises(ValueError):
+        parse_dedup_rule(rule)
+
+
+def test_latest_requires_column():
+    with pytest.raises(ValueError):
+        drop_duplicate_keys(batch(), ["talon"], "latest:missing")
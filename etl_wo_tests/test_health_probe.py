@@ -0,0 +1,28 @@
+import pytest
+
+from etl_wo.common.health_probe import ActiveProbes
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def test_cancel_interrupts_running_probes():
+    active = ActiveProbes()
+    running, finished = FakeConnection(), FakeConnection()
+    active.start("load_data_talons", running)
+    active.start("load_data_emd", finished)
+    active.finish("load_data_emd")
+    assert active.cancel() == 1
+    assert running.cancelled and not finished.cancelled
+
+
+def test_probe_started_after_cancel_fails():
+    active = ActiveProbes()
+    active.cancel()
+    with pytest.raises(TimeoutError):
+        active.start("load_data_talons", FakeConnection())
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+from dagster import DagsterInstance, RunRequest, build_sensor_context
+
+from etl_wo.common.ingest_ledger import describe_file, record_ingested
+from etl_wo.common.universal_extract import universal_extract
+from etl_wo.jobs.kvazar import kvazar_job_eln
+from etl_wo.jobs.kvazar.sensor import DUPLICATE_PREFIX, create_sensor
+
+TABLE_NAME = "load_data_sick_leave_sheets"
+MAPPING = {"tables": {TABLE_NAME: {
+    "file": {"file_pattern": "eln_*", "file_format": "csv"},
+    "mapping_fields": {"Номер": "number", "Пациент": "patient"},
+    "column_check": ["number"], "encoding": "utf-8", "delimiter": ";",
+}}}
+OLD_MTIME = 1_700_000_000
+
+
+@pytest.fixture
+def eln_folder(state_dirs, tmp_path):
+    mapping_file = tmp_path / "mapping.json"
+    mapping_file.write_text(json.dumps(MAPPING, ensure_ascii=False), encoding="utf-8")
+    data_folder = tmp_path / "eln"
+    data_folder.mkdir()
+    return str(mapping_file), str(data_folder)
+
+
+def write_file(data_folder: str, name: str, rows: list, mtime: int = OLD_MTIME) -> str:
+    path = os.path.join(data_folder, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(["Номер;Пациент"] + rows) + "\n")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_extract_skips_ingested_content_unless_forced(eln_folder, context):
+    mapping_file, data_folder = eln_folder
+    loaded = write_file(data_folder, "eln_1.csv", ["1;a", "2;b"])
+    record_ingested(TABLE_NAME, describe_file(loaded), run_id="run-1", row_count=2)
+    os.rename(loaded, os.path.join(data_folder, "eln_2.csv"))
+
+    skipped = universal_extract(context, mapping_file, data_folder, TABLE_NAME, parse_cache=False)
+    assert skipped["skipped"] and skipped["data"] is None
+
+    forced = universal_extract(context, mapping_file, data_folder, TABLE_NAME, force=True, parse_cache=False)
+    assert len(forced["data"]) == 2
+
+
+def test_sensor_keeps_duplicate_file_and_skips_it(eln_folder):
+    mapping_file, data_folder = eln_folder
+    duplicate = write_file(data_folder, "eln_1.csv", ["1;a"])
+    record_ingested(TABLE_NAME, describe_file(duplicate), run_id="run-1", row_count=1)
+    write_file(data_folder, "eln_2.csv", ["2;b"])
+    sensor = create_sensor(kvazar_job_eln, "test_sensor", data_folder, TABLE_NAME, mapping_file, all_files=True)
+
+    with DagsterInstance.ephemeral() as instance:
+        context = build_sensor_context(instance=instance)
+        requests = [item for item in sensor(context) if isinstance(item, RunRequest)]
+        state = json.loads(context.cursor)
+
+        assert os.path.exists(duplicate)
+        assert state["eln_1.csv"].startswith(DUPLICATE_PREFIX)
+        assert len(requests) == 1
+        assert requests[0].run_config["ops"]["kvazar_extract"]["config"]["files"] == ["eln_2.csv"]
+
+        # Изменённый файл сверяется с журналом заново и запускается
+        write_file(data_folder, "eln_1.csv", ["1;a", "3;c"], mtime=OLD_MTIME + 1)
+        context = build_sensor_context(instance=instance, cursor=context.cursor)
+        requests = [item for item in sensor(context) if isinstance(item, RunRequest)]
+        assert len(requests) == 1
+        assert requests[0].run_config["ops"]["kvazar_extract"]["config"]["files"] == ["eln_1.csv"]
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from etl_wo.common.mapping_registry import clear_registry, load_mapping, table_plan, validate_table
+
+VALID_TABLE = {
+    "file": {"file_pattern": "eln_*", "file_format": "csv"},
+    "mapping_fields": {"Номер": "number", "Пациент": "patient"},
+    "column_check": ["number"], "encoding": "utf-8", "delimiter": ";",
+}
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    clear_registry()
+    yield
+    clear_registry()
+
+
+def write_mapping(tmp_path, tables: dict) -> str:
+    path = tmp_path / "mapping.json"
+    path.write_text(json.dumps({"tables": tables}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_validate_table_reports_each_problem():
+    config = {**VALID_TABLE, "mapping_fields": {"A": "number", "B": "number"}, "column_check": ["id"],
+              "delimiter": ";;", "engine": "polars", "pipeline": ["unknown"], "categorical": "yes"}
+    errors = " | ".join(validate_table("load_data_emd", config))
+    for fragment in ("number", "id", "разделитель", "polars", "unknown", "categorical"):
+        assert fragment in errors
+    assert validate_table("load_data_emd", VALID_TABLE) == []
+
+
+def test_compiled_plan(tmp_path):
+    plan = table_plan(write_mapping(tmp_path, {"load_data_sick_leave_sheets": VALID_TABLE}),
+                      "load_data_sick_leave_sheets")
+    assert plan["file_mask"] == "eln_*.csv"
+    assert plan["usecols"] == ["Номер", "Пациент"]
+    assert plan["conflict_columns"] == ["number"]
+    assert plan["read_options"] == {"encoding": "utf-8", "delimiter": ";", "engine": "c"}
+
+
+def test_invalid_table_does_not_block_other_tables(tmp_path, context):
+    mapping_file = write_mapping(tmp_path, {"load_data_sick_leave_sheets": VALID_TABLE,
+                                            "load_data_emd": {**VALID_TABLE, "delimiter": ";;"}})
+    assert table_plan(mapping_file, "load_data_sick_leave_sheets", context)["columns"] == ["number", "patient"]
+    assert "load_data_emd" in load_mapping(mapping_file)["errors"]
+    with pytest.raises(ValueError, match="load_data_emd"):
+        table_plan(mapping_file, "load_data_emd", context)
+    with pytest.raises(ValueError):
+        table_plan(mapping_file, "load_data_emd", required=False)
+
+
+def test_missing_table(tmp_path):
+    mapping_file = write_mapping(tmp_path, {"load_data_sick_leave_sheets": VALID_TABLE})
+    assert table_plan(mapping_file, "load_data_complex_talons", required=False) == {}
+    with pytest.raises(ValueError):
+        table_plan(mapping_file, "load_data_complex_talons")
+
+
+def test_invalid_json_fails_every_table(tmp_path):
+    path = tmp_path / "mapping.json"
+    path.write_text("{", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_mapping(str(path))
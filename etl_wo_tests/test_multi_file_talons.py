@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_wo.common.complex_talons import complex_mask, latest_file_mask
+from etl_wo.common.universal_extract import universal_extract
+
+MAPPING = {"tables": {"load_data_talons": {
+    "file": {"file_pattern": "journal_20*", "file_format": "csv"},
+    "mapping_fields": {"Талон": "talon", "Источник": "source", "Статус": "status"},
+    "column_check": ["talon", "source"], "encoding": "utf-8", "delimiter": ";",
+}}}
+
+OLD_FILE = [("1", "A", "s1"), ("2", "A", "s1"), ("3", "A", "c1"), ("3", "A", "c2")]
+NEW_FILE = [("1", "A", "s2"), ("4", "A", "s1"), ("4", "A", "c2"), ("2", "B", "s1")]
+
+
+@pytest.fixture
+def talon_folder(state_dirs, tmp_path):
+    mapping_file = tmp_path / "mapping.json"
+    mapping_file.write_text(json.dumps(MAPPING, ensure_ascii=False), encoding="utf-8")
+    data_folder = tmp_path / "talon"
+    data_folder.mkdir()
+    for number, (name, rows) in enumerate((("journal_2024_01.csv", OLD_FILE), ("journal_2024_02.csv", NEW_FILE))):
+        path = data_folder / name
+        lines = ["Талон;Источник;Статус"] + [";".join(row) for row in rows]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.utime(path, (1_700_000_000 + number, 1_700_000_000 + number))
+    return str(mapping_file), str(data_folder)
+
+
+def classify(df: pd.DataFrame) -> dict:
+    mask = complex_mask(df.rename(columns={"Талон": "talon", "Источник": "source"}))
+    return {(row[0], row[1], row[2]): bool(flag) for row, flag in zip(df.itertuples(index=False), mask)}
+
+
+def test_overlapping_files_keep_classification_of_newest_file(talon_folder, context):
+    mapping_file, data_folder = talon_folder
+    result = universal_extract(context, mapping_file, data_folder, "load_data_talons",
+                               all_files=True, parse_cache=False)
+    df = result["data"]
+    assert result["file_rows"] == [len(OLD_FILE), len(NEW_FILE)]
+    # Без отбора талон 1/A из двух выгрузок считался бы комплексным
+    assert classify(df)[("1", "A", "s1")]
+
+    keep = latest_file_mask(df, result["file_rows"], ["Талон", "Источник"])
+    merged = classify(df.take(np.flatnonzero(keep)))
+
+    # Каждая пара классифицируется так же, как в самом новом файле, где она есть
+    old_only = classify(pd.DataFrame(OLD_FILE, columns=["Талон", "Источник", "Статус"]))
+    newest = classify(pd.DataFrame(NEW_FILE, columns=["Талон", "Источник", "Статус"]))
+    expected = {**{row: flag for row, flag in old_only.items() if (row[0], row[1]) not in
+                   {(talon, source) for talon, source, _ in NEW_FILE}}, **newest}
+    assert merged == expected
+
+
+def test_latest_file_mask_keeps_rows_without_key():
+    df = pd.DataFrame({"talon": ["1", None, "1", None], "source": ["A", "A", "A", "A"]})
+    assert latest_file_mask(df, [2, 2]).tolist() == [False, True, True, True]
+
+
+def test_single_file_keeps_all_rows():
+    df = pd.DataFrame({"talon": ["1", "1", "2"], "source": ["A", "A", "A"]})
+    assert latest_file_mask(df, [3]).all()
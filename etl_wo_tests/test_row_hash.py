@@ -0,0 +1,17 @@
+import pandas as pd
+
+from etl_wo.common.row_hash import ROW_HASH_COLUMN, add_row_hash
+
+
+def test_add_row_hash_returns_new_frame():
+    df = pd.DataFrame({"number": ["1", "2"], "patient": ["a", "b"]})
+    result = add_row_hash(df)
+    assert ROW_HASH_COLUMN in result.columns
+    assert ROW_HASH_COLUMN not in df.columns
+    assert result[ROW_HASH_COLUMN].dtype == "int64"
+
+
+def test_add_row_hash_ignores_column_order_and_service_columns():
+    df = pd.DataFrame({"number": ["1", "2"], "patient": ["a", "b"]})
+    other = pd.DataFrame({"patient": ["a", "b"], "number": ["1", "2"], "updated_at": ["x", "y"]})
+    assert add_row_hash(df)[ROW_HASH_COLUMN].tolist() == add_row_hash(other)[ROW_HASH_COLUMN].tolist()
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl_wo.common.transform_pipeline import DEFAULT_PIPELINE, apply_stages, parse_stages
+from etl_wo.jobs.job1.transform import transform_frame
+
+COLUMN_MAPPING = {"Талон": "talon", "Источник": "source", "Статус": "status", "Сумма": "amount"}
+DB_COLUMNS = ["talon", "source", "status", "goal", "doctor"]
+
+
+def extract_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Талон": ["1", "2", "2", None, "3"],
+        "Источник": ["A", "A", "A", "B", "B"],
+        "Статус": ["1", None, "2", "3", None],
+        "Сумма": ["10", "20", None, "40", "50"],
+        "Лишний": ["x", "y", "z", "u", "v"],
+    })
+
+
+def legacy_transform(df: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя трансформация talon_transform2: rename, отбор столбцов маппинга, "-" в обязательных столбцах."""
+    df = df.rename(columns=COLUMN_MAPPING)
+    df = df[list(COLUMN_MAPPING.values())]
+    for col in DB_COLUMNS:
+        if col not in df.columns:
+            df[col] = "-"
+    df["is_complex"] = False
+    for _, group in df.groupby(["talon", "source"]):
+        if len(group) > 1:
+            df.loc[group.index, "is_complex"] = True
+    return df
+
+
+def test_default_pipeline_matches_legacy_transform():
+    df = extract_frame()
+    expected = legacy_transform(df.copy())
+    result = transform_frame(df, COLUMN_MAPPING, DB_COLUMNS)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_renamed_columns_share_input_data():
+    df = pd.DataFrame({"Сумма": np.arange(5, dtype="float64"), "Статус": ["a", "b", np.nan, "d", "e"]})
+    result = apply_stages(df, parse_stages(DEFAULT_PIPELINE), rename={"Сумма": "amount", "Статус": "status"},
+                          required=["amount", "status", "goal"])
+    assert np.shares_memory(result["amount"].to_numpy(), df["Сумма"].to_numpy())
+    assert result["goal"].tolist() == ["-"] * 5
+
+    # Copy-on-Write: изменение результата не меняет входной DataFrame
+    with pd.option_context("mode.copy_on_write", True):
+        result.loc[0, "amount"] = 100.0
+    assert df.loc[0, "Сумма"] == 0.0
+
+
+def test_fillna_and_drop_match_pandas():
+    df = pd.DataFrame({"number": ["1", None], "patient": ["a", "b"], "created_at": ["t", "t"],
+                       "Updated_At": ["t", "t"]})
+    filled = apply_stages(df, [{"stage": "fillna"}])
+    pd.testing.assert_frame_equal(filled, df.fillna("-"))
+    dropped = apply_stages(df, [{"stage": "drop"}])
+    assert list(dropped.columns) == ["number", "patient"]
+
+
+def test_dates_stage_keeps_missing_values_and_reports_rejects():
+    df = pd.DataFrame({"issue_date": ["01.02.2024", "", None, "31.02.2024"], "patient": [None, "a", "b", "c"]})
+    rejects = []
+    result = apply_stages(df, parse_stages([{"stage": "dates", "columns": ["issue_date"]}, "fillna"]),
+                          rejects=rejects)
+    assert result["issue_date"].tolist()[0] == pd.Timestamp("2024-02-01")
+    assert result["issue_date"].isna().tolist() == [False, True, True, True]
+    assert result["patient"].tolist() == ["-", "a", "b", "c"]
+    assert rejects[0]["value"].tolist() == ["31.02.2024"]
+
+
+@pytest.mark.parametrize("pipeline", [["unknown"], "rename", [{"stage": "dates"}], [{"stage": "fillna", "columns": 1}]])
+def test_invalid_pipeline(pipeline):
+    with pytest.raises(ValueError):
+        parse_stages(pipeline)
+
+
+def test_select_reports_missing_columns():
+    with pytest.raises(KeyError):
+        apply_stages(pd.DataFrame({"Талон": ["1"]}), parse_stages(DEFAULT_PIPELINE), rename=COLUMN_MAPPING)
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from etl_wo.common import watermark
+from etl_wo.common.watermark import incremental_mask, read_watermarks, save_watermarks, source_marks
+
+
+def journal() -> pd.DataFrame:
+    return pd.DataFrame({
+        "talon": ["1", "2", "3", "4", "4", "5", "6"],
+        "source": ["A", "A", "A", "A", "A", "B", "C"],
+        "last_change_date": ["01.02.2024", "03.02.2024 10:00:00", "02.02.2024", "01.02.2024", "05.02.2024",
+                             "01.01.2020", "bad"],
+    })
+
+
+def test_source_marks_take_latest_parsed_value_per_source():
+    assert source_marks(journal()) == {"A": "2024-02-05T00:00:00", "B": "2020-01-01T00:00:00"}
+
+
+def test_incremental_mask():
+    marks = {"A": "2024-02-02T00:00:00", "B": "2024-01-01T00:00:00"}
+    # 1 - раньше отметки; 2 - позже; 3 - равна отметке; 4 - одна строка комплексного талона изменилась;
+    # 5 - источник B раньше отметки; 6 - источника C нет в отметках и дата не распознана
+    assert incremental_mask(journal(), marks).tolist() == [False, True, True, True, True, False, True]
+
+
+def test_incremental_mask_without_marks_keeps_everything():
+    assert incremental_mask(journal(), {}).all()
+
+
+def test_incremental_mask_with_numeric_source():
+    df = pd.DataFrame({"talon": ["1", "2"], "source": [1, 2], "last_change_date": ["01.02.2024", "01.02.2024"]})
+    assert incremental_mask(df, {"1": "2024-03-01T00:00:00"}).tolist() == [False, True]
+
+
+@pytest.fixture
+def watermark_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(watermark, "WATERMARK_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_save_watermarks_only_moves_forward(watermark_dir):
+    save_watermarks("load_data_talons", "last_change_date", {"A": "2024-02-05T00:00:00"})
+    merged = save_watermarks("load_data_talons", "last_change_date",
+                             {"A": "2024-02-01T00:00:00", "B": "2024-01-01T00:00:00"}, run_id="run-2")
+    assert merged == {"A": "2024-02-05T00:00:00", "B": "2024-01-01T00:00:00"}
+    assert read_watermarks("load_data_talons")["run_id"] == "run-2"
+
+
+def test_changing_column_resets_marks(watermark_dir):
+    save_watermarks("load_data_talons", "last_change_date", {"A": "2024-02-05T00:00:00"})
+    assert save_watermarks("load_data_talons", "initial_input_date", {"B": "2024-01-01T00:00:00"}) == \
+        {"B": "2024-01-01T00:00:00"}